@@ -33,6 +33,12 @@ setup(
     packages=[
         'lightblue',
         ],
+    entry_points={
+        'console_scripts': [
+            'lightblue-export=lightblue.export:main',
+            'lightblue-import=lightblue.importer:main',
+        ],
+    },
     install_requires=INSTALL_REQUIRES,
     test_suite='nose.collector',
     tests_require=TEST_REQUIRES,
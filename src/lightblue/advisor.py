@@ -0,0 +1,238 @@
+"""
+Query index advisor.
+
+Checks whether a LightBlueQuery can use one of the indexes defined in the
+entity metadata (entityInfo.indexes). An index can be used when its first
+field is compared by equality, range or $in in every branch of the query.
+"""
+
+import logging
+import re
+import threading
+import warnings
+
+LOGGER = logging.getLogger('lightblue')
+
+WARN = 'warn'
+LOG = 'log'
+COUNT = 'count'
+
+# operators which can use an index (prefix of an index)
+INDEXABLE_OPS = frozenset([
+    '=', '$eq', '<', '$lt', '>', '$gt', '<=', '$lte', '>=', '$gte', '$in',
+])
+
+# MongoDB always has an index on _id
+DEFAULT_INDEXES = (('_id', ('_id', )), )
+
+
+class UnindexedQueryWarning(UserWarning):
+    """Query cannot use any index of the entity."""
+
+    pass
+
+
+class IndexReport(object):
+    """
+    Result of an index analysis.
+
+    Attributes:
+        entity (str): entity name
+        indexed (bool): query can use an index
+        index (str/None): name of a usable index
+        fields (list): fields compared in an indexable way
+        reason (str): explanation
+    """
+
+    def __init__(self, entity, indexed, index=None, fields=None,
+                 reason=''):
+        self.entity = entity
+        self.indexed = indexed
+        self.index = index
+        self.fields = fields or []
+        self.reason = reason
+
+    def __repr__(self):
+        return 'IndexReport(entity={!r}, indexed={!r}, index={!r})'.format(
+            self.entity, self.indexed, self.index)
+
+
+def normalize_field(field):
+    """
+    Replace array indexes in a field path by '*'.
+
+    Args:
+        field (str): dotted field path
+
+    Returns:
+        str: normalized path
+    """
+    return re.sub(r'(^|\.)\d+(?=\.|$)', r'\1*', field)
+
+
+def entity_indexes(metadata):
+    """
+    Get index definitions from entity metadata.
+
+    Args:
+        metadata (dict): response of get_schema()
+
+    Returns:
+        list: pairs (index name, tuple of field paths)
+    """
+    indexes = list(DEFAULT_INDEXES)
+    entity_info = metadata.get('entityInfo') or {}
+    for position, index in enumerate(entity_info.get('indexes') or []):
+        fields = tuple(
+            normalize_field(field['field'] if isinstance(field, dict)
+                            else field)
+            for field in index.get('fields') or []
+        )
+        if fields:
+            indexes.append((index.get('name') or 'index{}'.format(position),
+                            fields))
+    return indexes
+
+
+def _conjunction(clauses):
+    """
+    Split a conjunction into indexable fields and $or branches.
+
+    Args:
+        clauses (list): LightBlue query expressions
+
+    Returns:
+        tuple: set of indexable fields, list of $or branch lists
+    """
+    fields = set()
+    branches = []
+    for clause in clauses:
+        if '$and' in clause or '$all' in clause:
+            nested_fields, nested_branches = _conjunction(
+                clause.get('$and') or clause.get('$all'))
+            fields |= nested_fields
+            branches += nested_branches
+        elif '$or' in clause or '$any' in clause:
+            branches.append(clause.get('$or') or clause.get('$any'))
+        elif 'field' in clause and 'rfield' not in clause:
+            op = clause.get('op')
+            if op in INDEXABLE_OPS or (
+                    op is None and 'regex' in clause and
+                    clause['regex'].startswith('^')):
+                fields.add(normalize_field(clause['field']))
+        elif 'array' in clause and 'elemMatch' in clause:
+            nested_fields, _ = _conjunction([clause['elemMatch']])
+            array = normalize_field(clause['array'])
+            fields |= set(
+                '{}.*.{}'.format(array, field) for field in nested_fields)
+    return fields, branches
+
+
+def _usable_index(clauses, indexes):
+    """
+    Find index usable by a conjunction of clauses.
+
+    Args:
+        clauses (list): LightBlue query expressions
+        indexes (list): pairs (index name, fields)
+
+    Returns:
+        tuple: index name (None if no index is usable), fields
+    """
+    fields, branches = _conjunction(clauses)
+    for name, index_fields in indexes:
+        if index_fields[0] in fields:
+            return name, sorted(fields)
+    # conjunction without an indexed field is indexed
+    # only if all branches of some $or are indexed
+    for branch in branches:
+        names = [_usable_index([clause], indexes)[0] for clause in branch]
+        if names and all(names):
+            return names[0], sorted(fields)
+    return None, sorted(fields)
+
+
+def analyze(query, metadata):
+    """
+    Analyze index usage of a query.
+
+    Args:
+        query (lightblue.query.LightBlueQuery): query to analyze
+        metadata (dict): entity metadata (response of get_schema())
+
+    Returns:
+        IndexReport: analysis result
+    """
+    entity = getattr(query.interface, 'entity_name', None)
+    clauses = [{
+        'field': field,
+        'op': op,
+        'rvalue': rvalue,
+    } for field, op, rvalue in query._queries] + list(query._raw_queries)
+    if not clauses:
+        return IndexReport(entity, False, reason='query selects all items')
+    index, fields = _usable_index(clauses, entity_indexes(metadata))
+    if index is None:
+        return IndexReport(
+            entity, False, fields=fields,
+            reason='no index starts with any of fields {}'.format(fields))
+    return IndexReport(entity, True, index=index, fields=fields,
+                       reason='index {} can be used'.format(index))
+
+
+class IndexAdvisor(object):
+    """
+    Checks index usage of executed queries.
+
+    Modes:
+        - 'warn' - emit UnindexedQueryWarning (development)
+        - 'log' - log a warning
+        - 'count' - only count indexed/unindexed queries (production)
+
+    Attributes:
+        mode (str): 'warn', 'log' or 'count'
+        stats (dict): entity name -> {'indexed': int, 'unindexed': int}
+    """
+
+    def __init__(self, mode=COUNT):
+        """
+        Initialize an IndexAdvisor object.
+
+        Args:
+            mode (str): 'warn', 'log' or 'count'
+        """
+        self.mode = mode
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def check(self, query):
+        """
+        Analyze a query with the cached schema of its entity.
+
+        A failed analysis (e.g. schema cannot be fetched) is logged and
+        never breaks the query itself.
+
+        Args:
+            query (lightblue.query.LightBlueQuery): query to analyze
+
+        Returns:
+            IndexReport: analysis result, None if the analysis failed
+        """
+        try:
+            report = analyze(query, query.interface.get_cached_schema())
+        except Exception as exc:
+            LOGGER.warning('Index check of %s failed: %s',
+                           getattr(query.interface, 'entity_name', None), exc)
+            return None
+        with self._lock:
+            stats = self.stats.setdefault(
+                report.entity, {'indexed': 0, 'unindexed': 0})
+            stats['indexed' if report.indexed else 'unindexed'] += 1
+        if not report.indexed:
+            message = 'Unindexed query on {}: {}'.format(
+                report.entity, report.reason)
+            if self.mode == WARN:
+                warnings.warn(message, UnindexedQueryWarning, stacklevel=3)
+            elif self.mode == LOG:
+                LOGGER.warning(message)
+        return report
@@ -0,0 +1,252 @@
+"""
+Per-document results of bulk writes.
+
+LightBlue reports documents which were not written in dataErrors of the
+response. The results tell which of the submitted documents failed, with
+which errors, and whether the failure is transient (the document may be
+written when it is submitted again) or permanent (e.g. invalid document,
+duplicate key).
+"""
+
+from lightblue.common import canonical_json
+
+# error codes of failures which may not repeat on resubmission
+TRANSIENT_ERROR_CODES = (
+    'mongo-crud:DatabaseError',
+    'mongo-crud:ConcurrentUpdate',
+    'mongo-crud:Timeout',
+    'crud:Timeout',
+)
+
+# the whole request failed (HTTP error, undecodable response) - some of
+# its documents may have been written, so it is not transient by default
+REQUEST_FAILED_CODE = 'lightblue-client:RequestFailed'
+
+# a dataError could not be assigned to a document - any of the documents
+# without an assigned error may have been rejected
+UNKNOWN_RESULT_CODE = 'lightblue-client:UnknownResult'
+
+
+def is_transient(error, transient_codes=TRANSIENT_ERROR_CODES):
+    """
+    Error may not repeat when the document is submitted again.
+
+    Args:
+        error (dict): LightBlue error
+        transient_codes (tuple): transient error codes
+
+    Returns:
+        bool: True if the error is transient
+    """
+    return error.get('errorCode') in transient_codes
+
+
+def match_errors(documents, data_errors):
+    """
+    Assign dataErrors to submitted documents.
+
+    Errors are matched by the whole document, then by _id.
+
+    Args:
+        documents (list): submitted documents
+        data_errors (list): dataErrors of the response
+
+    Returns:
+        tuple: dict index -> list of errors, list of unmatched dataErrors
+    """
+    by_key = {}
+    by_id = {}
+    for index, document in enumerate(documents):
+        by_key.setdefault(canonical_json(document), []).append(index)
+        if isinstance(document, dict) and '_id' in document:
+            by_id.setdefault(canonical_json(document['_id']), []).append(index)
+    matched = {}
+    unmatched = []
+    for error in data_errors or []:
+        data = error.get('data')
+        indexes = by_key.get(canonical_json(data))
+        if not indexes and isinstance(data, dict) and '_id' in data:
+            indexes = by_id.get(canonical_json(data['_id']))
+        indexes = [index for index in indexes or [] if index not in matched]
+        if not indexes:
+            unmatched.append(error)
+            continue
+        matched[indexes[0]] = error.get('errors') or []
+    return matched, unmatched
+
+
+class DocumentResult(object):
+    """
+    Result of one submitted document.
+
+    Attributes:
+        index (int): position in the submitted documents
+        document (dict): submitted document
+        errors (list): LightBlue errors (empty if it was written)
+        attempts (int): count of submissions of the document
+    """
+
+    def __init__(self, index, document, errors=None, attempts=1,
+                 transient_codes=TRANSIENT_ERROR_CODES):
+        self.index = index
+        self.document = document
+        self.errors = errors or []
+        self.attempts = attempts
+        self.transient_codes = transient_codes
+
+    @property
+    def ok(self):
+        """Document was written."""
+        return not self.errors
+
+    @property
+    def transient(self):
+        """Document failed and all its errors are transient."""
+        return bool(self.errors) and all(
+            is_transient(error, self.transient_codes)
+            for error in self.errors)
+
+    def __repr__(self):
+        return 'DocumentResult({}, {})'.format(
+            self.index, 'ok' if self.ok else self.errors)
+
+
+class BulkResult(object):
+    """
+    Per-document results of a bulk write.
+
+    Attributes:
+        results (list): DocumentResult of each submitted document
+        responses (list): LightBlue responses of all submissions
+        unmatched (list): dataErrors not assigned to any document
+    """
+
+    def __init__(self, results, responses=None, unmatched=None):
+        self.results = results
+        self.responses = responses or []
+        self.unmatched = unmatched or []
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def succeeded(self):
+        """Results of written documents."""
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        """Results of documents which were not written."""
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def transient(self):
+        """Results of documents which failed transiently."""
+        return [result for result in self.results if result.transient]
+
+    @property
+    def permanent(self):
+        """Results of documents which failed permanently."""
+        return [result for result in self.results
+                if not result.ok and not result.transient]
+
+    @property
+    def status(self):
+        """
+        Overall status like LightBlue's.
+
+        Returns:
+            str: COMPLETE, PARTIAL or ERROR
+        """
+        failed = len(self.failed)
+        if not failed and not self.unmatched:
+            return 'COMPLETE'
+        return 'ERROR' if failed == len(self.results) else 'PARTIAL'
+
+    def data_errors(self):
+        """
+        Failed documents as LightBlue dataErrors.
+
+        Returns:
+            list: dataErrors entries
+        """
+        return [{'data': result.document, 'errors': result.errors}
+                for result in self.failed] + self.unmatched
+
+
+def bulk_result(documents, response, transient_codes=TRANSIENT_ERROR_CODES):
+    """
+    Build per-document results from a LightBlue response.
+
+    A missing response or an error response without dataErrors fails all
+    documents (with REQUEST_FAILED_CODE or the response errors). When some
+    dataErrors cannot be assigned to documents (e.g. the server returned
+    documents with defaulted fields), the documents without an assigned
+    error fail with UNKNOWN_RESULT_CODE - they may have been rejected.
+
+    Args:
+        documents (list): submitted documents
+        response (dict/None): LightBlue response
+        transient_codes (tuple): transient error codes
+
+    Returns:
+        BulkResult: results
+    """
+    unmatched = []
+    if response is None:
+        errors = [{'errorCode': REQUEST_FAILED_CODE,
+                   'msg': 'Request failed'}]
+        matched = dict((index, errors) for index in range(len(documents)))
+    elif response.get('status') == 'ERROR' and \
+            not response.get('dataErrors'):
+        errors = response.get('errors') or [
+            {'errorCode': REQUEST_FAILED_CODE, 'msg': 'Request failed'}]
+        matched = dict((index, errors) for index in range(len(documents)))
+    else:
+        matched, unmatched = match_errors(
+            documents, response.get('dataErrors'))
+        if unmatched:
+            errors = [{'errorCode': UNKNOWN_RESULT_CODE,
+                       'msg': '{} dataErrors not matched to documents'.format(
+                           len(unmatched))}]
+            for index in range(len(documents)):
+                matched.setdefault(index, errors)
+    return BulkResult([
+        DocumentResult(index, document, matched.get(index),
+                       transient_codes=transient_codes)
+        for index, document in enumerate(documents)
+    ], [response], unmatched)
+
+
+def group_updates(pairs):
+    """
+    Group keys sharing an identical update.
+
+    Args:
+        pairs (iterable): pairs (key, LightBlue update)
+
+    Returns:
+        list: pairs (update, list of unique keys) in order of first use
+
+    Raises:
+        ValueError: a key has different updates
+    """
+    groups = {}
+    order = []
+    updates = {}
+    for key, update in pairs:
+        update_key = canonical_json(update)
+        if canonical_json(key) in updates:
+            if updates[canonical_json(key)] != update_key:
+                raise ValueError(
+                    'Key {!r} has different updates'.format(key))
+            continue
+        updates[canonical_json(key)] = update_key
+        if update_key not in groups:
+            groups[update_key] = (update, [])
+            order.append(update_key)
+        groups[update_key][1].append(key)
+    return [groups[update_key] for update_key in order]
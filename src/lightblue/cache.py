@@ -0,0 +1,253 @@
+"""
+Persistent on-disk cache of find and get_schema responses.
+
+Entries are stored in a SQLite database, so the cache survives restarts and
+can be shared by several processes - every write is a single transaction
+and readers never see partially written entries.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from lightblue.common import PicklableConfig, canonical_json
+
+LOGGER = logging.getLogger('lightblue')
+
+DEFAULT_OPERATION_TTLS = {'get_schema': 3600}
+
+
+class DiskCache(PicklableConfig):
+    """
+    SQLite-backed cache with TTLs and size limits.
+
+    Oldest entries are evicted first when the cache is over max_entries
+    or max_bytes.
+
+    Attributes:
+        path (str): database file
+        ttl (float/None): default time to live (seconds, None - forever)
+        operation_ttls (dict): TTLs per operation, 0 disables caching
+        stats (dict): counts of hits, misses and writes of this process
+    """
+
+    def __init__(self,
+                 path,
+                 ttl=300,
+                 operation_ttls=None,
+                 max_entries=10000,
+                 max_bytes=100 * 1024 * 1024,
+                 busy_timeout=5.0):
+        """
+        Initialize a DiskCache object.
+
+        Args:
+            path (str): database file (created if it does not exist)
+            ttl (float, optional): default time to live in seconds
+            operation_ttls (dict, optional): TTLs per operation
+                ('find', 'get_schema'), get_schema is cached for an hour
+                by default
+            max_entries (int, optional): max count of entries
+            max_bytes (int, optional): max size of cached responses
+            busy_timeout (float): wait for locks held by other processes
+        """
+        self.path = path
+        self.ttl = ttl
+        self.operation_ttls = dict(DEFAULT_OPERATION_TTLS)
+        self.operation_ttls.update(operation_ttls or {})
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0}
+        self._local = threading.local()
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, entity TEXT, value TEXT, '
+                'size INTEGER, created REAL, expires REAL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_entity '
+                'ON entries (entity)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_created '
+                'ON entries (created)')
+
+    def _connection(self):
+        """
+        Connection of the current thread (new one after a fork).
+
+        Returns:
+            sqlite3.Connection: connection in autocommit mode
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None)
+            try:
+                connection.execute('PRAGMA journal_mode=WAL')
+            except sqlite3.OperationalError:
+                # file systems without shared memory support
+                pass
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _transaction(self):
+        """
+        Write transaction (locks the database for other writers).
+
+        Returns:
+            _Transaction: context manager yielding the connection
+        """
+        return _Transaction(self._connection())
+
+    def entry_ttl(self, operation):
+        """
+        Time to live of an operation's responses.
+
+        Args:
+            operation (str): operation type
+
+        Returns:
+            float/None: seconds (None - forever, 0 - not cached)
+        """
+        return self.operation_ttls.get(operation, self.ttl)
+
+    @staticmethod
+    def key(operation, entity_name, version, data=None):
+        """
+        Cache key of a request.
+
+        Args:
+            operation (str): operation type
+            entity_name (str): entity name
+            version (str/None): entity version
+            data (dict, optional): request body
+
+        Returns:
+            str: canonical JSON of the request
+        """
+        return canonical_json([operation, entity_name, version, data])
+
+    def get(self, operation, entity_name, version, data=None):
+        """
+        Get cached response.
+
+        Args:
+            operation (str): operation type
+            entity_name (str): entity name
+            version (str/None): entity version
+            data (dict, optional): request body
+
+        Returns:
+            dict: cached response, None if missing or expired
+        """
+        if self.entry_ttl(operation) == 0:
+            return None
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM entries WHERE key = ? AND '
+                '(expires IS NULL OR expires > ?)',
+                (self.key(operation, entity_name, version, data),
+                 time.time())).fetchone()
+        except sqlite3.Error:
+            LOGGER.exception('Reading cache %s failed', self.path)
+            row = None
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return json.loads(row[0])
+
+    def set(self, operation, entity_name, version, data, value):
+        """
+        Store response (and evict old entries over the limits).
+
+        Args:
+            operation (str): operation type
+            entity_name (str): entity name
+            version (str/None): entity version
+            data (dict/None): request body
+            value (dict): response to cache
+        """
+        ttl = self.entry_ttl(operation)
+        if ttl == 0:
+            return
+        encoded = json.dumps(value)
+        now = time.time()
+        try:
+            with self._transaction() as connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                    (self.key(operation, entity_name, version, data),
+                     entity_name, encoded, len(encoded), now,
+                     None if ttl is None else now + ttl))
+                self._evict(connection, now)
+        except sqlite3.Error:
+            LOGGER.exception('Writing cache %s failed', self.path)
+            return
+        self.stats['writes'] += 1
+
+    def _evict(self, connection, now):
+        """
+        Drop expired entries and oldest entries over the limits.
+
+        Args:
+            connection (sqlite3.Connection): connection in a transaction
+            now (float): current time
+        """
+        connection.execute(
+            'DELETE FROM entries WHERE expires <= ?', (now, ))
+        count, size = connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+        ).fetchone()
+        over_count = 0 if self.max_entries is None else \
+            max(count - self.max_entries, 0)
+        over_size = 0 if self.max_bytes is None else \
+            max(size - self.max_bytes, 0)
+        if not over_count and not over_size:
+            return
+        evicted = []
+        rows = connection.execute(
+            'SELECT key, size FROM entries ORDER BY created')
+        for key, entry_size in rows:
+            if len(evicted) >= over_count and over_size <= 0:
+                break
+            evicted.append((key, ))
+            over_size -= entry_size
+        connection.executemany('DELETE FROM entries WHERE key = ?', evicted)
+
+    def invalidate(self, entity_name=None):
+        """
+        Drop cached responses of an entity (or all of them).
+
+        Args:
+            entity_name (str, optional): entity name
+        """
+        try:
+            with self._transaction() as connection:
+                if entity_name is None:
+                    connection.execute('DELETE FROM entries')
+                else:
+                    connection.execute(
+                        'DELETE FROM entries WHERE entity = ?',
+                        (entity_name, ))
+        except sqlite3.Error:
+            LOGGER.exception('Invalidating cache %s failed', self.path)
+
+
+class _Transaction(object):
+    """Immediate transaction - commit on success, rollback otherwise."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, *args):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
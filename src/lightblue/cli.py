@@ -0,0 +1,38 @@
+"""Helpers of the command line tools."""
+
+from lightblue.entity import LightBlueEntity
+from lightblue.service import LightBlueService
+
+
+def add_service_arguments(parser):
+    """
+    Add LightBlue connection options to a command line parser.
+
+    Args:
+        parser (argparse.ArgumentParser): parser
+    """
+    parser.add_argument('--data-url', required=True,
+                        help='LightBlue data API url')
+    parser.add_argument('--metadata-url', required=True,
+                        help='LightBlue metadata API url')
+    parser.add_argument('--cert', help='client certificate')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='do not verify server certificate')
+    parser.add_argument('--entity', required=True, help='entity name')
+    parser.add_argument('--version', help='entity version')
+
+
+def entity_from_arguments(args):
+    """
+    Create entity from parsed connection options.
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        lightblue.entity.LightBlueEntity: entity
+    """
+    service = LightBlueService(
+        args.data_url, args.metadata_url,
+        ssl_certificate=args.cert, ssl_verify=not args.no_verify)
+    return LightBlueEntity(service, args.entity, args.version)
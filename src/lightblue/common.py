@@ -1,10 +1,204 @@
+import json
+import threading
+
+from contextlib import contextmanager
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2.7
+    from time import time as monotonic
+
 import requests
 
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
+from lightblue.validation import INTEGER_TYPES, STRING_TYPES
+
+_LOCAL = threading.local()
+
+
+def _rebuild(cls, args, kwargs):
+    """
+    Create an object from pickled constructor arguments.
+
+    Args:
+        cls (type): class of the object
+        args (tuple): positional constructor arguments
+        kwargs (dict): keyword constructor arguments
+
+    Returns:
+        object: new object
+    """
+    return cls(*args, **kwargs)
+
+
+class PicklableConfig(object):
+    """
+    Objects pickled as their constructor arguments
+
+    Runtime state (locks, threads, connections, statistics) is not
+    pickled, unpickled copy starts fresh - e.g. in a process-pool worker.
+    """
+    def __new__(cls, *args, **kwargs):
+        instance = super(PicklableConfig, cls).__new__(cls)
+        instance._init_args = (args, kwargs)
+        return instance
+
+    def __reduce__(self):
+        args, kwargs = self._init_args
+        return _rebuild, (self.__class__, args, kwargs)
+
+
+def canonical_json(value):
+    """
+    Canonical JSON of a value (to compare and match documents, queries
+    and values)
+
+    Args:
+        value (object): json value
+
+    Returns:
+        str: JSON with sorted keys
+    """
+    return json.dumps(value, sort_keys=True)
+
+
+def value_kind(value):
+    """
+    Type category of a JSON value (LightBlue coerces values compared with
+    a field to the field type, so only values of one category can be
+    compared reliably on the client)
+
+    Args:
+        value (object): json value
+
+    Returns:
+        str: bool, number, string or other
+    """
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, INTEGER_TYPES + (float, )):
+        return 'number'
+    if isinstance(value, STRING_TYPES):
+        return 'string'
+    return 'other'
+
+
+class DeadlineExceeded(Exception):
+    """Time budget of a call was spent before it finished."""
+
+    pass
+
+
+class Deadline(object):
+    """
+    End-to-end time budget shared by all requests of a call
+
+    Attributes:
+        expires_at (float): monotonic time of the deadline
+    """
+    def __init__(self, seconds):
+        self.expires_at = monotonic() + seconds
+
+    def remaining(self):
+        """
+        Seconds left before the deadline
+        Returns:
+            float - remaining seconds (0 if expired)
+        """
+        return max(self.expires_at - monotonic(), 0.0)
+
+    @property
+    def expired(self):
+        """
+        Deadline has passed
+        Returns:
+            bool - True if no time is left
+        """
+        return monotonic() >= self.expires_at
+
+    def check(self):
+        """
+        Fail fast once the budget is spent
+        Raises:
+            DeadlineExceeded: deadline has passed
+        """
+        if self.expired:
+            raise DeadlineExceeded('Deadline exceeded')
+
+
+def current_deadline():
+    """
+    Deadline active in the current thread
+    Returns:
+        Deadline object or None
+    """
+    return getattr(_LOCAL, 'deadline', None)
+
+
+@contextmanager
+def activate_deadline(active):
+    """
+    Make given deadline active in the current thread
+    (used to share a deadline with worker threads)
+
+    Args:
+        active (Deadline/None): deadline to activate
+    """
+    previous = current_deadline()
+    _LOCAL.deadline = active
+    try:
+        yield active
+    finally:
+        _LOCAL.deadline = previous
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Set end-to-end deadline for all requests made inside the block.
+    Nested deadlines can only shorten the outer one.
+
+    Args:
+        seconds (float/None): time budget (None - keep current deadline)
+    """
+    active = current_deadline()
+    if seconds is not None:
+        new = Deadline(seconds)
+        if active is None or new.expires_at < active.expires_at:
+            active = new
+    with activate_deadline(active):
+        yield active
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry configuration which stops retrying once the active deadline
+    has passed and never sleeps past it
+    """
+    def increment(self, *args, **kwargs):
+        active = current_deadline()
+        if active is not None:
+            active.check()
+        return super(DeadlineRetry, self).increment(*args, **kwargs)
+
+    def get_backoff_time(self):
+        backoff = super(DeadlineRetry, self).get_backoff_time()
+        active = current_deadline()
+        if active is not None:
+            backoff = min(backoff, active.remaining())
+        return backoff
+
+    def get_retry_after(self, response):
+        retry_after = super(DeadlineRetry, self).get_retry_after(response)
+        active = current_deadline()
+        if retry_after is not None and active is not None:
+            retry_after = min(retry_after, active.remaining())
+        return retry_after
+
 
-def retry_session(session=None):
+def retry_session(session=None, status_forcelist=(500, 502, 504), read=5):
     """
     Retry session in case it failed
     More info: https://github.com/mikem23/keepalive-race
@@ -12,17 +206,21 @@ def retry_session(session=None):
     Args:
         session (object): already created session - in case it is missing new
         session is created
+        status_forcelist (tuple): HTTP statuses retried by the session
+        (empty when retries are handled by a service RetryPolicy)
+        read (int): retries of read errors (0 when retries are handled by
+        a service RetryPolicy - the request may have reached the server)
     Returns:
         session object with retry settings
     """
     if not session:
         session = requests.Session()
-    retry = Retry(
+    retry = DeadlineRetry(
         total=5,
-        read=5,
+        read=read,
         connect=5,
         backoff_factor=0.3,
-        status_forcelist=(500, 502, 504),
+        status_forcelist=status_forcelist,
     )
     adapter = HTTPAdapter(max_retries=retry)
     session.mount('http://', adapter)
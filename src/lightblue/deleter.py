@@ -0,0 +1,204 @@
+"""
+Chunked, resumable mass delete.
+
+Instead of one delete request for all matching documents (which can time
+out on the server and leave the entity partly deleted), _ids of matching
+documents are read by keyset pages and deleted in chunks of at most
+chunk_size documents, with a bounded number of delete requests in flight.
+The checkpoint holds the last _id up to which all chunks were deleted, so
+an interrupted delete resumes after it.
+"""
+
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from lightblue.sync import MemoryWatermarkStore
+
+LOGGER = logging.getLogger('lightblue')
+
+ID_PROJECTION = {'field': '_id', 'include': True}
+
+
+class MassDeleteError(Exception):
+    """Find or delete request of a mass delete failed (can be resumed)."""
+
+    pass
+
+
+class MassDelete(object):
+    """
+    Deletes documents matching a query in chunks of _ids.
+
+    Attributes:
+        entity (lightblue.entity.LightBlueEntity): entity
+        query (dict): LightBlue query of deleted documents
+        checkpoint (object): store of the progress (load()/save(state))
+        state (dict): query, last (_id), deleted, chunks, total, done
+    """
+
+    def __init__(self,
+                 entity,
+                 query,
+                 chunk_size=500,
+                 workers=4,
+                 checkpoint=None,
+                 progress=None):
+        """
+        Initialize a MassDelete object.
+
+        Args:
+            entity (lightblue.entity.LightBlueEntity): entity
+            query (dict): LightBlue query of deleted documents
+            chunk_size (int): max documents per delete request
+            workers (int): max delete requests in flight
+            checkpoint (object, optional): progress store
+                (FileWatermarkStore to resume later)
+            progress (Callable, optional): called with the state after
+                every deleted chunk
+
+        Raises:
+            MassDeleteError: checkpoint is for another query
+        """
+        self.entity = entity
+        self.query = query
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.checkpoint = checkpoint or MemoryWatermarkStore()
+        self.progress = progress
+        state = self.checkpoint.load()
+        if state is not None and not state['done'] and \
+           state['query'] != query:
+            raise MassDeleteError('Checkpoint is for another query')
+        if state is None or state['done']:
+            state = {'query': query, 'last': None, 'deleted': 0,
+                     'chunks': 0, 'total': None, 'done': False}
+        self.state = state
+        self._submitted = deque()
+        self._completed = set()
+        self._lock = threading.Lock()
+
+    def _fetch(self, last):
+        """
+        Read the next page of _ids.
+
+        Args:
+            last (object): last read _id (None for the first page)
+
+        Returns:
+            tuple: list of _ids, count of all remaining matching documents
+
+        Raises:
+            MassDeleteError: find request failed
+        """
+        query = self.query if last is None else {'$and': [
+            self.query, {'field': '_id', 'op': '>', 'rvalue': last}]}
+        response = self.entity.find_item(
+            query, projection=ID_PROJECTION, max_results=self.chunk_size,
+            sort={'_id': '$asc'})
+        if not self.entity.check_response(response):
+            raise MassDeleteError('Reading _ids after {} failed'.format(last))
+        return ([document['_id'] for document in
+                 response.get('processed') or []],
+                response.get('matchCount'))
+
+    def _delete(self, ids):
+        """
+        Delete one chunk.
+
+        Args:
+            ids (list): _ids of the chunk
+
+        Returns:
+            tuple: _ids, LightBlue response
+        """
+        return ids, self.entity.delete_item({'$and': [
+            self.query, {'field': '_id', 'op': '$in', 'values': ids}]})
+
+    def _acknowledge(self, ids, response):
+        """
+        Record a deleted chunk and save the contiguous last _id.
+
+        Args:
+            ids (list): _ids of the chunk
+            response (dict): LightBlue response
+        """
+        with self._lock:
+            self.state['deleted'] += response.get('modifiedCount', len(ids))
+            self.state['chunks'] += 1
+            self._completed.add(ids[-1])
+            while self._submitted and self._submitted[0] in self._completed:
+                self.state['last'] = self._submitted.popleft()
+                self._completed.discard(self.state['last'])
+            self.checkpoint.save(dict(self.state))
+            state = dict(self.state)
+        LOGGER.info('Deleted %s of %s documents', state['deleted'],
+                    state['total'] if state['total'] is not None else '?')
+        if self.progress is not None:
+            self.progress(state)
+
+    def run(self):
+        """
+        Delete all matching documents (after the checkpointed _id).
+
+        Returns:
+            dict: LightBlue-like response (status, matchCount,
+                modifiedCount)
+
+        Raises:
+            MassDeleteError: a find or delete request failed
+        """
+        failed = []
+        in_flight = set()
+
+        def collect(futures):
+            for future in futures:
+                try:
+                    ids, response = future.result()
+                except Exception as exc:
+                    failed.append(exc)
+                    continue
+                if not self.entity.check_response(response):
+                    failed.append(MassDeleteError(
+                        'Delete of _ids {}-{} failed'.format(
+                            ids[0], ids[-1])))
+                else:
+                    self._acknowledge(ids, response)
+
+        last = self.state['last']
+        with ThreadPoolExecutor(self.workers) as executor:
+            while not failed:
+                try:
+                    ids, remaining = self._fetch(last)
+                except MassDeleteError as exc:
+                    failed.append(exc)
+                    break
+                if self.state['total'] is None and remaining is not None:
+                    self.state['total'] = self.state['deleted'] + remaining
+                if not ids:
+                    break
+                while len(in_flight) >= self.workers:
+                    done, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if failed:
+                    break
+                with self._lock:
+                    self._submitted.append(ids[-1])
+                in_flight.add(executor.submit(self._delete, ids))
+                last = ids[-1]
+                if len(ids) < self.chunk_size:
+                    break
+            collect(wait(in_flight)[0])
+        if failed:
+            raise MassDeleteError('{} (deleted up to _id {})'.format(
+                failed[0], self.state['last']))
+        self.state['done'] = True
+        self.checkpoint.save(dict(self.state))
+        return {
+            'status': 'COMPLETE',
+            'matchCount': self.state['deleted'],
+            'modifiedCount': self.state['deleted'],
+        }
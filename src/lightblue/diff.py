@@ -0,0 +1,108 @@
+"""
+Minimal LightBlue updates computed from two versions of a document.
+
+Paths use the dotted notation with array indexes (e.g. 'field.3.name'),
+the same as fields passed to LightBlueGenericSelection.unset_fields().
+"""
+
+
+def _path(prefix, key):
+    """
+    Join a dotted path.
+
+    Args:
+        prefix (str): parent path ('' for the document)
+        key (str/int): field name or array index
+
+    Returns:
+        str: dotted path
+    """
+    return '{}.{}'.format(prefix, key) if prefix else str(key)
+
+
+def _diff_object(original, modified, prefix, update):
+    """
+    Compare two objects (dicts).
+
+    Args:
+        original (dict): previous version
+        modified (dict): new version
+        prefix (str): path of the objects
+        update (dict): update to extend
+    """
+    for key, value in modified.items():
+        if key not in original:
+            update['$set'][_path(prefix, key)] = value
+        else:
+            _diff_value(original[key], value, _path(prefix, key), update)
+    for key in original:
+        if key not in modified:
+            update['$unset'].append(_path(prefix, key))
+
+
+def _diff_array(original, modified, prefix, update):
+    """
+    Compare two arrays.
+
+    Items are compared by position. Items added to the end are appended,
+    items removed from the end are unset (from the last one), other
+    changes of the length replace the whole array.
+
+    Args:
+        original (list): previous version
+        modified (list): new version
+        prefix (str): path of the arrays
+        update (dict): update to extend
+    """
+    common = min(len(original), len(modified))
+    if len(original) != len(modified) and \
+       original[:common] != modified[:common]:
+        update['$set'][prefix] = modified
+        return
+    for index in range(common):
+        _diff_value(original[index], modified[index],
+                    _path(prefix, index), update)
+    if len(modified) > common:
+        update['$append'][prefix] = modified[common:]
+    for index in reversed(range(common, len(original))):
+        update['$unset'].append(_path(prefix, index))
+
+
+def _diff_value(original, modified, prefix, update):
+    """
+    Compare two values of a field.
+
+    Args:
+        original (object): previous version
+        modified (object): new version
+        prefix (str): path of the field
+        update (dict): update to extend
+    """
+    if isinstance(original, dict) and isinstance(modified, dict):
+        _diff_object(original, modified, prefix, update)
+    elif isinstance(original, list) and isinstance(modified, list):
+        _diff_array(original, modified, prefix, update)
+    elif original != modified or type(original) is not type(modified):
+        update['$set'][prefix] = modified
+
+
+def diff(original, modified):
+    """
+    Compute minimal update turning a document into its modified version.
+
+    Args:
+        original (dict): document as fetched from LightBlue
+        modified (dict): modified document
+
+    Returns:
+        dict: LightBlue update with $set/$unset/$append parts
+            (empty dict if documents are equal)
+
+    Raises:
+        TypeError: documents are not objects
+    """
+    if not isinstance(original, dict) or not isinstance(modified, dict):
+        raise TypeError('Documents have to be dicts')
+    update = {'$set': {}, '$unset': [], '$append': {}}
+    _diff_object(original, modified, '', update)
+    return dict((key, value) for key, value in update.items() if value)
@@ -0,0 +1,255 @@
+"""
+Client-side load balancing over several Lightblue front-ends.
+
+EndpointPool picks an endpoint for each request (round-robin or least
+outstanding requests), ejects endpoints which return 5xx or time out and
+can probe them periodically on a background thread.
+"""
+
+import itertools
+import logging
+import threading
+
+from lightblue.common import monotonic
+
+LOGGER = logging.getLogger('lightblue')
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+
+class Endpoint(object):
+    """
+    One Lightblue front-end
+
+    Attributes:
+        data_url (str): lightblue data API url
+        metadata_url (str): lightblue metadata API url
+        outstanding (int): requests in flight
+        failures (int): consecutive failures
+        ejected_until (float/None): monotonic time of ejection end
+    """
+    def __init__(self, data_url, metadata_url):
+        self.data_url = data_url.rstrip('/')
+        self.metadata_url = metadata_url.rstrip('/')
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = None
+
+    def __repr__(self):
+        return 'Endpoint({!r}, {!r})'.format(self.data_url, self.metadata_url)
+
+    def url(self, api):
+        """
+        Get base url of an API
+        Args:
+            api (str): 'data' or 'metadata'
+
+        Returns:
+            - str - base url
+
+        """
+        return self.data_url if api == 'data' else self.metadata_url
+
+    def is_ejected(self, now):
+        """
+        Endpoint is ejected from the pool
+        Args:
+            now (float): monotonic time
+
+        Returns:
+            - bool - True if ejected
+
+        """
+        return self.ejected_until is not None and now < self.ejected_until
+
+
+class EndpointPool(object):
+    """
+    Pool of endpoints with passive ejection and health probes
+
+    Attributes:
+        endpoints (list): Endpoint objects
+        strategy (str): 'round_robin' or 'least_outstanding'
+        max_failures (int): consecutive failures before ejection
+        ejection_time (float): seconds an endpoint stays ejected
+    """
+    def __init__(self,
+                 endpoints,
+                 strategy=ROUND_ROBIN,
+                 max_failures=3,
+                 ejection_time=30,
+                 health_check_path='',
+                 health_check_timeout=5):
+        """
+        Args:
+            endpoints (list): Endpoint objects
+            strategy (str): 'round_robin' or 'least_outstanding'
+            max_failures (int): consecutive failures before ejection
+            ejection_time (float): seconds an endpoint stays ejected
+            health_check_path (str): path probed on the metadata API
+            health_check_timeout (float): timeout of a health probe
+        """
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        if strategy not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise ValueError("Unknown strategy: {}".format(strategy))
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.health_check_path = health_check_path
+        self.health_check_timeout = health_check_timeout
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def after_fork(self):
+        """
+        Replace the lock inherited from the parent process and drop its
+        outstanding requests and health probe thread
+        """
+        self._lock = threading.Lock()
+        self._stop = None
+        for endpoint in self.endpoints:
+            endpoint.outstanding = 0
+
+    @classmethod
+    def from_urls(cls, data_urls, metadata_urls, **kwargs):
+        """
+        Create pool from url lists (paired by index)
+        Args:
+            data_urls (str/list): lightblue data API urls
+            metadata_urls (str/list): lightblue metadata API urls
+            **kwargs: EndpointPool options
+
+        Returns:
+            - EndpointPool object
+
+        """
+        if not isinstance(data_urls, (list, tuple)):
+            data_urls = [data_urls]
+        if not isinstance(metadata_urls, (list, tuple)):
+            metadata_urls = [metadata_urls]
+        if len(data_urls) != len(metadata_urls):
+            raise ValueError("Count of data and metadata urls differs")
+        return cls(
+            [Endpoint(data, metadata)
+             for data, metadata in zip(data_urls, metadata_urls)],
+            **kwargs
+        )
+
+    def acquire(self):
+        """
+        Pick an endpoint for a request and count it as outstanding.
+        If all endpoints are ejected, all of them are used.
+
+        Returns:
+            - Endpoint object
+
+        """
+        with self._lock:
+            now = monotonic()
+            candidates = [endpoint for endpoint in self.endpoints
+                          if not endpoint.is_ejected(now)]
+            if not candidates:
+                candidates = self.endpoints
+            offset = next(self._counter)
+            candidates = [candidates[(offset + index) % len(candidates)]
+                          for index in range(len(candidates))]
+            if self.strategy == LEAST_OUTSTANDING:
+                endpoint = min(candidates, key=lambda e: e.outstanding)
+            else:
+                endpoint = candidates[0]
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, healthy):
+        """
+        Finish a request and record its outcome.
+
+        Args:
+            endpoint (Endpoint): endpoint returned by acquire()
+            healthy (bool/None): False for 5xx responses and errors,
+                None if the request was not sent
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+        if healthy:
+            self.mark_healthy(endpoint)
+        elif healthy is not None:
+            self.mark_failed(endpoint)
+
+    def mark_healthy(self, endpoint):
+        """
+        Reset failures of an endpoint and return it to the pool.
+
+        Args:
+            endpoint (Endpoint): endpoint
+        """
+        with self._lock:
+            if endpoint.ejected_until is not None:
+                LOGGER.info("Endpoint %s is healthy again", endpoint.data_url)
+            endpoint.failures = 0
+            endpoint.ejected_until = None
+
+    def mark_failed(self, endpoint):
+        """
+        Count a failure, eject endpoint after max_failures in a row.
+
+        Args:
+            endpoint (Endpoint): endpoint
+        """
+        with self._lock:
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                if not endpoint.is_ejected(monotonic()):
+                    LOGGER.warning("Ejecting endpoint %s for %ss",
+                                   endpoint.data_url, self.ejection_time)
+                endpoint.ejected_until = monotonic() + self.ejection_time
+
+    def probe(self, session):
+        """
+        Probe all endpoints and update their health.
+
+        Args:
+            session (object): session used for probes
+        """
+        for endpoint in self.endpoints:
+            url = endpoint.metadata_url + self.health_check_path
+            try:
+                response = session.get(url, timeout=self.health_check_timeout)
+                healthy = response.status_code < 500
+                response.close()
+            except Exception as exc:
+                LOGGER.debug("Health probe of %s failed - %s", url, exc)
+                healthy = False
+            if healthy:
+                self.mark_healthy(endpoint)
+            else:
+                self.mark_failed(endpoint)
+
+    def start_health_checks(self, session, interval):
+        """
+        Probe endpoints periodically on a background thread.
+
+        Args:
+            session (object): session used for probes
+            interval (float): seconds between probes
+        """
+        self.stop_health_checks()
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.probe(session)
+
+        thread = threading.Thread(target=run, name='lightblue-health-check')
+        thread.daemon = True
+        thread.start()
+
+    def stop_health_checks(self):
+        """Stop background health probes."""
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
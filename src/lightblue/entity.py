@@ -1,4 +1,17 @@
 import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from lightblue.bulk import REQUEST_FAILED_CODE, TRANSIENT_ERROR_CODES, \
+    BulkResult, DocumentResult, bulk_result, group_updates
+from lightblue.common import activate_deadline, current_deadline, deadline
+from lightblue.deleter import MassDelete
+from lightblue.replica import LocalReplica
+from lightblue.sync import FileWatermarkStore, IncrementalSync
+from lightblue.validation import DocumentValidationError, SchemaValidator, \
+    data_errors
+from lightblue.writer import BufferedWriter
 
 LOGGER = logging.getLogger('lightblue')
 
@@ -20,6 +33,11 @@ class LightBlueEntity(object):
         self.service = lightblue_service
         self.entity_name = entity_name
         self.version = version
+        # schemas and compiled schema validators per entity version
+        self._schemas = {}
+        self._validators = {}
+        # lightblue.advisor.IndexAdvisor checking executed queries
+        self.index_advisor = None
 
     @staticmethod
     def check_response(response):
@@ -60,11 +78,164 @@ class LightBlueEntity(object):
         else:
             return self.service.get_schema(self.entity_name, version)
 
-    def insert_data(self, data):
+    def get_cached_schema(self, version=None):
+        """
+        Get schema for generic entity, fetched once per version
+        Args:
+            version (str): entity version (if missing, default is used)
+
+        Returns:
+            - dict - json schema for entity
+
+        """
+        version = version or self.version
+        if version not in self._schemas:
+            self._schemas[version] = self.get_schema(version)
+        return self._schemas[version]
+
+    def get_validator(self, version=None):
+        """
+        Get validator compiled from the entity schema (once per version)
+        Args:
+            version (str): entity version (if missing, default is used)
+
+        Returns:
+            - SchemaValidator object
+
+        """
+        version = version or self.version
+        if version not in self._validators:
+            self._validators[version] = SchemaValidator(
+                self.get_cached_schema(version))
+        return self._validators[version]
+
+    def validate(self, data):
+        """
+        Validate documents against the entity schema
+        Args:
+            data (dict/list): json objects for entity
+
+        Returns:
+            - tuple - list of valid documents,
+                      list of pairs (document, error messages)
+
+        """
+        documents = data if isinstance(data, list) else [data]
+        return self.get_validator().split(documents)
+
+    def insert_data(self, data, validate=False, return_errors=False):
         """
         Insert data to generic entity (default projection is used)
         Args:
             data (dict/list): json objects for entity
+            validate (bool/str): validate documents against the entity
+                schema before sending them
+                 - True - raise DocumentValidationError if any is invalid
+                 - 'split' - send only valid documents, invalid ones are
+                   added to dataErrors of the response
+            return_errors (bool): return ERROR responses (e.g. all
+                documents rejected, see dataErrors) instead of None
+
+        Returns:
+            - dict - lightblue response
+
+        Raises:
+            DocumentValidationError: invalid documents (validate=True)
+
+        """
+        invalid = []
+        if validate:
+            data, invalid = self.validate(data)
+            if invalid and validate != 'split':
+                raise DocumentValidationError(invalid)
+            if invalid:
+                LOGGER.warning('%s invalid document(s) were not sent',
+                               len(invalid))
+            if not data:
+                return {
+                    'status': 'ERROR',
+                    'matchCount': 0,
+                    'modifiedCount': 0,
+                    'dataErrors': data_errors(invalid),
+                }
+        response = self._insert(data, return_errors)
+        if invalid and response is not None:
+            response['dataErrors'] = (response.get('dataErrors') or []) + \
+                data_errors(invalid)
+            if response.get('status') == 'COMPLETE':
+                response['status'] = 'PARTIAL'
+        return response
+
+    def bulk_insert(self, data, retries=0, backoff=0.5, validate=False,
+                    transient_codes=TRANSIENT_ERROR_CODES,
+                    resubmit_failed_requests=False):
+        """
+        Insert documents and report the result of each of them. Documents
+        which failed transiently are resubmitted without the others.
+        Args:
+            data (dict/list): json objects for entity
+            retries (int): resubmissions of transiently failed documents
+            backoff (float): wait before the first resubmission (seconds),
+                doubled for every next one
+            validate (bool): validate documents against the entity schema,
+                invalid ones fail permanently without being sent
+            transient_codes (tuple): error codes of transient failures
+            resubmit_failed_requests (bool): resubmit documents of requests
+                which failed as a whole (HTTP error, timeout) - some of
+                them may have been written already, so they can be
+                duplicated
+
+        Returns:
+            - lightblue.bulk.BulkResult - per-document results
+
+        """
+        if resubmit_failed_requests:
+            transient_codes = tuple(transient_codes) + (REQUEST_FAILED_CODE, )
+        documents = data if isinstance(data, list) else [data]
+        results = [
+            DocumentResult(index, document, attempts=0,
+                           transient_codes=transient_codes)
+            for index, document in enumerate(documents)
+        ]
+        pending = list(range(len(documents)))
+        if validate:
+            invalid = dict((id(document), messages) for document, messages
+                           in self.validate(documents)[1])
+            for index in pending:
+                if id(documents[index]) in invalid:
+                    results[index].errors = data_errors([(
+                        documents[index],
+                        invalid[id(documents[index])])])[0]['errors']
+            pending = [index for index in pending if results[index].ok]
+        responses = []
+        unmatched = []
+        attempt = 0
+        while pending:
+            batch = [documents[index] for index in pending]
+            result = bulk_result(
+                batch, self._insert(batch, return_errors=True),
+                transient_codes)
+            responses.extend(result.responses)
+            unmatched.extend(result.unmatched)
+            for index, document_result in zip(pending, result):
+                results[index].errors = document_result.errors
+                results[index].attempts += 1
+            pending = [index for index in pending if results[index].transient]
+            if not pending or attempt >= retries:
+                break
+            delay = backoff * 2 ** attempt
+            LOGGER.warning('Resubmitting %s transiently failed document(s) '
+                           'in %ss', len(pending), delay)
+            time.sleep(delay)
+            attempt += 1
+        return BulkResult(results, responses, unmatched)
+
+    def _insert(self, data, return_errors=False):
+        """
+        Send insert request
+        Args:
+            data (dict/list): json objects for entity
+            return_errors (bool): return ERROR responses instead of None
 
         Returns:
             - dict - lightblue response
@@ -82,39 +253,144 @@ class LightBlueEntity(object):
         }
         if self.version is not None:
             lightblue_data['version'] = self.version
+        if return_errors:
+            return self.service.insert_data(
+                self.entity_name, self.version, lightblue_data,
+                return_errors=True)
         return self.service.insert_data(self.entity_name, self.version,
                                         lightblue_data)
 
-    def delete_all(self):
+    def save(self, data, upsert=False):
         """
-        Delete all data for generic entity
+        Save (replace) documents of generic entity, matched by identity
+        fields (default projection is used)
+        Args:
+            data (dict/list): json objects for entity
+            upsert (bool): insert documents which do not exist yet
+
         Returns:
             - dict - lightblue response
 
         """
         lightblue_data = {
             'objectType': self.entity_name,
-            'query': {
-                'field': 'objectType',
-                'op': '=',
-                'rvalue': self.entity_name
+            'data': data,
+            'upsert': upsert,
+            'projection': {
+                'field': '*',
+                'include': True,
+                'recursive': True
+
             }
         }
         if self.version is not None:
             lightblue_data['version'] = self.version
-        return self.service.delete_data(self.entity_name, self.version,
-                                        lightblue_data)
+        return self.service.save_data(self.entity_name, self.version,
+                                      lightblue_data)
+
+    def upsert(self, data):
+        """
+        Save documents, insert those which do not exist yet
+        (single round trip instead of find + insert/update)
+        Args:
+            data (dict/list): json objects for entity
+
+        Returns:
+            - dict - lightblue response
+
+        """
+        return self.save(data, upsert=True)
+
+    def buffered_writer(self, **kwargs):
+        """
+        Create write-behind buffer for inserts and $set updates
+        Args:
+            **kwargs: BufferedWriter options (max_items, max_bytes,
+                      max_delay, max_pending, block, timeout)
+
+        Returns:
+            - BufferedWriter object (close it when done)
+
+        """
+        return BufferedWriter(self, **kwargs)
+
+    def local_replica(self, indexes, **kwargs):
+        """
+        Create local SQLite read replica of the entity
+        Args:
+            indexes (list): fields to index (dotted paths)
+            **kwargs: LocalReplica options (path, page_size,
+                      refresh_interval)
+
+        Returns:
+            - LocalReplica object (call refresh() to load it)
+
+        """
+        return LocalReplica(self, indexes, **kwargs)
+
+    def incremental_sync(self, handler, **kwargs):
+        """
+        Create watermark-based sync of changed documents
+        Args:
+            handler (Callable): called with each changed document
+            **kwargs: IncrementalSync options (timestamp_field, store,
+                      page_size, projection, min_interval, max_interval,
+                      backoff)
+
+        Returns:
+            - IncrementalSync object (call poll() or start())
+
+        """
+        return IncrementalSync(self, handler, **kwargs)
 
-    def delete_item(self, query):
+    def delete_all(self, chunk_size=None, **kwargs):
+        """
+        Delete all data for generic entity
+        Args:
+            chunk_size (int, optional): delete in chunks of this many
+                documents (see delete_item)
+            **kwargs: mass delete options (see delete_item)
+
+        Returns:
+            - dict - lightblue response
+
+        Raises:
+            MassDeleteError: a chunk failed (chunk_size is set)
+
+        """
+        return self.delete_item({
+            'field': 'objectType',
+            'op': '=',
+            'rvalue': self.entity_name
+        }, chunk_size, **kwargs)
+
+    def delete_item(self, query, chunk_size=None, workers=4,
+                    checkpoint=None, progress=None):
         """
         Delete specific object according to query
         Args:
             query (dict): query for delete
+            chunk_size (int, optional): delete in chunks of this many
+                documents selected by _id, instead of a single request
+            workers (int): max delete requests in flight (chunk_size)
+            checkpoint (str, optional): progress file to resume an
+                interrupted delete (chunk_size)
+            progress (Callable, optional): called with the state after
+                every deleted chunk (chunk_size)
 
         Returns:
             - dict - lightblue response
 
+        Raises:
+            MassDeleteError: a chunk failed (chunk_size is set)
+
         """
+        if chunk_size is not None:
+            return MassDelete(
+                self, query, chunk_size, workers,
+                checkpoint=None if checkpoint is None
+                else FileWatermarkStore(checkpoint),
+                progress=progress).run()
         lightblue_data = {
             'objectType': self.entity_name,
             'query': query
@@ -124,17 +400,26 @@ class LightBlueEntity(object):
         return self.service.delete_data(self.entity_name, self.version,
                                         lightblue_data)
 
-    def update_item(self, query, update):
+    def update_item(self, query, update, validate=False):
         """
         Update specific object according to query and update field
         Args:
             query (dict): query for searching data
             update (dict): update field (new values for given fields)
+            validate (bool): validate update against the entity schema
+                before sending it
 
         Returns:
             - dict - lightblue response
 
+        Raises:
+            DocumentValidationError: invalid update (validate=True)
+
         """
+        if validate:
+            errors = self.get_validator().validate_update(update)
+            if errors:
+                raise DocumentValidationError([(update, errors)])
         lightblue_data = {
             'objectType': self.entity_name,
             'query': query,
@@ -145,7 +430,76 @@ class LightBlueEntity(object):
         return self.service.update_data(self.entity_name, self.version,
                                         lightblue_data)
 
-    def find_item(self, query, projection=None, from_=None, max_results=None):
+    def update_many(self, pairs, key_field='_id', chunk_size=500, workers=4,
+                    query=None, validate=False):
+        """
+        Apply per-document updates grouped by identical update. Keys which
+        share an update are sent in chunked $in queries (groups are updated
+        concurrently), so the count of requests depends on the count of
+        distinct updates, not on the count of documents.
+        Args:
+            pairs (iterable): pairs (key, update), e.g.
+                ('some-id', {'$set': {'status': 'done'}})
+            key_field (str): field matched with the keys
+            chunk_size (int): max keys per update request
+            workers (int): max update requests in flight
+            query (dict, optional): query all updated documents must match
+            validate (bool): validate updates against the entity schema
+                before sending them
+
+        Returns:
+            - dict - summary: status (COMPLETE/PARTIAL/ERROR), matchCount,
+                     modifiedCount, requests and failed (pairs (update,
+                     keys) of failed requests)
+
+        Raises:
+            ValueError: a key has different updates
+            DocumentValidationError: invalid update (validate=True)
+
+        """
+        groups = group_updates(pairs)
+        if validate:
+            for update, _ in groups:
+                errors = self.get_validator().validate_update(update)
+                if errors:
+                    raise DocumentValidationError([(update, errors)])
+        requests = []
+        for update, keys in groups:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                chunk_query = {'field': key_field, 'op': '$in',
+                               'values': chunk}
+                if query is not None:
+                    chunk_query = {'$and': [query, chunk_query]}
+                requests.append((update, chunk, chunk_query))
+        summary = {'status': 'COMPLETE', 'matchCount': 0,
+                   'modifiedCount': 0, 'requests': len(requests),
+                   'failed': []}
+        if not requests:
+            return summary
+        active_deadline = current_deadline()
+
+        def send(request):
+            with activate_deadline(active_deadline):
+                return self.update_item(request[2], request[0])
+
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(send, request) for request in requests]
+            for (update, chunk, _), future in zip(requests, futures):
+                response = future.result()
+                if response is not None:
+                    summary['matchCount'] += response.get('matchCount') or 0
+                    summary['modifiedCount'] += \
+                        response.get('modifiedCount') or 0
+                if not self.check_response(response):
+                    summary['failed'].append((update, chunk))
+        if summary['failed']:
+            summary['status'] = 'ERROR' \
+                if len(summary['failed']) == len(requests) else 'PARTIAL'
+        return summary
+
+    def find_item(self, query, projection=None, from_=None, max_results=None,
+                  sort=None):
         """
         Find specific object according to query and projection field
         Args:
@@ -154,6 +508,7 @@ class LightBlueEntity(object):
                                (default - return all)
             from_: from item in query
             max_results: limit results count in response
+            sort (dict/list): LightBlue sort, e.g. {'field': '$asc'}
 
         Returns:
             - dict - result of search query
@@ -175,6 +530,8 @@ class LightBlueEntity(object):
             lightblue_data['from'] = from_
         if max_results is not None:
             lightblue_data['maxResults'] = max_results
+        if sort is not None:
+            lightblue_data['sort'] = sort
         lightblue_data['projection'] = projection
         return self.service.find_data(self.entity_name, self.version,
                                       lightblue_data)
@@ -222,23 +579,30 @@ class LightBlueEntity(object):
         Args:
             page_size (int): max results per LightBlue call
             find (Callable): find function (find_item / find_all)
+            deadline (float): time budget in seconds shared by all
+                page fetches (keyword only, optional)
 
         Returns:
             - list of processed items from multiple find calls
 
+        Raises:
+            DeadlineExceeded: pages were not fetched before the deadline
+
         """
+        budget = kwargs.pop('deadline', None)
         kwargs.update({
             "from_": 0,
             "max_results": page_size
         })
 
         processed = []
-        while True:
-            response = find(*args, **kwargs)
-            if not self.check_response(response):
-                return None
-            elif len(response['processed']) == 0:
-                return processed
-
-            processed.extend(response['processed'])
-            kwargs['from_'] += page_size
+        with deadline(budget):
+            while True:
+                response = find(*args, **kwargs)
+                if not self.check_response(response):
+                    return None
+                elif len(response['processed']) == 0:
+                    return processed
+
+                processed.extend(response['processed'])
+                kwargs['from_'] += page_size
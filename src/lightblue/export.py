@@ -0,0 +1,270 @@
+"""
+Partitioned parallel export of an entity to gzipped NDJSON shards.
+
+The entity is split into disjoint partitions - ranges of a field, or
+"hash" partitions by the last hex digit of _id (ObjectId counters are
+evenly distributed) with a catch-all partition for other _ids.
+Partitions are scanned concurrently by _id keyset pages, each into its own
+shard. A checkpoint per shard allows resuming an interrupted export; a
+manifest is written when all shards are complete.
+
+Usage:
+    lightblue-export --data-url URL --metadata-url URL --entity NAME \\
+        --version 1.0.0 --partitions 16 --workers 8 dump/
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from lightblue.cli import add_service_arguments, entity_from_arguments
+from lightblue.sync import FileWatermarkStore
+
+LOGGER = logging.getLogger('lightblue')
+
+HEX_DIGITS = '0123456789abcdef'
+MANIFEST = 'manifest.json'
+
+
+class ExportError(Exception):
+    """Export of a partition failed."""
+
+    pass
+
+
+def _last_character(field, characters):
+    """
+    Query matching values of a field ending with one of characters.
+
+    Args:
+        field (str): field
+        characters (str): last characters
+
+    Returns:
+        dict: LightBlue regex query
+    """
+    return {'field': field,
+            'regex': '[{}]$'.format(re.escape(characters))}
+
+
+def hash_partitions(count, field='_id', alphabet=HEX_DIGITS,
+                    catch_all=True):
+    """
+    Partition by the last character of a field (hex ObjectIds by default).
+
+    Args:
+        count (int): count of partitions (max len(alphabet))
+        field (str): partitioned field
+        alphabet (str): possible last characters
+        catch_all (bool): add a partition of documents whose field does
+            not end with a character of the alphabet (e.g. custom
+            string _ids), so no document is left out
+
+    Returns:
+        list: LightBlue queries of disjoint partitions
+    """
+    count = max(1, min(count, len(alphabet)))
+    partitions = [_last_character(field, alphabet[index::count])
+                  for index in range(count)]
+    if catch_all:
+        partitions.append({'$not': _last_character(field, alphabet)})
+    return partitions
+
+
+def range_partitions(field, boundaries):
+    """
+    Partition by ranges of a field.
+
+    Documents without the field are not part of any partition.
+
+    Args:
+        field (str): partitioned field
+        boundaries (list): sorted values splitting the ranges
+
+    Returns:
+        list: LightBlue queries of disjoint partitions
+    """
+    bounds = [None] + list(boundaries) + [None]
+    partitions = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        clauses = []
+        if lower is not None:
+            clauses.append({'field': field, 'op': '>=', 'rvalue': lower})
+        if upper is not None:
+            clauses.append({'field': field, 'op': '<', 'rvalue': upper})
+        if not clauses:
+            clauses.append({'field': field, 'op': '!=', 'rvalue': None})
+        partitions.append(
+            clauses[0] if len(clauses) == 1 else {'$and': clauses})
+    return partitions
+
+
+def shard_name(index):
+    """
+    File name of a partition shard.
+
+    Args:
+        index (int): partition index
+
+    Returns:
+        str: file name
+    """
+    return 'part-{:05d}.ndjson.gz'.format(index)
+
+
+def export_partition(entity, index, query, directory, page_size=1000):
+    """
+    Export one partition (resumes from its checkpoint).
+
+    Each page is appended to the shard as a gzip member and the
+    checkpoint is saved after it, so a resumed export truncates the shard
+    to the last checkpointed size.
+
+    Args:
+        entity (lightblue.entity.LightBlueEntity): exported entity
+        index (int): partition index
+        query (dict): LightBlue query of the partition
+        directory (str): output directory
+        page_size (int): max documents per find request
+
+    Returns:
+        dict: partition state (shard, query, last _id, count, bytes, done)
+
+    Raises:
+        ExportError: find request failed or checkpoint does not match
+    """
+    shard = os.path.join(directory, shard_name(index))
+    store = FileWatermarkStore(shard + '.checkpoint')
+    state = store.load()
+    if state is None:
+        state = {'shard': shard_name(index), 'query': query, 'last': None,
+                 'count': 0, 'bytes': 0, 'done': False}
+    elif state['query'] != query:
+        raise ExportError('Checkpoint of {} is for another partition'.format(
+            state['shard']))
+    if state['done']:
+        return state
+    with open(shard, 'ab') as shard_file:
+        shard_file.truncate(state['bytes'])
+    while True:
+        page_query = query if state['last'] is None else {'$and': [
+            query, {'field': '_id', 'op': '>', 'rvalue': state['last']}]}
+        response = entity.find_item(
+            page_query, max_results=page_size, sort={'_id': '$asc'})
+        if not entity.check_response(response):
+            raise ExportError('Export of {} failed'.format(state['shard']))
+        documents = response.get('processed') or []
+        if documents:
+            with gzip.open(shard, 'ab') as shard_file:
+                for document in documents:
+                    shard_file.write(
+                        (json.dumps(document) + '\n').encode('utf-8'))
+            state['last'] = documents[-1]['_id']
+            state['count'] += len(documents)
+            state['bytes'] = os.path.getsize(shard)
+        state['done'] = len(documents) < page_size
+        store.save(state)
+        if state['done']:
+            LOGGER.info('Exported %s documents to %s',
+                        state['count'], state['shard'])
+            return state
+
+
+def export_entity(entity, directory, partitions, page_size=1000,
+                  workers=4, processes=False):
+    """
+    Export partitions of an entity concurrently.
+
+    Args:
+        entity (lightblue.entity.LightBlueEntity): exported entity
+        directory (str): output directory (created if missing)
+        partitions (list): LightBlue queries of disjoint partitions
+        page_size (int): max documents per find request
+        workers (int): count of partitions exported at once
+        processes (bool): use a process pool instead of threads
+
+    Returns:
+        dict: manifest (also written to manifest.json)
+
+    Raises:
+        ExportError: export of a partition failed
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(workers) as executor:
+        futures = [
+            executor.submit(export_partition, entity, index, query,
+                            directory, page_size)
+            for index, query in enumerate(partitions)
+        ]
+        states = [future.result() for future in futures]
+    manifest = {
+        'entity': entity.entity_name,
+        'version': entity.version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'count': sum(state['count'] for state in states),
+        'partitions': [{
+            'shard': state['shard'],
+            'query': state['query'],
+            'count': state['count'],
+            'bytes': state['bytes'],
+        } for state in states],
+    }
+    FileWatermarkStore(os.path.join(directory, MANIFEST)).save(manifest)
+    return manifest
+
+
+def main(argv=None):
+    """
+    Command line entry point (lightblue-export).
+
+    Args:
+        argv (list, optional): arguments (sys.argv by default)
+
+    Returns:
+        int: exit code
+    """
+    parser = argparse.ArgumentParser(
+        description='Export a LightBlue entity to gzipped NDJSON shards.')
+    add_service_arguments(parser)
+    parser.add_argument('output', help='output directory')
+    parser.add_argument('--partitions', type=int, default=16,
+                        help='count of _id hash partitions (max length of '
+                             'the alphabet, plus one for other _ids)')
+    parser.add_argument('--alphabet', default=HEX_DIGITS,
+                        help='last characters of _ids split into hash '
+                             'partitions (default hex digits)')
+    parser.add_argument('--range-field',
+                        help='partition by ranges of this field')
+    parser.add_argument('--boundaries', default='',
+                        help='comma separated range boundaries')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--processes', action='store_true',
+                        help='use processes instead of threads')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.range_field:
+        partitions = range_partitions(
+            args.range_field,
+            [value for value in args.boundaries.split(',') if value])
+    else:
+        partitions = hash_partitions(args.partitions,
+                                     alphabet=args.alphabet)
+    try:
+        manifest = export_entity(
+            entity_from_arguments(args), args.output, partitions,
+            page_size=args.page_size, workers=args.workers,
+            processes=args.processes)
+    except ExportError as exc:
+        LOGGER.error('%s (run again to resume)', exc)
+        return 1
+    LOGGER.info('Exported %s documents', manifest['count'])
+    return 0
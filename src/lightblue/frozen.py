@@ -0,0 +1,248 @@
+"""
+Immutable, copy-on-write selections.
+
+FrozenSelection holds query and projection as tuples. Every chaining call
+returns a new object sharing the unchanged parts with its base, so a base
+selection can be built once, cached and branched from several threads.
+
+FrozenSelection has no builder or execution methods of its own - each
+call is applied to a fresh LightBlueGenericSelection (or subclass) with
+the same state; a selection returned for chaining is frozen again,
+anything else (a response, first, all, exist) is returned as is.
+
+Raw queries are deep-copied once when they are added and the frozen
+copies are shared by all derived selections. Only thaw() copies them
+again, for the mutable selection given to the caller.
+"""
+
+import copy
+import functools
+
+from lightblue.selection import LightBlueGenericSelection
+
+
+class FrozenSelection(object):
+    """
+    Immutable selection builder.
+
+    Attributes:
+        interface (lightblue.entity.LightBlueEntity):
+            wrapper to query a LightBlue method
+        selection_class (type): LightBlueGenericSelection (sub)class
+            executing the calls
+    """
+
+    __slots__ = (
+        'interface',
+        'selection_class',
+        '_queries',
+        '_raw_queries',
+        '_projections',
+        '_projections_recursive',
+        '_deadline',
+        '_normalize',
+    )
+
+    def __init__(self, interface, *args, **kwargs):
+        """
+        Initialize a FrozenSelection object.
+
+        Args:
+            interface (lightblue.entity.LightBlueEntity):
+                reference to LightBlueEntity object
+            *args: list of pairs/triples with initial query
+            **kwargs: dict with initial query (equals),
+                selection_class (keyword only, optional)
+        """
+        selection_class = kwargs.pop(
+            'selection_class', LightBlueGenericSelection)
+        selection = selection_class(*args, interface=interface, **kwargs)
+        set_slot = object.__setattr__
+        set_slot(self, 'interface', interface)
+        set_slot(self, 'selection_class', selection_class)
+        for name, value in self._state(selection).items():
+            set_slot(self, name, value)
+
+    @classmethod
+    def from_selection(cls, selection):
+        """
+        Freeze query and projection of a mutable selection.
+
+        Args:
+            selection (LightBlueGenericSelection): selection to copy
+
+        Returns:
+            FrozenSelection: new selection
+        """
+        frozen = cls(selection.interface, selection_class=type(selection))
+        return frozen._freeze(selection)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FrozenSelection is immutable')
+
+    def __repr__(self):
+        return 'FrozenSelection({!r}, queries={!r})'.format(
+            getattr(self.interface, 'entity_name', self.interface),
+            self._queries + self._raw_queries)
+
+    def __getattr__(self, name):
+        """
+        Apply any other attribute of the selection class to a thawed copy.
+
+        Args:
+            name (str): attribute name
+
+        Returns:
+            object: value of the attribute or a wrapper of the method
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        selection = self._thaw()
+        attribute = getattr(selection, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return self._freeze(selection) if result is selection else result
+
+        return call
+
+    @staticmethod
+    def _state(selection, raw_queries=()):
+        """
+        Get query and projection of a selection as tuples.
+
+        Args:
+            selection (LightBlueGenericSelection): selection
+            raw_queries (tuple): frozen raw queries which are not copied
+                again if the selection still starts with them
+
+        Returns:
+            dict: slot name -> value
+        """
+        queries = selection._raw_queries
+        if len(queries) < len(raw_queries) or any(
+                query is not frozen
+                for query, frozen in zip(queries, raw_queries)):
+            raw_queries = ()
+        if len(queries) > len(raw_queries):
+            raw_queries = raw_queries + tuple(
+                copy.deepcopy(query)
+                for query in queries[len(raw_queries):])
+        return {
+            '_queries': tuple(selection._queries),
+            '_raw_queries': raw_queries,
+            '_projections': tuple(selection._projections),
+            '_projections_recursive': tuple(
+                selection._projections_recursive),
+            '_deadline': selection._deadline,
+            '_normalize': selection.normalize_queries,
+        }
+
+    def _freeze(self, selection):
+        """
+        Create a copy with the state of a selection, sharing unchanged
+        attributes.
+
+        Args:
+            selection (LightBlueGenericSelection): changed thawed copy
+
+        Returns:
+            FrozenSelection: derived selection
+        """
+        clone = object.__new__(type(self))
+        state = self._state(selection, self._raw_queries)
+        for name in FrozenSelection.__slots__:
+            value = getattr(self, name)
+            if name in state and state[name] is not value and \
+               state[name] != value:
+                value = state[name]
+            object.__setattr__(clone, name, value)
+        return clone
+
+    def _build(self, method, *args, **kwargs):
+        """
+        Apply a builder method of the selection class to a thawed copy.
+
+        Args:
+            method (str): method name
+            *args: method arguments
+            **kwargs: method keyword arguments
+
+        Returns:
+            FrozenSelection: derived selection
+        """
+        selection = self._thaw()
+        getattr(selection, method)(*args, **kwargs)
+        return self._freeze(selection)
+
+    # builders without a chaining method on the selection
+    def where(self, *args, **kwargs):
+        """
+        Add query pairs/triples (and equals from kwargs).
+
+        Args:
+            *args: pairs/triples with query
+            **kwargs: dict with query (equals)
+
+        Returns:
+            FrozenSelection: derived selection
+        """
+        return self._build('_add_to_query', *args, **kwargs)
+
+    def add_raw_query(self, query):
+        """
+        Add raw LightBlue query (copied, later changes are not seen).
+
+        Args:
+            query (dict): raw LightBlue query
+
+        Returns:
+            FrozenSelection: derived selection
+        """
+        return self._build('add_raw_query', query)
+
+    def project(self, *fields, **kwargs):
+        """
+        Add fields to the projection.
+
+        Args:
+            *fields: field names
+            **kwargs: recursive - fields with recursive=True
+
+        Returns:
+            FrozenSelection: derived selection
+        """
+        return self._build('_add_to_projection', *fields, **kwargs)
+
+    def thaw(self):
+        """
+        Create a mutable selection with the same query and projection.
+
+        Returns:
+            LightBlueGenericSelection: new selection (with copies of raw
+                queries)
+        """
+        selection = self._thaw()
+        selection._raw_queries = [
+            copy.deepcopy(query) for query in self._raw_queries]
+        return selection
+
+    def _thaw(self):
+        """
+        Create a mutable selection sharing the frozen raw queries
+        (used internally, the selection is never given to the caller).
+
+        Returns:
+            LightBlueGenericSelection: new selection
+        """
+        selection = self.selection_class(interface=self.interface)
+        selection._queries = list(self._queries)
+        selection._raw_queries = list(self._raw_queries)
+        selection._projections = list(self._projections)
+        selection._projections_recursive = list(self._projections_recursive)
+        selection._deadline = self._deadline
+        selection.normalize_queries = self._normalize
+        return selection
@@ -0,0 +1,263 @@
+"""
+Hedged requests for idempotent operations.
+
+If a request has not answered within a delay taken from a percentile of
+recent latencies, a duplicate is sent and the first successful (non-5xx)
+response wins.
+"""
+
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from lightblue.common import PicklableConfig, activate_deadline, \
+    current_deadline, monotonic
+
+LOGGER = logging.getLogger('lightblue')
+
+
+def _discard(future):
+    """
+    Release connection of a losing request.
+
+    Args:
+        future (Future): future of the losing request
+    """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _failed(future):
+    """
+    Request raised or LightBlue answered with a server error.
+
+    Args:
+        future (Future): finished future of a request
+
+    Returns:
+        bool: True if the request failed
+    """
+    return future.exception() is not None or \
+        future.result().status_code >= 500
+
+
+class HedgingPolicy(PicklableConfig):
+    """
+    Percentile-based hedging policy.
+
+    Attributes:
+        percentile (float): latency percentile used as hedge delay
+        operations (tuple): hedged operation types (idempotent only)
+        max_extra_load (float): max ratio of hedged to all requests
+    """
+
+    def __init__(self,
+                 percentile=95,
+                 initial_delay=0.5,
+                 min_delay=0.01,
+                 max_delay=None,
+                 max_extra_load=0.05,
+                 window=200,
+                 min_samples=20,
+                 operations=('find', 'get_schema'),
+                 max_workers=16):
+        """
+        Initialize a HedgingPolicy object.
+
+        Args:
+            percentile (float): latency percentile used as hedge delay
+            initial_delay (float): delay used before min_samples
+                latencies are recorded
+            min_delay (float): lower bound of the hedge delay
+            max_delay (float, optional): upper bound of the hedge delay
+            max_extra_load (float): max ratio of extra (hedged) requests
+            window (int): count of recent latencies kept per operation
+            min_samples (int): latencies needed to use the percentile
+            operations (tuple): hedged operation types
+            max_workers (int): size of the thread pool sending requests
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_extra_load = max_extra_load
+        self.window = window
+        self.min_samples = min_samples
+        self.operations = tuple(operations)
+        self.max_workers = max_workers
+        self._latencies = {}
+        # hedge budget - each request deposits max_extra_load tokens
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    @property
+    def stats(self):
+        """
+        Hedging statistics.
+
+        Returns:
+            dict: requests, hedged requests and hedges which won
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def applies_to(self, operation):
+        """
+        Operation can be hedged.
+
+        Args:
+            operation (str): operation type
+
+        Returns:
+            bool: True if operation is hedged
+        """
+        return operation in self.operations
+
+    def record(self, operation, latency):
+        """
+        Record latency of a request.
+
+        Args:
+            operation (str): operation type
+            latency (float): seconds
+        """
+        with self._lock:
+            if operation not in self._latencies:
+                self._latencies[operation] = deque(maxlen=self.window)
+            self._latencies[operation].append(latency)
+
+    def delay(self, operation):
+        """
+        Get hedge delay for an operation.
+
+        Args:
+            operation (str): operation type
+
+        Returns:
+            float: seconds to wait before sending a hedge
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(operation, ()))
+        if len(latencies) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            index = int(round(
+                (len(latencies) - 1) * self.percentile / 100.0))
+            delay = latencies[index]
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def _deposit(self):
+        """Count a request and add its share to the hedge budget."""
+        with self._lock:
+            self._stats['requests'] += 1
+            self._tokens = min(
+                self._tokens + self.max_extra_load,
+                max(1.0, self.max_extra_load * self.window))
+
+    def _withdraw(self):
+        """
+        Take a token for a hedge.
+
+        Returns:
+            bool: True if the hedge fits into the extra load cap
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self._stats['hedged'] += 1
+            return True
+
+    def _submit(self, send):
+        """
+        Send a request in the thread pool.
+
+        Deadline of the calling thread is shared with the pool thread.
+
+        Args:
+            send (Callable): function sending the request
+
+        Returns:
+            tuple: future, start time
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers)
+        active_deadline = current_deadline()
+
+        def call():
+            with activate_deadline(active_deadline):
+                return send()
+        return self._executor.submit(call), monotonic()
+
+    def execute(self, operation, send, hedge_send=None):
+        """
+        Send a request, hedge it if it is slower than the hedge delay.
+
+        A 5xx response or an error loses while the other request is still
+        pending; if both fail, the first 5xx response (or error) is used.
+
+        Args:
+            operation (str): operation type
+            send (Callable): function sending the request,
+                returns response object
+            hedge_send (Callable, optional): function sending the hedge
+                (e.g. under the limiters of the service), send by default
+
+        Returns:
+            object: response of the first successful request
+        """
+        self._deposit()
+        primary, started = self._submit(send)
+        done, _ = wait([primary], timeout=self.delay(operation))
+        if done or not self._withdraw():
+            response = primary.result()
+            self.record(operation, monotonic() - started)
+            return response
+
+        LOGGER.debug("Hedging slow %s request", operation)
+        hedge, _ = self._submit(hedge_send or send)
+        pending = set([primary, hedge])
+        finished = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finished.extend(
+                future for future in (primary, hedge) if future in done)
+            winners = [future for future in finished if not _failed(future)]
+            if not winners and pending:
+                continue
+            responses = [future for future in finished
+                         if future.exception() is None]
+            winner = (winners or responses or finished)[0]
+            if winner.exception() is None:
+                self.record(operation, monotonic() - started)
+            if winner is hedge and winners:
+                with self._lock:
+                    self._stats['hedge_wins'] += 1
+            for loser in pending:
+                if not loser.cancel():
+                    loser.add_done_callback(_discard)
+            for loser in finished:
+                if loser is not winner:
+                    _discard(loser)
+            return winner.result()
+
+    def after_fork(self):
+        """Drop the thread pool inherited from the parent process."""
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def shutdown(self):
+        """Stop the thread pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,400 @@
+"""
+Streaming bulk import of NDJSON/CSV files (optionally gzipped).
+
+Documents are read one by one, grouped into insert batches by count and
+bytes, and inserted with bounded parallelism. Rejected documents are
+written with their dataErrors to a rejects file. The checkpoint holds the
+offset (record number) up to which all batches were acknowledged and the
+ranges of batches acknowledged after it (batches finish out of order), so
+an interrupted import resumes after the offset and skips those ranges.
+
+Usage:
+    lightblue-import --data-url URL --metadata-url URL --entity NAME \\
+        --version 1.0.0 --workers 8 documents.ndjson.gz
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import threading
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from lightblue.bulk import match_errors
+from lightblue.cli import add_service_arguments, entity_from_arguments
+from lightblue.sync import FileWatermarkStore, MemoryWatermarkStore
+
+LOGGER = logging.getLogger('lightblue')
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+
+class BulkImportError(Exception):
+    """Insert request of a batch failed (import can be resumed)."""
+
+    pass
+
+
+def open_input(path):
+    """
+    Open input file as text (gzip if it ends with .gz).
+
+    Args:
+        path (str): file path
+
+    Returns:
+        file: text stream
+    """
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    return io.open(path, encoding='utf-8', newline='')
+
+
+def input_format(path):
+    """
+    Guess input format from a file name.
+
+    Args:
+        path (str): file path
+
+    Returns:
+        str: 'csv' or 'ndjson'
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    return CSV if name.endswith('.csv') else NDJSON
+
+
+def read_ndjson(stream):
+    """
+    Read documents from NDJSON lines (empty lines are skipped).
+
+    Args:
+        stream (file): text stream
+
+    Yields:
+        dict: document
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def unflatten(row):
+    """
+    Build a nested document from dotted CSV columns (empty cells skipped).
+
+    Args:
+        row (dict): column -> value
+
+    Returns:
+        dict: document
+    """
+    document = {}
+    for column, value in row.items():
+        if column is None or value in (None, ''):
+            continue
+        parts = column.split('.')
+        target = document
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return document
+
+
+def read_csv(stream):
+    """
+    Read documents from CSV with a header row.
+
+    Args:
+        stream (file): text stream
+
+    Yields:
+        dict: document
+    """
+    for row in csv.DictReader(stream):
+        yield unflatten(row)
+
+
+def batches(documents, max_items=500, max_bytes=4 * 1024 * 1024, start=0,
+            skip=None):
+    """
+    Group documents into batches by count and JSON size.
+
+    Args:
+        documents (iterable): documents
+        max_items (int): max documents per batch
+        max_bytes (int): max JSON size of a batch
+        start (int): skip documents before this offset
+        skip (dict, optional): first offset -> end offset of skipped
+            ranges (batches never span a skipped range)
+
+    Yields:
+        tuple: offset of the first document, offset after the last one,
+            list of documents
+    """
+    skip = skip or {}
+    batch, size, first = [], 0, start
+    skip_end = None
+    for offset, document in enumerate(documents):
+        if offset < start:
+            continue
+        if offset in skip:
+            skip_end = max(skip_end or 0, skip[offset])
+        if skip_end is not None and offset < skip_end:
+            if batch:
+                yield first, offset, batch
+                batch, size = [], 0
+            first = offset + 1
+            continue
+        document_size = len(json.dumps(document))
+        if batch and (len(batch) >= max_items or
+                      size + document_size > max_bytes):
+            yield first, offset, batch
+            batch, size, first = [], 0, offset
+        batch.append(document)
+        size += document_size
+    if batch:
+        yield first, first + len(batch), batch
+
+
+class BulkImporter(object):
+    """
+    Inserts batches concurrently and tracks acknowledged offset.
+
+    Attributes:
+        entity (lightblue.entity.LightBlueEntity): target entity
+        checkpoint (object): store of the progress (load()/save(state))
+        state (dict): offset, inserted, rejected, completed (pairs
+            [first, end] of batches acknowledged after the offset)
+    """
+
+    def __init__(self,
+                 entity,
+                 max_items=500,
+                 max_bytes=4 * 1024 * 1024,
+                 workers=4,
+                 rejects=None,
+                 checkpoint=None):
+        """
+        Initialize a BulkImporter object.
+
+        Args:
+            entity (lightblue.entity.LightBlueEntity): target entity
+            max_items (int): max documents per insert request
+            max_bytes (int): max JSON size of an insert request
+            workers (int): max insert requests in flight
+            rejects (file, optional): text stream for rejected documents
+            checkpoint (object, optional): progress store
+                (FileWatermarkStore to resume later)
+        """
+        self.entity = entity
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.rejects = rejects
+        self.checkpoint = checkpoint or MemoryWatermarkStore()
+        self.state = self.checkpoint.load() or {
+            'offset': 0, 'inserted': 0, 'rejected': 0}
+        self._completed = dict(
+            (first, end) for first, end in self.state.get('completed', ()))
+        self._lock = threading.Lock()
+
+    def _insert(self, batch):
+        """
+        Insert one batch.
+
+        Args:
+            batch (tuple): first offset, end offset, documents
+
+        Returns:
+            tuple: batch, LightBlue response
+        """
+        return batch, self.entity.insert_data(batch[2], return_errors=True)
+
+    def _reject(self, batch, response):
+        """
+        Write rejected documents of a batch.
+
+        Args:
+            batch (tuple): first offset, end offset, documents
+            response (dict): LightBlue response
+
+        Returns:
+            int: count of rejected documents
+        """
+        errors = response.get('dataErrors') or []
+        if not errors or self.rejects is None:
+            return len(errors)
+        matched, unmatched = match_errors(batch[2], errors)
+        lines = [json.dumps({
+            'offset': batch[0] + index,
+            'document': batch[2][index],
+            'errors': matched[index],
+        }) + u'\n' for index in sorted(matched)]
+        lines.extend(json.dumps({
+            'offset': None,
+            'document': error.get('data'),
+            'errors': error.get('errors'),
+        }) + u'\n' for error in unmatched)
+        with self._lock:
+            for line in lines:
+                self.rejects.write(line)
+            self.rejects.flush()
+        return len(errors)
+
+    def _acknowledge(self, batch, response):
+        """
+        Record a finished batch and save the contiguous offset with the
+        batches finished after it.
+
+        Args:
+            batch (tuple): first offset, end offset, documents
+            response (dict): LightBlue response
+        """
+        rejected = self._reject(batch, response)
+        with self._lock:
+            self.state['rejected'] += rejected
+            self.state['inserted'] += len(batch[2]) - rejected
+            self._completed[batch[0]] = batch[1]
+            while self.state['offset'] in self._completed:
+                self.state['offset'] = self._completed.pop(
+                    self.state['offset'])
+            self.state['completed'] = sorted(
+                [first, end] for first, end in self._completed.items())
+            self.checkpoint.save(dict(self.state))
+
+    def run(self, documents):
+        """
+        Import documents (skipping those before the checkpoint offset and
+        in batches acknowledged after it).
+
+        Args:
+            documents (iterable): documents read from the input
+
+        Returns:
+            dict: offset, inserted and rejected counts
+
+        Raises:
+            BulkImportError: an insert request failed
+        """
+        failed = []
+        in_flight = set()
+
+        def collect(futures):
+            for future in futures:
+                try:
+                    batch, response = future.result()
+                except Exception as exc:
+                    failed.append(exc)
+                    continue
+                # all documents rejected - status ERROR with dataErrors
+                if response is None or (response.get('status') == 'ERROR'
+                                        and not response.get('dataErrors')):
+                    failed.append(BulkImportError(
+                        'Insert of documents {}-{} failed'.format(
+                            batch[0], batch[1] - 1)))
+                else:
+                    self._acknowledge(batch, response)
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            for batch in batches(documents, self.max_items, self.max_bytes,
+                                 self.state['offset'],
+                                 dict(self._completed)):
+                while len(in_flight) >= self.workers:
+                    done, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if failed:
+                    break
+                in_flight.add(executor.submit(self._insert, batch))
+            collect(wait(in_flight)[0])
+        if failed:
+            raise BulkImportError('{} (acknowledged offset {})'.format(
+                failed[0], self.state['offset']))
+        return dict((key, self.state[key])
+                    for key in ('offset', 'inserted', 'rejected'))
+
+
+def import_file(entity, path, file_format=None, rejects_path=None,
+                checkpoint_path=None, **kwargs):
+    """
+    Import NDJSON/CSV file into an entity.
+
+    Args:
+        entity (lightblue.entity.LightBlueEntity): target entity
+        path (str): input file (.gz is decompressed)
+        file_format (str, optional): 'ndjson' or 'csv'
+            (guessed from the file name)
+        rejects_path (str, optional): NDJSON file for rejected documents
+        checkpoint_path (str, optional): progress file for resume
+        **kwargs: BulkImporter options (max_items, max_bytes, workers)
+
+    Returns:
+        dict: offset, inserted and rejected counts
+
+    Raises:
+        BulkImportError: an insert request failed
+    """
+    file_format = file_format or input_format(path)
+    read = read_csv if file_format == CSV else read_ndjson
+    checkpoint = None if checkpoint_path is None \
+        else FileWatermarkStore(checkpoint_path)
+    rejects = None if rejects_path is None \
+        else io.open(rejects_path, 'a', encoding='utf-8')
+    try:
+        with open_input(path) as stream:
+            importer = BulkImporter(
+                entity, rejects=rejects, checkpoint=checkpoint, **kwargs)
+            return importer.run(read(stream))
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+
+def main(argv=None):
+    """
+    Command line entry point (lightblue-import).
+
+    Args:
+        argv (list, optional): arguments (sys.argv by default)
+
+    Returns:
+        int: exit code
+    """
+    parser = argparse.ArgumentParser(
+        description='Import NDJSON/CSV documents into a LightBlue entity.')
+    add_service_arguments(parser)
+    parser.add_argument('input', help='NDJSON or CSV file (may be gzipped)')
+    parser.add_argument('--format', choices=(NDJSON, CSV),
+                        help='input format (guessed from the file name)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='max documents per insert request')
+    parser.add_argument('--batch-bytes', type=int, default=4 * 1024 * 1024,
+                        help='max JSON size of an insert request')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='max insert requests in flight')
+    parser.add_argument('--rejects',
+                        help='rejected documents (default INPUT.rejects)')
+    parser.add_argument('--checkpoint',
+                        help='progress file (default INPUT.checkpoint)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        state = import_file(
+            entity_from_arguments(args), args.input,
+            file_format=args.format,
+            rejects_path=args.rejects or args.input + '.rejects',
+            checkpoint_path=args.checkpoint or args.input + '.checkpoint',
+            max_items=args.batch_size, max_bytes=args.batch_bytes,
+            workers=args.workers)
+    except BulkImportError as exc:
+        LOGGER.error('%s (run again to resume)', exc)
+        return 1
+    LOGGER.info('Inserted %s documents, rejected %s',
+                state['inserted'], state['rejected'])
+    return 0
@@ -0,0 +1,257 @@
+"""
+Client-side request limiting.
+
+RequestLimiter combines a max-in-flight counter with a requests-per-second
+token bucket. LightBlueService accepts one limiter for the whole service and
+one per operation type (find/insert/update/delete/get_schema).
+"""
+
+import logging
+import threading
+import time
+
+from lightblue.common import PicklableConfig, monotonic
+
+LOGGER = logging.getLogger('lightblue')
+
+
+class LimitExceeded(Exception):
+    """Request rejected by a non-blocking (or timed out) limiter."""
+
+    pass
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing `rate` requests per second.
+
+    Attributes:
+        rate (float): tokens added per second
+        burst (float): bucket capacity (max burst of requests)
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Initialize a TokenBucket object.
+
+        Args:
+            rate (float): requests per second
+            burst (float, optional): bucket capacity,
+                defaults to max(rate, 1)
+        """
+        if rate <= 0:
+            raise ValueError("Rate has to be a positive number")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Replace the lock inherited from the parent process."""
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """
+        Take a token if available.
+
+        Returns:
+            float: 0 if the token was taken, otherwise seconds until
+                the next token is available
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Take a token from the bucket.
+
+        Args:
+            blocking (bool): wait for a token if none is available
+            timeout (float, optional): max seconds to wait
+
+        Returns:
+            bool: True if the token was taken, False otherwise
+        """
+        end = None if timeout is None else monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            if end is not None:
+                remaining = end - monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class RequestLimiter(PicklableConfig):
+    """
+    Max-in-flight and requests-per-second limiter.
+
+    Attributes:
+        max_in_flight (int/None): max concurrent requests (None - unlimited)
+        bucket (TokenBucket/None): requests-per-second limit
+        blocking (bool): wait for a free slot (False - fail fast)
+        timeout (float/None): max seconds to wait for a slot
+    """
+
+    def __init__(self,
+                 max_in_flight=None,
+                 rate=None,
+                 burst=None,
+                 blocking=True,
+                 timeout=None,
+                 name=None):
+        """
+        Initialize a RequestLimiter object.
+
+        Args:
+            max_in_flight (int, optional): max concurrent requests
+            rate (float, optional): max requests per second
+            burst (float, optional): token bucket capacity
+            blocking (bool, optional): wait for a free slot, raise
+                LimitExceeded immediately otherwise
+            timeout (float, optional): max seconds to wait in blocking mode
+            name (str, optional): name used in log messages
+        """
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.blocking = blocking
+        self.timeout = timeout
+        self.name = name or 'limiter'
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            'acquired': 0,
+            'rejected': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+
+    def after_fork(self):
+        """
+        Replace locks inherited from the parent process and drop its
+        in-flight requests (they are not running in this process).
+        """
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        if self.bucket is not None:
+            self.bucket.after_fork()
+
+    @property
+    def in_flight(self):
+        """
+        Count of requests holding a slot.
+
+        Returns:
+            int: requests in flight
+        """
+        return self._in_flight
+
+    @property
+    def stats(self):
+        """
+        Limiter statistics.
+
+        Returns:
+            dict: acquired/rejected counts, total and max queue wait
+        """
+        with self._condition:
+            return dict(self._stats)
+
+    def _acquire_slot(self, end):
+        """
+        Wait for a free in-flight slot.
+
+        Args:
+            end (float/None): monotonic time to give up at
+
+        Returns:
+            bool: True if the slot was taken, False otherwise
+        """
+        with self._condition:
+            while self._in_flight >= self.max_in_flight:
+                if not self.blocking:
+                    return False
+                if end is None:
+                    self._condition.wait()
+                else:
+                    remaining = end - monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            self._in_flight += 1
+            return True
+
+    def _reject(self, reason):
+        """
+        Count rejected request and raise.
+
+        Args:
+            reason (str): reason included in the exception
+
+        Raises:
+            LimitExceeded: always
+        """
+        with self._condition:
+            self._stats['rejected'] += 1
+        raise LimitExceeded('{name}: {reason}'.format(
+            name=self.name, reason=reason))
+
+    def acquire(self, timeout=None):
+        """
+        Take a slot (and a token) for one request.
+
+        Args:
+            timeout (float, optional): max seconds to wait, the shorter
+                of this and the limiter timeout is used
+
+        Returns:
+            float: seconds spent waiting in the queue
+
+        Raises:
+            LimitExceeded: no slot available in non-blocking mode
+                or in the given timeout
+        """
+        start = monotonic()
+        timeouts = [t for t in (self.timeout, timeout) if t is not None]
+        end = start + min(timeouts) if timeouts else None
+        # slot first - a token is taken only by a request which can be
+        # sent, queued requests do not hold tokens
+        if self.max_in_flight is not None:
+            if not self._acquire_slot(end):
+                self._reject('max in-flight requests reached')
+        if self.bucket is not None:
+            timeout = None if end is None else max(end - monotonic(), 0)
+            if not self.bucket.acquire(self.blocking, timeout):
+                self.release()
+                self._reject('request rate limit reached')
+        waited = monotonic() - start
+        with self._condition:
+            self._stats['acquired'] += 1
+            self._stats['wait_total'] += waited
+            self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+        if waited > 0.001:
+            LOGGER.debug("%s - request waited %.3fs in queue",
+                         self.name, waited)
+        return waited
+
+    def release(self):
+        """Return the in-flight slot taken by acquire()."""
+        if self.max_in_flight is None:
+            return
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
@@ -0,0 +1,342 @@
+"""
+Client-side normalization of LightBlue queries.
+
+ - nested $and/$or are flattened, single-clause $and/$or are unwrapped
+ - duplicate clauses are removed
+ - equalities/$in of one field in an $or are merged into one $in,
+   several $in of one field in an $and are intersected
+ - conjunctions which can never match (e.g. a = 1 and a = 2, a > 5 and
+   a < 3, $in []) are replaced by NEVER, so no request has to be sent
+
+Array element paths (containing '*') are never intersected or checked for
+contradictions - one array can match clauses which exclude each other for
+a scalar. Neither are fields compared with values of different types
+(e.g. 1 and '1'), because LightBlue coerces values to the field type.
+"""
+
+from lightblue.common import canonical_json, value_kind
+
+EQUAL_OPS = ('=', '$eq')
+NOT_EQUAL_OPS = ('!=', '$neq')
+IN_OPS = ('$in', )
+NOT_IN_OPS = ('$nin', '$not_in')
+LOWER_OPS = {'>': False, '$gt': False, '>=': True, '$gte': True}
+UPPER_OPS = {'<': False, '$lt': False, '<=': True, '$lte': True}
+
+
+class _Never(object):
+    """Query which can never match."""
+
+    def __repr__(self):
+        return 'NEVER'
+
+
+NEVER = _Never()
+
+
+def _unique(values):
+    """
+    Remove duplicate values (keeps the first occurrence).
+
+    Args:
+        values (list): json values
+
+    Returns:
+        list: unique values
+    """
+    seen = set()
+    result = []
+    for value in values:
+        key = canonical_json(value)
+        if key not in seen:
+            seen.add(key)
+            result.append(value)
+    return result
+
+
+def _is_value(clause, ops):
+    """
+    Clause compares a field with a value using one of the operators.
+
+    Args:
+        clause (dict): LightBlue query expression
+        ops (tuple/dict): operators
+
+    Returns:
+        bool: True if it does
+    """
+    return 'field' in clause and 'rfield' not in clause and \
+        clause.get('op') in ops
+
+
+def _values(clause):
+    """
+    Values allowed by an equality or $in clause.
+
+    Args:
+        clause (dict): equality or $in expression
+
+    Returns:
+        list: values
+    """
+    if clause['op'] in EQUAL_OPS:
+        return [clause.get('rvalue')]
+    return list(clause.get('values') or [])
+
+
+def _in(field, values):
+    """
+    Build equality ($in of a single value) or $in clause.
+
+    Args:
+        field (str): field path
+        values (list): allowed values
+
+    Returns:
+        dict: LightBlue query expression
+    """
+    if len(values) == 1:
+        return {'field': field, 'op': '=', 'rvalue': values[0]}
+    return {'field': field, 'op': '$in', 'values': values}
+
+
+def _clause_values(clause):
+    """
+    All values a clause compares its field with.
+
+    Args:
+        clause (dict): LightBlue query expression
+
+    Returns:
+        list: values
+    """
+    if 'values' in clause:
+        return list(clause.get('values') or [])
+    if 'rvalue' in clause:
+        return [clause['rvalue']]
+    return []
+
+
+def _uncertain_fields(clauses):
+    """
+    Fields of a conjunction which must not be merged or checked for
+    contradictions - array element paths and fields compared with values
+    of different types.
+
+    Args:
+        clauses (list): flattened clauses of an $and
+
+    Returns:
+        set: field paths
+    """
+    kinds = {}
+    uncertain = set()
+    for clause in clauses:
+        if 'field' not in clause or 'rfield' in clause:
+            continue
+        field = clause['field']
+        if '*' in field.split('.'):
+            uncertain.add(field)
+        kinds.setdefault(field, set()).update(
+            value_kind(value) for value in _clause_values(clause)
+            if value is not None)
+    uncertain.update(field for field, field_kinds in kinds.items()
+                     if len(field_kinds) > 1)
+    return uncertain
+
+
+def _compare(left, right):
+    """
+    Compare two values.
+
+    Returns:
+        int: -1, 0, 1, None if values are not comparable
+    """
+    try:
+        if left < right:
+            return -1
+        if left > right:
+            return 1
+    except TypeError:
+        return None
+    return 0 if left == right else None
+
+
+def _outside(value, bounds):
+    """
+    Value is outside range bounds of a field.
+
+    Args:
+        value (object): value
+        bounds (dict): 'lower'/'upper' -> list of (bound, inclusive)
+
+    Returns:
+        bool: True if the value cannot match
+    """
+    for bound, inclusive in bounds['lower']:
+        order = _compare(value, bound)
+        if order == -1 or (order == 0 and not inclusive):
+            return True
+    for bound, inclusive in bounds['upper']:
+        order = _compare(value, bound)
+        if order == 1 or (order == 0 and not inclusive):
+            return True
+    return False
+
+
+def _contradicts(clauses):
+    """
+    Conjunction of clauses can never match.
+
+    Args:
+        clauses (list): flattened clauses of an $and
+
+    Returns:
+        bool: True if no document can match
+    """
+    fields = {}
+    uncertain = _uncertain_fields(clauses)
+    for clause in clauses:
+        if 'field' not in clause or 'rfield' in clause or \
+           clause['field'] in uncertain:
+            continue
+        info = fields.setdefault(clause['field'], {
+            'allowed': None, 'excluded': set(), 'lower': [], 'upper': []})
+        op = clause.get('op')
+        if op in EQUAL_OPS or op in IN_OPS:
+            keys = set(canonical_json(value) for value in _values(clause))
+            info['allowed'] = keys if info['allowed'] is None \
+                else info['allowed'] & keys
+            values = info.setdefault('values', {})
+            values.update((canonical_json(value), value)
+                          for value in _values(clause))
+        elif op in NOT_EQUAL_OPS:
+            info['excluded'].add(canonical_json(clause.get('rvalue')))
+        elif op in NOT_IN_OPS:
+            info['excluded'].update(
+                canonical_json(value) for value in clause.get('values') or [])
+        elif op in LOWER_OPS:
+            info['lower'].append((clause.get('rvalue'), LOWER_OPS[op]))
+        elif op in UPPER_OPS:
+            info['upper'].append((clause.get('rvalue'), UPPER_OPS[op]))
+    for info in fields.values():
+        if info['allowed'] is not None:
+            allowed = [
+                info['values'][key]
+                for key in info['allowed'] - info['excluded']
+            ]
+            if not any(not _outside(value, info) for value in allowed):
+                return True
+        for lower, lower_inclusive in info['lower']:
+            for upper, upper_inclusive in info['upper']:
+                order = _compare(lower, upper)
+                if order == 1 or (order == 0 and not (
+                        lower_inclusive and upper_inclusive)):
+                    return True
+    return False
+
+
+def _normalize_and(clauses):
+    """
+    Normalize a conjunction.
+
+    Args:
+        clauses (list): LightBlue query expressions
+
+    Returns:
+        dict: LightBlue query, NEVER if it cannot match
+    """
+    flat = []
+    for clause in clauses:
+        clause = normalize(clause)
+        if clause is NEVER:
+            return NEVER
+        flat.extend(clause['$and'] if '$and' in clause else [clause])
+    flat = _unique(flat)
+    if _contradicts(flat):
+        return NEVER
+    # intersect $in clauses of the same field
+    merged = []
+    positions = {}
+    uncertain = _uncertain_fields(flat)
+    for clause in flat:
+        if _is_value(clause, IN_OPS) and clause['field'] not in uncertain:
+            field = clause['field']
+            if field in positions:
+                allowed = set(
+                    canonical_json(value) for value in _values(clause))
+                previous = merged[positions[field]]
+                merged[positions[field]] = _in(field, [
+                    value for value in _values(previous)
+                    if canonical_json(value) in allowed
+                ])
+                continue
+            positions[field] = len(merged)
+        merged.append(clause)
+    if len(merged) == 1:
+        return merged[0]
+    return {'$and': merged}
+
+
+def _normalize_or(clauses):
+    """
+    Normalize a disjunction.
+
+    Args:
+        clauses (list): LightBlue query expressions
+
+    Returns:
+        dict: LightBlue query, NEVER if it cannot match
+    """
+    flat = []
+    for clause in clauses:
+        clause = normalize(clause)
+        if clause is NEVER:
+            continue
+        flat.extend(clause['$or'] if '$or' in clause else [clause])
+    flat = _unique(flat)
+    if not flat:
+        return NEVER
+    # merge equalities and $in clauses of the same field
+    merged = []
+    positions = {}
+    for clause in flat:
+        if _is_value(clause, EQUAL_OPS + IN_OPS):
+            field = clause['field']
+            if field in positions:
+                previous = merged[positions[field]]
+                merged[positions[field]] = _in(
+                    field, _unique(_values(previous) + _values(clause)))
+                continue
+            positions[field] = len(merged)
+        merged.append(clause)
+    if len(merged) == 1:
+        return merged[0]
+    return {'$or': merged}
+
+
+def normalize(query):
+    """
+    Normalize a LightBlue query.
+
+    Args:
+        query (dict): LightBlue query
+
+    Returns:
+        dict: normalized query, NEVER if no document can match
+    """
+    if '$and' in query:
+        return _normalize_and(query['$and'])
+    if '$all' in query:
+        return _normalize_and(query['$all'])
+    if '$or' in query:
+        return _normalize_or(query['$or'])
+    if '$any' in query:
+        return _normalize_or(query['$any'])
+    if '$not' in query:
+        inner = normalize(query['$not'])
+        return {'$not': query['$not'] if inner is NEVER else inner}
+    if _is_value(query, IN_OPS):
+        values = _unique(_values(query))
+        return _in(query['field'], values) if values else NEVER
+    return query
@@ -0,0 +1,247 @@
+"""
+Opt-in per-stage profiling of LightBlue calls.
+
+Usage:
+    with profile() as profiler:
+        selection.all
+    print(profiler.report())
+
+Each selection call records wall and CPU time of its stages (query
+building, JSON encoding, limiter queue, HTTP round trip with retries,
+JSON decoding, check_response, dpath selection and postprocess). Stages
+are no-ops when no profiler is active.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from lightblue.common import monotonic
+
+STAGES = (
+    'query',
+    'encode',
+    'queue',
+    'http',
+    'decode',
+    'check_response',
+    'select',
+    'postprocess',
+)
+
+# CPU time of the current thread (Python 3.7+), process CPU time otherwise
+_cpu_time = getattr(time, 'thread_time', None) or \
+    getattr(time, 'process_time', None) or time.clock
+
+_LOCAL = threading.local()
+
+
+class CallProfile(object):
+    """
+    Stage timings of one call.
+
+    Attributes:
+        name (str): call name (find/update/delete)
+        stages (OrderedDict): stage name -> [wall time, CPU time]
+    """
+
+    def __init__(self, name):
+        """
+        Initialize a CallProfile object.
+
+        Args:
+            name (str): call name
+        """
+        self.name = name
+        self.stages = OrderedDict()
+
+    def add(self, stage_name, wall, cpu):
+        """
+        Add time spent in a stage.
+
+        Args:
+            stage_name (str): stage name
+            wall (float): wall time in seconds
+            cpu (float): CPU time in seconds
+        """
+        times = self.stages.setdefault(stage_name, [0.0, 0.0])
+        times[0] += wall
+        times[1] += cpu
+
+    @property
+    def wall(self):
+        """
+        Wall time of all stages.
+
+        Returns:
+            float: seconds
+        """
+        return sum(times[0] for times in self.stages.values())
+
+    def as_dict(self):
+        """
+        Stage timings as a dict.
+
+        Returns:
+            dict: stage name -> {'wall': float, 'cpu': float}
+        """
+        return dict(
+            (name, {'wall': times[0], 'cpu': times[1]})
+            for name, times in self.stages.items()
+        )
+
+
+class Profiler(object):
+    """
+    Collects call profiles and aggregates them.
+
+    Attributes:
+        calls (list): CallProfile objects
+    """
+
+    def __init__(self):
+        """Initialize a Profiler object."""
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add_call(self, call):
+        """
+        Save profile of a finished call.
+
+        Args:
+            call (CallProfile): call profile
+        """
+        with self._lock:
+            self.calls.append(call)
+
+    def aggregate(self):
+        """
+        Aggregate stage timings across calls.
+
+        Returns:
+            OrderedDict: stage name -> dict with count, wall, cpu
+                and wall_max (known stages first)
+        """
+        result = OrderedDict()
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            for name, (wall, cpu) in call.stages.items():
+                stats = result.setdefault(name, {
+                    'count': 0, 'wall': 0.0, 'cpu': 0.0, 'wall_max': 0.0})
+                stats['count'] += 1
+                stats['wall'] += wall
+                stats['cpu'] += cpu
+                stats['wall_max'] = max(stats['wall_max'], wall)
+        ordered = [name for name in STAGES if name in result] + \
+            [name for name in result if name not in STAGES]
+        return OrderedDict((name, result[name]) for name in ordered)
+
+    def report(self):
+        """
+        Text report of aggregated stage timings.
+
+        Returns:
+            str: table with one line per stage
+        """
+        aggregated = self.aggregate()
+        total = sum(stats['wall'] for stats in aggregated.values()) or 1
+        header = '{:<16}{:>7}{:>12}{:>12}{:>12}{:>8}'
+        row = '{:<16}{:>7}{:>12.3f}{:>12.3f}{:>12.3f}{:>8.1f}'
+        lines = [header.format(
+            'stage', 'calls', 'wall [ms]', 'avg [ms]', 'cpu [ms]', 'wall%')]
+        for name, stats in aggregated.items():
+            lines.append(row.format(
+                name,
+                stats['count'],
+                stats['wall'] * 1000,
+                stats['wall'] * 1000 / stats['count'],
+                stats['cpu'] * 1000,
+                stats['wall'] * 100 / total,
+            ))
+        return '\n'.join(lines)
+
+
+def active_profiler():
+    """
+    Profiler active in the current thread.
+
+    Returns:
+        Profiler: profiler or None
+    """
+    return getattr(_LOCAL, 'profiler', None)
+
+
+@contextmanager
+def profile(profiler=None):
+    """
+    Profile calls made in the block.
+
+    Args:
+        profiler (Profiler, optional): profiler to add calls to
+            (to aggregate several blocks)
+
+    Yields:
+        Profiler: active profiler
+    """
+    profiler = profiler or Profiler()
+    previous = active_profiler()
+    _LOCAL.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _LOCAL.profiler = previous
+
+
+@contextmanager
+def profiled_call(name):
+    """
+    Record stages of a call (nested calls are part of the outer one).
+
+    Args:
+        name (str): call name
+
+    Yields:
+        CallProfile: call profile, None if profiling is not active
+    """
+    profiler = active_profiler()
+    if profiler is None or getattr(_LOCAL, 'call', None) is not None:
+        yield getattr(_LOCAL, 'call', None)
+        return
+    call = _LOCAL.call = CallProfile(name)
+    try:
+        yield call
+    finally:
+        _LOCAL.call = None
+        profiler.add_call(call)
+
+
+@contextmanager
+def stage(name):
+    """
+    Measure wall and CPU time of a stage of the current call.
+
+    Args:
+        name (str): stage name
+    """
+    call = getattr(_LOCAL, 'call', None)
+    if call is None:
+        yield
+        return
+    wall, cpu = monotonic(), _cpu_time()
+    try:
+        yield
+    finally:
+        call.add(name, monotonic() - wall, _cpu_time() - cpu)
+
+
+def is_active():
+    """
+    Stages of a call are recorded in the current thread.
+
+    Returns:
+        bool: True if a profiled call is in progress
+    """
+    return getattr(_LOCAL, 'call', None) is not None
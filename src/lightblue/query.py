@@ -1,5 +1,8 @@
 """LightBlueQuery implementation."""
 
+from lightblue.normalize import NEVER, normalize
+from lightblue.profiling import stage
+
 
 class IncompleteQuery(Exception):
     """Attempt to execute a query to LightBlue (w/o proper data)."""
@@ -22,8 +25,13 @@ class LightBlueQuery(object):
     Attributes:
         interface (lightblue.entity.LightBlueEntity):
             wrapper to query a LightBlue method
+        normalize_queries (bool): normalize query before sending
+            (see lightblue.normalize), queries which can never match
+            are not sent at all
     """
 
+    normalize_queries = False
+
     def __init__(self,
                  interface,
                  *args, **kwargs):
@@ -215,14 +223,18 @@ class LightBlueQuery(object):
         Construct LightBlue query.
 
         Returns:
-            dict: LightBlue query
+            dict: LightBlue query (NEVER if normalized query
+                can never match)
         """
         dict_queries = [{
             'field': query[0],
             'op': query[1],
             'rvalue': query[2]
         } for query in self._queries]
-        return self._and(*(dict_queries + self._raw_queries))
+        query = self._and(*(dict_queries + self._raw_queries))
+        if self.normalize_queries:
+            return normalize(query)
+        return query
 
     @property
     def _has_projection(self):
@@ -283,23 +295,50 @@ class LightBlueQuery(object):
             result['$append'] = self._update_append
         return result
 
+    @staticmethod
+    def _empty_response():
+        """
+        Response of a query which can never match (not sent to LB).
+
+        Returns:
+            dict: LightBlue-like response without any items
+        """
+        return {
+            'status': 'COMPLETE',
+            'modifiedCount': 0,
+            'matchCount': 0,
+            'processed': [],
+        }
+
+    def _advise(self):
+        """Check index usage if the interface has an index advisor."""
+        advisor = getattr(self.interface, 'index_advisor', None)
+        if advisor is not None:
+            advisor.check(self)
+
     def find(self):
         """
         Execute find call to LightBlue.
 
         Returns: raw response from LB
         """
-        if self._has_query:
-            if self._has_projection:
+        self._advise()
+        with stage('query'):
+            query = self._query if self._has_query else None
+            projection = self._projection if self._has_projection else None
+        if query is NEVER:
+            return self._empty_response()
+        if query is not None:
+            if projection is not None:
                 return self.interface.find_item(
-                    self._query,
-                    projection=self._projection)
+                    query,
+                    projection=projection)
             else:
-                return self.interface.find_item(self._query)
+                return self.interface.find_item(query)
         else:
-            if self._has_projection:
+            if projection is not None:
                 return self.interface.find_all(
-                    projection=self._projection)
+                    projection=projection)
             else:
                 return self.interface.find_all()
 
@@ -317,8 +356,12 @@ class LightBlueQuery(object):
             raise LockedQuery()
         if self._has_query and self._has_update:
             self._locked = True
-            return self.interface.update_item(
-                self._query, self._update)
+            self._advise()
+            with stage('query'):
+                query, update = self._query, self._update
+            if query is NEVER:
+                return self._empty_response()
+            return self.interface.update_item(query, update)
         else:
             raise IncompleteQuery()
 
@@ -338,7 +381,12 @@ class LightBlueQuery(object):
             raise LockedQuery()
         if self._has_query:
             self._locked = True
-            return self.interface.delete_item(self._query)
+            self._advise()
+            with stage('query'):
+                query = self._query
+            if query is NEVER:
+                return self._empty_response()
+            return self.interface.delete_item(query)
         else:
             raise IncompleteQuery()
 
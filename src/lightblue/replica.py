@@ -0,0 +1,467 @@
+"""
+Local SQLite read replica of an entity.
+
+The replica loads all documents of an entity into SQLite with one indexed
+column per configured field. It can be used as the interface of
+LightBlueQuery/LightBlueGenericSelection - find requests using only
+indexed fields (equality, range, $in/$nin, $and/$or/$not) are answered
+locally, anything else is sent to the server. Other entity methods are
+delegated to the entity.
+
+Negations match documents without the field, as on the server. Fields
+holding arrays or objects in any document, and values which cannot be
+coerced to the type of a field, are left to the server.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+
+import dpath.util
+
+from lightblue.common import monotonic, value_kind
+from lightblue.validation import INTEGER_TYPES, STRING_TYPES
+
+LOGGER = logging.getLogger('lightblue')
+
+SQL_OPS = {
+    '=': '=', '$eq': '=',
+    '!=': '!=', '$neq': '!=',
+    '<': '<', '$lt': '<',
+    '>': '>', '$gt': '>',
+    '<=': '<=', '$lte': '<=',
+    '>=': '>=', '$gte': '>=',
+}
+IN_OPS = {'$in': 'IN', '$nin': 'NOT IN', '$not_in': 'NOT IN'}
+SCALAR_TYPES = (bool, float, type(None)) + INTEGER_TYPES + STRING_TYPES
+
+
+class UnsupportedQuery(Exception):
+    """Query cannot be answered by the replica."""
+
+    pass
+
+
+def field_value(document, field, scalar=True):
+    """
+    Get value of a dotted path (without array indexes).
+
+    Args:
+        document (dict): document
+        field (str): dotted path
+        scalar (bool): return None for arrays and objects
+
+    Returns:
+        object: value, None if missing (or not a scalar)
+    """
+    value = document
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    if scalar and not isinstance(value, SCALAR_TYPES):
+        return None
+    return value
+
+
+def coerce_value(value, kind):
+    """
+    Coerce a query value to the type of a field (as LightBlue does).
+
+    Args:
+        value (object): rvalue or one of values
+        kind (str/None): type category of the field values
+            (see lightblue.common.value_kind), None if unknown
+
+    Returns:
+        object: coerced value
+
+    Raises:
+        UnsupportedQuery: value cannot be coerced reliably
+    """
+    value_type = value_kind(value)
+    if value is None or kind is None or value_type == kind:
+        return value
+    if kind == 'number' and value_type == 'string':
+        for number in (int, float):
+            try:
+                return number(value)
+            except ValueError:
+                pass
+    elif kind == 'string' and value_type == 'number' and \
+            not isinstance(value, float):
+        return str(value)
+    elif kind == 'bool' and value_type == 'string' and \
+            value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    raise UnsupportedQuery('Cannot coerce {!r} to {}'.format(value, kind))
+
+
+class LocalReplica(object):
+    """
+    Read replica of an entity in SQLite.
+
+    Attributes:
+        entity (lightblue.entity.LightBlueEntity): replicated entity
+        indexes (tuple): indexed fields (dotted paths)
+        loaded_at (float/None): monotonic time of the last load
+        stats (dict): counts of 'local' and 'remote' finds
+    """
+
+    def __init__(self,
+                 entity,
+                 indexes,
+                 path=':memory:',
+                 page_size=1000,
+                 refresh_interval=None):
+        """
+        Initialize a LocalReplica object.
+
+        Args:
+            entity (lightblue.entity.LightBlueEntity): replicated entity
+            indexes (list): fields to index (dotted paths)
+            path (str): SQLite database file (in memory by default)
+            page_size (int): max documents per find request of a load
+            refresh_interval (float, optional): reload periodically
+                on a background thread (seconds)
+        """
+        self.entity = entity
+        self.indexes = tuple(indexes)
+        self.page_size = page_size
+        self.loaded_at = None
+        self.stats = {'local': 0, 'remote': 0}
+        # type categories of values of the indexed fields
+        self._kinds = {}
+        # indexed fields with array or object values (not answered locally)
+        self._non_scalar = set()
+        self._columns = dict(
+            (field, 'f{}'.format(position))
+            for position, field in enumerate(self.indexes)
+        )
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_table()
+        self._stop = threading.Event()
+        self._thread = None
+        if refresh_interval:
+            self._thread = threading.Thread(
+                target=self._refresh_loop, args=(refresh_interval, ),
+                name='lightblue-replica')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __getattr__(self, name):
+        # entity_name, version, check_response, insert_data, ...
+        if name == 'entity':
+            raise AttributeError(name)
+        return getattr(self.entity, name)
+
+    def _create_table(self):
+        """Create documents table with indexed columns."""
+        columns = ''.join(
+            ', {} '.format(self._columns[field]) for field in self.indexes)
+        with self._lock:
+            self._connection.execute('DROP TABLE IF EXISTS documents')
+            self._connection.execute(
+                'CREATE TABLE documents '
+                '(id INTEGER PRIMARY KEY, document TEXT{})'.format(columns))
+            for field in self.indexes:
+                self._connection.execute(
+                    'CREATE INDEX index_{0} ON documents ({0})'.format(
+                        self._columns[field]))
+            self._connection.commit()
+
+    @property
+    def loaded(self):
+        """
+        Replica was loaded.
+
+        Returns:
+            bool: True if it can answer queries
+        """
+        return self.loaded_at is not None
+
+    def refresh(self):
+        """
+        Reload all documents of the entity.
+
+        Returns:
+            bool: True if documents were loaded
+        """
+        documents = self.entity.find_paginated(
+            self.page_size, self.entity.find_all)
+        if documents is None:
+            LOGGER.error('Replica of %s was not refreshed',
+                         self.entity.entity_name)
+            return False
+        rows = [
+            [json.dumps(document)] +
+            [field_value(document, field) for field in self.indexes]
+            for document in documents
+        ]
+        kinds = dict((field, set()) for field in self.indexes)
+        non_scalar = set()
+        for document in documents:
+            for field in self.indexes:
+                value = field_value(document, field, scalar=False)
+                if value is None:
+                    continue
+                kind = value_kind(value)
+                if kind == 'other':
+                    non_scalar.add(field)
+                kinds[field].add(kind)
+        insert = 'INSERT INTO documents (document{}) VALUES (?{})'.format(
+            ''.join(', ' + self._columns[field] for field in self.indexes),
+            ', ?' * len(self.indexes))
+        with self._lock:
+            # single transaction - readers see old or new documents
+            with self._connection:
+                self._connection.execute('DELETE FROM documents')
+                self._connection.executemany(insert, rows)
+            self._kinds = dict(
+                (field, field_kinds.pop() if len(field_kinds) == 1 else None)
+                for field, field_kinds in kinds.items())
+            self._non_scalar = non_scalar
+            self.loaded_at = monotonic()
+        LOGGER.debug('Replica of %s loaded with %s documents',
+                     self.entity.entity_name, len(rows))
+        return True
+
+    def _refresh_loop(self, interval):
+        """
+        Reload documents until close() is called.
+
+        Args:
+            interval (float): seconds between loads
+        """
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                LOGGER.exception('Replica of %s was not refreshed',
+                                 self.entity.entity_name)
+            self._stop.wait(interval)
+
+    def close(self):
+        """Stop periodic refresh and close the database."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._connection.close()
+
+    def _column(self, field):
+        """
+        Column of an indexed field.
+
+        Args:
+            field (str): dotted path
+
+        Returns:
+            str: column name
+
+        Raises:
+            UnsupportedQuery: field is not indexed
+        """
+        if field not in self._columns:
+            raise UnsupportedQuery('{} is not indexed'.format(field))
+        if field in self._non_scalar:
+            raise UnsupportedQuery('{} holds arrays or objects'.format(field))
+        return self._columns[field]
+
+    def _where(self, query, params):
+        """
+        Translate LightBlue query to SQL condition.
+
+        Args:
+            query (dict): LightBlue query
+            params (list): list to append SQL parameters to
+
+        Returns:
+            str: SQL condition
+
+        Raises:
+            UnsupportedQuery: query cannot be answered locally
+        """
+        if '$and' in query or '$all' in query:
+            clauses = query.get('$and') or query.get('$all')
+            if not clauses:
+                return '1'
+            return '(' + ' AND '.join(
+                self._where(clause, params) for clause in clauses) + ')'
+        if '$or' in query or '$any' in query:
+            clauses = query.get('$or') or query.get('$any')
+            if not clauses:
+                return '0'
+            return '(' + ' OR '.join(
+                self._where(clause, params) for clause in clauses) + ')'
+        if '$not' in query:
+            # comparisons with missing fields are NULL - count them as false
+            return 'NOT COALESCE({}, 0)'.format(
+                self._where(query['$not'], params))
+        if 'field' not in query or 'rfield' in query:
+            raise UnsupportedQuery('Unsupported expression')
+        field, op = query['field'], query.get('op')
+        if field == 'objectType' and op in ('=', '$eq'):
+            return '1' if query.get('rvalue') == \
+                self.entity.entity_name else '0'
+        column = self._column(field)
+        kind = self._kinds.get(field)
+        if op in SQL_OPS and isinstance(query.get('rvalue'), SCALAR_TYPES):
+            if query['rvalue'] is None:
+                return '{} IS {}NULL'.format(
+                    column, '' if SQL_OPS[op] == '=' else 'NOT ')
+            params.append(coerce_value(query['rvalue'], kind))
+            if SQL_OPS[op] == '!=':
+                # documents without the field match a negation
+                return '({0} != ? OR {0} IS NULL)'.format(column)
+            return '{} {} ?'.format(column, SQL_OPS[op])
+        if op in IN_OPS and isinstance(query.get('values'), list):
+            values = query['values']
+            if not values:
+                return '0' if IN_OPS[op] == 'IN' else '1'
+            params.extend(coerce_value(value, kind) for value in values)
+            condition = '{} {} ({})'.format(
+                column, IN_OPS[op], ', '.join('?' * len(values)))
+            if IN_OPS[op] == 'NOT IN':
+                return '({} OR {} IS NULL)'.format(condition, column)
+            return condition
+        raise UnsupportedQuery('Unsupported operator {}'.format(op))
+
+    def _order(self, sort):
+        """
+        Translate LightBlue sort to SQL ORDER BY.
+
+        Args:
+            sort (dict/list/None): LightBlue sort
+
+        Returns:
+            str: ORDER BY clause
+
+        Raises:
+            UnsupportedQuery: sort by a field which is not indexed
+        """
+        if sort is None:
+            return ' ORDER BY id'
+        keys = []
+        for key in (sort if isinstance(sort, list) else [sort]):
+            for field, direction in key.items():
+                keys.append('{} {}'.format(
+                    self._column(field),
+                    'DESC' if direction == '$desc' else 'ASC'))
+        return ' ORDER BY ' + ', '.join(keys + ['id'])
+
+    @staticmethod
+    def _project(document, projection):
+        """
+        Apply inclusive projection to a document.
+
+        Args:
+            document (dict): document
+            projection (dict/list/None): LightBlue projection
+
+        Returns:
+            dict: projected document
+
+        Raises:
+            UnsupportedQuery: exclusive or unsupported projection
+        """
+        if projection is None:
+            return document
+        projection = projection if isinstance(projection, list) \
+            else [projection]
+        if any(not item.get('include', True) or 'field' not in item
+               for item in projection):
+            raise UnsupportedQuery('Unsupported projection')
+        if any(item['field'] == '*' for item in projection):
+            return document
+        result = {}
+        for item in projection:
+            found = dpath.util.search(
+                document, item['field'].replace('.', '/'))
+            dpath.util.merge(result, found)
+        return result
+
+    def _find_local(self, query, projection, from_, max_results, sort):
+        """
+        Answer find request from the replica.
+
+        Returns:
+            dict: LightBlue-like response
+
+        Raises:
+            UnsupportedQuery: request cannot be answered locally
+        """
+        params = []
+        where = ' FROM documents WHERE ' + self._where(query, params)
+        sql = 'SELECT document' + where + self._order(sort)
+        paged = max_results is not None or from_
+        if paged:
+            sql += ' LIMIT ? OFFSET ?'
+        with self._lock:
+            rows = self._connection.execute(
+                sql, params + [-1 if max_results is None else max_results,
+                               from_ or 0] if paged else params).fetchall()
+            # matchCount is the count of all matching documents
+            match_count = self._connection.execute(
+                'SELECT COUNT(*)' + where, params).fetchone()[0] \
+                if paged else len(rows)
+        processed = [
+            self._project(json.loads(row[0]), projection) for row in rows
+        ]
+        return {
+            'status': 'COMPLETE',
+            'modifiedCount': 0,
+            'matchCount': match_count,
+            'processed': processed,
+        }
+
+    def find_item(self, query, projection=None, from_=None,
+                  max_results=None, sort=None):
+        """
+        Find documents locally, fall back to the server.
+
+        Args:
+            query (dict): search query
+            projection (list): specify field which will be returned
+                (default - return all)
+            from_: from item in query
+            max_results: limit results count in response
+            sort (dict/list): LightBlue sort
+
+        Returns:
+            dict: result of search query
+        """
+        if self.loaded:
+            try:
+                response = self._find_local(
+                    query, projection, from_, max_results, sort)
+            except UnsupportedQuery as exc:
+                LOGGER.debug('Replica of %s cannot answer query - %s',
+                             self.entity.entity_name, exc)
+            else:
+                self.stats['local'] += 1
+                return response
+        self.stats['remote'] += 1
+        return self.entity.find_item(
+            query, projection=projection, from_=from_,
+            max_results=max_results, sort=sort)
+
+    def find_all(self, projection=None, from_=None, max_results=None):
+        """
+        Find all documents of the entity.
+
+        Args:
+            projection (list): custom projection (default return all items)
+            from_: from item in query
+            max_results: limit results count in response
+
+        Returns:
+            dict: result of search query
+        """
+        return self.find_item(
+            {'field': 'objectType', 'op': '=',
+             'rvalue': self.entity.entity_name},
+            projection=projection, from_=from_, max_results=max_results)
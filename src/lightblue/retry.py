@@ -0,0 +1,298 @@
+"""
+Idempotency-aware retry policy and circuit breaker for LightBlueService.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from email.utils import parsedate_tz, mktime_tz
+
+from lightblue.common import PicklableConfig, monotonic
+
+LOGGER = logging.getLogger('lightblue')
+
+# operations which are safe to retry (no side effects on the server)
+IDEMPOTENT_OPERATIONS = ('find', 'get_schema')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Request rejected, because the backend is considered unhealthy."""
+
+    pass
+
+
+class RetryBudget(PicklableConfig):
+    """
+    Limits retries to a ratio of requests.
+
+    Each request deposits `ratio` tokens, each retry takes one token.
+    """
+
+    def __init__(self, ratio=0.2, max_tokens=10):
+        """
+        Initialize a RetryBudget object.
+
+        Args:
+            ratio (float): retries allowed per request
+            max_tokens (float): max retries saved up in quiet periods
+        """
+        self.ratio = ratio
+        self.max_tokens = float(max_tokens)
+        self._tokens = self.max_tokens
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Replace the lock inherited from the parent process."""
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Add share of one request."""
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self):
+        """
+        Take a token for one retry.
+
+        Returns:
+            bool: True if the retry fits into the budget
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy(PicklableConfig):
+    """
+    Per-operation retry rules with full-jitter backoff.
+
+    Attributes:
+        max_attempts (int): attempts including the first one
+        retry_statuses (tuple): HTTP statuses which are retried
+        operations (tuple): retried operation types
+    """
+
+    def __init__(self,
+                 max_attempts=3,
+                 retry_statuses=(500, 502, 503, 504),
+                 backoff_base=0.1,
+                 backoff_max=10,
+                 retry_writes=False,
+                 operations=None,
+                 respect_retry_after=True,
+                 max_retry_after=30,
+                 budget=None):
+        """
+        Initialize a RetryPolicy object.
+
+        Args:
+            max_attempts (int): attempts including the first one
+            retry_statuses (tuple): HTTP statuses which are retried
+            backoff_base (float): backoff of the first retry
+            backoff_max (float): max backoff
+            retry_writes (bool): retry insert/update/delete as well
+                (may duplicate documents)
+            operations (tuple, optional): retried operation types,
+                overrides retry_writes
+            respect_retry_after (bool): wait as long as the server asks
+                in the Retry-After header
+            max_retry_after (float): max Retry-After wait
+            budget (RetryBudget, optional): retry budget,
+                defaults to 20% of requests
+        """
+        self.max_attempts = max_attempts
+        self.retry_statuses = tuple(retry_statuses)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        if operations is None:
+            operations = IDEMPOTENT_OPERATIONS
+            if retry_writes:
+                operations += ('insert', 'update', 'delete', 'save')
+        self.operations = tuple(operations)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def applies_to(self, operation):
+        """
+        Operation can be retried.
+
+        Args:
+            operation (str): operation type
+
+        Returns:
+            bool: True if operation is retried
+        """
+        return operation in self.operations
+
+    def backoff(self, attempt):
+        """
+        Full-jitter backoff.
+
+        Args:
+            attempt (int): number of the failed attempt (from 1)
+
+        Returns:
+            float: seconds to wait
+        """
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def retry_after(response):
+        """
+        Parse Retry-After header (seconds or HTTP date).
+
+        Args:
+            response (object): response object
+
+        Returns:
+            float: seconds to wait, None if header is missing or invalid
+        """
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            parsed = parsedate_tz(value)
+            if parsed is None:
+                return None
+            return max(mktime_tz(parsed) - time.time(), 0.0)
+
+    def delay(self, attempt, response=None, deadline=None):
+        """
+        Get delay before the next attempt.
+
+        Args:
+            attempt (int): number of the failed attempt (from 1)
+            response (object, optional): failed response
+                (None for timeouts and connection errors)
+            deadline (Deadline, optional): deadline of the call
+
+        Returns:
+            float: seconds to wait, None if the request
+                shouldn't be retried
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if response is not None and \
+           response.status_code not in self.retry_statuses:
+            return None
+        delay = None
+        if response is not None and self.respect_retry_after:
+            delay = self.retry_after(response)
+            if delay is not None and delay > self.max_retry_after:
+                return None
+        if delay is None:
+            delay = self.backoff(attempt)
+        if deadline is not None and delay >= deadline.remaining():
+            return None
+        if not self.budget.withdraw():
+            LOGGER.debug("Retry budget exhausted")
+            return None
+        return delay
+
+
+class CircuitBreaker(PicklableConfig):
+    """
+    Fails fast while the backend is unhealthy.
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests are rejected for recovery_timeout seconds. Then a limited
+    count of trial requests is let through (half-open state), a success
+    closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self,
+                 failure_threshold=5,
+                 recovery_timeout=30,
+                 half_open_max_calls=1):
+        """
+        Initialize a CircuitBreaker object.
+
+        Args:
+            failure_threshold (int): consecutive failures to open
+            recovery_timeout (float): seconds before trial requests
+            half_open_max_calls (int): concurrent trial requests
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_calls = 0
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """
+        Replace the lock inherited from the parent process and drop its
+        trial requests (they are not running in this process).
+        """
+        self._lock = threading.Lock()
+        self._trial_calls = 0
+
+    @property
+    def state(self):
+        """
+        Current state.
+
+        Returns:
+            str: 'closed', 'open' or 'half_open'
+        """
+        with self._lock:
+            if self._state == OPEN and \
+               monotonic() - self._opened_at >= self.recovery_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def before_request(self):
+        """
+        Check a request can be sent.
+
+        Raises:
+            CircuitOpenError: the circuit is open
+        """
+        with self._lock:
+            if self._state == OPEN:
+                if monotonic() - self._opened_at < self.recovery_timeout:
+                    raise CircuitOpenError('Circuit breaker is open')
+                self._state = HALF_OPEN
+                self._trial_calls = 0
+            if self._state == HALF_OPEN:
+                if self._trial_calls >= self.half_open_max_calls:
+                    raise CircuitOpenError('Circuit breaker is half-open')
+                self._trial_calls += 1
+
+    def record(self, success):
+        """
+        Record outcome of a request.
+
+        Args:
+            success (bool): False for 5xx responses, timeouts
+                and connection errors
+        """
+        with self._lock:
+            if success:
+                if self._state != CLOSED:
+                    LOGGER.info("Circuit breaker closed")
+                self._state = CLOSED
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or \
+               self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    LOGGER.warning("Circuit breaker opened after %s failures",
+                                   self._failures)
+                self._state = OPEN
+                self._opened_at = monotonic()
@@ -1,7 +1,13 @@
 """LightBlueGenericSelection implementation."""
 
+import copy
+
 import dpath.util
 
+from lightblue.common import deadline
+from lightblue.diff import diff
+from lightblue.normalize import NEVER
+from lightblue.profiling import profiled_call, stage
 from lightblue.query import LightBlueQuery
 
 
@@ -11,6 +17,11 @@ class LightBlueGenericSelection(LightBlueQuery):
 
     (isn't specific to any LightBlue entity)
 
+    The find response is memoized - first, all, exist and find() with any
+    postprocessing share one request until refresh() is called, the query
+    or projection is changed, or items are updated or deleted through the
+    selection.
+
     Attributes:
         interface (lightblue.entity.LightBlueEntity):
             wrapper to query a LightBlue method
@@ -27,6 +38,12 @@ class LightBlueGenericSelection(LightBlueQuery):
             **kwargs: Description
         """
         self.interface = kwargs.pop('interface')
+        # time budget (seconds) for each call made by the selection
+        self._deadline = None
+        # stage timings of the last call (only when profiling is active)
+        self.last_profile = None
+        # memoized find response
+        self._find_response = None
 
         super(LightBlueGenericSelection, self).__init__(
             self.interface, *args, **kwargs)
@@ -63,7 +80,9 @@ class LightBlueGenericSelection(LightBlueQuery):
         """
         # check response
         if check_response:
-            if not self.interface.check_response(result):
+            with stage('check_response'):
+                valid = self.interface.check_response(result)
+            if not valid:
                 return fallback
         # check count
         if count:
@@ -78,12 +97,14 @@ class LightBlueGenericSelection(LightBlueQuery):
                     return fallback
         # return value (by selector) or result
         if selector:
-            try:
-                result = dpath.util.get(result, selector)
-            except ValueError:
-                result = dpath.util.values(result, selector)
+            with stage('select'):
+                try:
+                    result = dpath.util.get(result, selector)
+                except ValueError:
+                    result = dpath.util.values(result, selector)
         if postprocess:
-            postprocess_result = postprocess(result)
+            with stage('postprocess'):
+                postprocess_result = postprocess(result)
             if postprocess_result is None:
                 return fallback
             else:
@@ -102,8 +123,16 @@ class LightBlueGenericSelection(LightBlueQuery):
         Returns:
             object: as returned by _postprocessing()
         """
-        result = super(LightBlueGenericSelection, self).find()
-        return self._postprocessing(result, *args, **kwargs)
+        with profiled_call('find') as call, deadline(self._deadline):
+            if call is not None:
+                self.last_profile = call
+            if self._find_response is None:
+                self._find_response = super(
+                    LightBlueGenericSelection, self).find()
+            # callers and postprocess get a copy, the memoized response
+            # must not change with them
+            result = copy.deepcopy(self._find_response)
+            return self._postprocessing(result, *args, **kwargs)
 
     def update(self, *args, **kwargs):
         """
@@ -116,8 +145,12 @@ class LightBlueGenericSelection(LightBlueQuery):
         Returns:
             object: as returned by _postprocessing()
         """
-        result = super(LightBlueGenericSelection, self).update()
-        return self._postprocessing(result, *args, **kwargs)
+        with profiled_call('update') as call, deadline(self._deadline):
+            if call is not None:
+                self.last_profile = call
+            self._find_response = None
+            result = super(LightBlueGenericSelection, self).update()
+            return self._postprocessing(result, *args, **kwargs)
 
     def delete(self, *args, **kwargs):
         """
@@ -130,11 +163,73 @@ class LightBlueGenericSelection(LightBlueQuery):
         Returns:
             object: as returned by _postprocessing()
         """
-        result = super(LightBlueGenericSelection, self).delete()
-        return self._postprocessing(result, *args, **kwargs)
+        with profiled_call('delete') as call, deadline(self._deadline):
+            if call is not None:
+                self.last_profile = call
+            self._find_response = None
+            result = super(LightBlueGenericSelection, self).delete()
+            return self._postprocessing(result, *args, **kwargs)
+
+    def refresh(self):
+        """
+        Forget the memoized find response, the next access sends a request.
+
+        Allows method chaining, returns self.
+        """
+        self._find_response = None
+        return self
+
+    # changes of the query or projection invalidate the find response
+    def _add_to_query(self, *args, **kwargs):
+        self._find_response = None
+        super(LightBlueGenericSelection, self)._add_to_query(*args, **kwargs)
+
+    def add_raw_query(self, query):
+        self._find_response = None
+        super(LightBlueGenericSelection, self).add_raw_query(query)
+
+    def _add_to_projection(self, *args, **kwargs):
+        self._find_response = None
+        super(LightBlueGenericSelection, self)._add_to_projection(
+            *args, **kwargs)
+
+    def _refresh(self):
+        self._find_response = None
+        super(LightBlueGenericSelection, self)._refresh()
 
     # .insert() method is public, without any changes
 
+    @staticmethod
+    def save(data, interface, upsert=False):
+        """
+        Save (replace) items of the collection.
+
+        Args:
+            data (dict/list): items as required by a schema
+            interface (lightblue.entity.LightBlueEntity):
+                wrapper to query LightBlue methods
+            upsert (bool, optional): insert items which do not exist yet
+
+        Returns:
+            dict: raw response from LB
+        """
+        return interface.save(data, upsert=upsert)
+
+    @staticmethod
+    def upsert(data, interface):
+        """
+        Save items of the collection, insert those which do not exist yet.
+
+        Args:
+            data (dict/list): items as required by a schema
+            interface (lightblue.entity.LightBlueEntity):
+                wrapper to query LightBlue methods
+
+        Returns:
+            dict: raw response from LB
+        """
+        return interface.upsert(data)
+
     @staticmethod
     def get_selector_query(data, primary_keys):
         """
@@ -177,6 +272,35 @@ class LightBlueGenericSelection(LightBlueQuery):
         self._add_to_projection('_id')
         return self
 
+    def within(self, seconds):
+        """
+        Set end-to-end deadline for calls made by the selection.
+
+        The deadline is shared by every request (and retry) of a call.
+
+        Args:
+            seconds (float): time budget of a call
+
+        Allows method chaining, returns self.
+        """
+        self._deadline = seconds
+        return self
+
+    def normalized(self, enabled=True):
+        """
+        Normalize query before sending it (see lightblue.normalize).
+
+        Queries which can never match are answered without a request.
+
+        Args:
+            enabled (bool): normalize queries
+
+        Allows method chaining, returns self.
+        """
+        self.normalize_queries = enabled
+        self._find_response = None
+        return self
+
     def filter_created_by(self, service):
         """
         Select items created by specific service.
@@ -246,6 +370,56 @@ class LightBlueGenericSelection(LightBlueQuery):
         self._add_to_update(_set=data)
         return self.update()
 
+    def update_changes(self, original, modified):
+        """
+        Update item with changes between two versions of a document.
+
+        Only changed paths are sent ($set, $unset and $append).
+        Skips update if documents are equal.
+
+        Args:
+            original (dict): document as previously fetched
+            modified (dict): modified document
+
+        Returns:
+            dict: response as specified in the projection,
+                None if nothing changed
+        """
+        update = diff(original, modified)
+        if not update:
+            return None
+        self._add_to_update(_set=update.get('$set'),
+                            unset=update.get('$unset'),
+                            append=update.get('$append'))
+        return self.update()
+
+    def update_many(self, pairs, key_field='_id', **kwargs):
+        """
+        Apply per-document updates to selected items.
+
+        Keys sharing an identical update are sent in chunked $in queries
+        (combined with the query of the selection), so the count of
+        requests depends on the count of distinct updates.
+
+        Args:
+            pairs (iterable): pairs (key, LightBlue update)
+            key_field (str, optional): field matched with the keys
+            **kwargs: chunk_size, workers, validate
+                (see LightBlueEntity.update_many())
+
+        Returns:
+            dict: summary - status, matchCount, modifiedCount, requests,
+                failed (pairs (update, keys) of failed requests)
+        """
+        self._find_response = None
+        with deadline(self._deadline):
+            query = self._query if self._has_query else None
+            if query is NEVER:
+                return {'status': 'COMPLETE', 'matchCount': 0,
+                        'modifiedCount': 0, 'requests': 0, 'failed': []}
+            return self.interface.update_many(
+                pairs, key_field, query=query, **kwargs)
+
     def unset_fields(self, fields):
         """
         Unset fields.
@@ -3,15 +3,29 @@ The LighBlueService should be used as API wrapper. It makes http query based
 on user's requirements.
 """
 
+import functools
 import json
 import logging
+import os
+import threading
+import time
 
-from lightblue.common import retry_session
+import requests
+
+from lightblue.common import DeadlineExceeded, PicklableConfig, \
+    current_deadline, monotonic, retry_session
+from lightblue.endpoints import ROUND_ROBIN, EndpointPool
+from lightblue.limiter import LimitExceeded
+from lightblue.profiling import is_active as profiling_active, stage
+from lightblue.sessions import SHARED, session_provider
 
 LOGGER = logging.getLogger('lightblue')
 
+# smallest timeout sent with a deadline (urllib3 rejects 0)
+MIN_TIMEOUT = 0.001
+
 
-class LightBlueService(object):
+class LightBlueService(PicklableConfig):
     """"
         Class for interacting with lightBlue API
     """
@@ -23,31 +37,185 @@ class LightBlueService(object):
         ssl_certificate=None,
         ssl_verify=True,
         custom_session=None,
+        limiter=None,
+        operation_limiters=None,
+        timeout=None,
+        operation_timeouts=None,
+        hedging=None,
+        balancing=ROUND_ROBIN,
+        health_check_interval=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        slow_query_log=None,
+        cache=None,
+        session_strategy=SHARED,
+        session_pool_size=10,
+        session_pool_timeout=None,
     ):
-        self.data_url = data_url.rstrip('/')
-        self.metadata_url = metadata_url.rstrip('/')
+        """
+        Args:
+            data_url (str/list): lightblue data API url(s)
+            metadata_url (str/list): lightblue metadata API url(s),
+                paired with data urls by index
+            ssl_certificate (str/tuple): client certificate
+            ssl_verify (bool/str): verify server certificate
+            custom_session (object): session used instead of a default one
+            limiter (RequestLimiter): limiter shared by all operations
+            operation_limiters (dict): limiters per operation type
+                ('find', 'insert', 'update', 'delete', 'get_schema')
+            timeout (float/tuple): request timeout in seconds or
+                (connect, read) tuple for all operations
+            operation_timeouts (dict): timeouts per operation type
+            hedging (HedgingPolicy): hedge slow idempotent requests
+            balancing (str): endpoint selection - 'round_robin'
+                or 'least_outstanding'
+            health_check_interval (float): seconds between background
+                health probes of endpoints (None - no probes)
+            retry_policy (RetryPolicy): per-operation retries of 5xx
+                responses and timeouts (the default session then retries
+                only connection errors)
+            circuit_breaker (CircuitBreaker): fail fast while the
+                backend is unhealthy
+            slow_query_log (SlowQueryLog): record slow find/update/delete
+                requests by query shape
+            cache (DiskCache): persistent cache of find and get_schema
+                responses (invalidated by writes to the entity)
+            session_strategy (str): 'shared' (one session for all
+                threads), 'per_thread' or 'pool' (custom_session can be
+                used only with 'shared')
+            session_pool_size (int): sessions of the 'pool' strategy
+            session_pool_timeout (float): max wait for a pool session
+        """
+        self.endpoints = EndpointPool.from_urls(
+            data_url, metadata_url, strategy=balancing)
+        self.data_url = self.endpoints.endpoints[0].data_url
+        self.metadata_url = self.endpoints.endpoints[0].metadata_url
         self.ssl_certificate = ssl_certificate
+        self.ssl_verify = ssl_verify
+        self.retry_policy = retry_policy
         if custom_session is None:
-            self.session = retry_session()
-            self.session.verify = ssl_verify
-            if self.ssl_certificate is not None:
-                self.session.cert = self.ssl_certificate
+            self.session = self._new_session()
+        elif session_strategy != SHARED:
+            raise ValueError(
+                'custom_session can be used only with shared strategy')
         else:
             self.session = custom_session
+        self.session_strategy = session_strategy
+        self.session_pool_size = session_pool_size
+        self.session_pool_timeout = session_pool_timeout
+        # sessions used for requests (self.session is the shared one
+        # and the one used by health probes)
+        self.sessions = self._new_sessions()
+        self.health_check_interval = health_check_interval
+        # process which created the sessions (rebuilt after a fork)
+        self._custom_session = custom_session is not None
+        self._pid = os.getpid()
+        self._fork_lock = threading.Lock()
+        self.limiter = limiter
+        self.operation_limiters = operation_limiters or {}
+        self.timeout = timeout
+        self.operation_timeouts = operation_timeouts or {}
+        self.hedging = hedging
+        self.circuit_breaker = circuit_breaker
+        self.slow_query_log = slow_query_log
+        self.cache = cache
+        if health_check_interval:
+            self.endpoints.start_health_checks(
+                self.session, health_check_interval)
+
+    def _new_session(self):
+        """
+        Create session with retry, certificate and verify settings
+        Returns:
+            - requests.Session object
+
+        """
+        if self.retry_policy is None:
+            session = retry_session()
+        else:
+            # the policy owns retries - only connection errors (request
+            # not sent) are retried by the adapter, writes are never
+            # repeated after a read timeout
+            session = retry_session(status_forcelist=(), read=0)
+        session.verify = self.ssl_verify
+        if self.ssl_certificate is not None:
+            session.cert = self.ssl_certificate
+        return session
+
+    def _new_sessions(self):
+        """
+        Create session provider of the configured strategy
+        Returns:
+            - SessionProvider object
+
+        """
+        return session_provider(
+            self.session_strategy, self._new_session,
+            size=self.session_pool_size, timeout=self.session_pool_timeout,
+            session=self.session)
+
+    def _fork_components(self):
+        """
+        Components holding locks or threads which have to be reset after fork
+
+        Returns:
+            - list - objects with after_fork() method
+
+        """
+        components = [self.endpoints, self.limiter, self.hedging,
+                      self.circuit_breaker, self.slow_query_log]
+        components.extend(self.operation_limiters.values())
+        if self.retry_policy is not None:
+            components.append(self.retry_policy.budget)
+        return [component for component in components
+                if component is not None]
+
+    def _check_fork(self):
+        """
+        Rebuild sessions, hedging pool, locks and health probes in a
+        forked child - pooled connections of the parent must not be shared
+        and its locks may be held by threads which do not exist in the child
+        """
+        if self._pid == os.getpid():
+            return
+        with self._fork_lock:
+            if self._pid == os.getpid():
+                return
+            LOGGER.debug('Fork detected, rebuilding sessions')
+            if not self._custom_session:
+                self.session = self._new_session()
+            else:
+                LOGGER.warning('Custom session is shared with the parent '
+                               'process after fork')
+            self.sessions = self._new_sessions()
+            for component in self._fork_components():
+                component.after_fork()
+            if self.health_check_interval:
+                self.endpoints.start_health_checks(
+                    self.session, self.health_check_interval)
+            self._pid = os.getpid()
+
+    def close(self):
+        """
+        Stop background health probes
+        """
+        self.endpoints.stop_health_checks()
 
     @staticmethod
-    def log_response(response):
+    def log_response(response, response_data=None):
         """
         Logging API calls response
         Args:
             response: API call response
+            response_data (dict): already decoded response body
         """
         log_response = {
             'statusCode': response.status_code,
             'elapsed': response.elapsed.total_seconds()
         }
         try:
-            response_data = response.json()
+            if response_data is None:
+                response_data = response.json()
             log_response['status'] = response_data.get('status')
             log_response['matchCount'] = response_data.get('matchCount')
             log_response['modifiedCount'] = response_data.get('modifiedCount')
@@ -63,6 +231,298 @@ class LightBlueService(object):
                      log_response, extra=log_response)
         return log_response
 
+    @staticmethod
+    def _decode(response):
+        """
+        Decode JSON body of a response (once)
+        Args:
+            response: API call response
+
+        Returns:
+            - dict - decoded body, None if the body is not JSON
+
+        """
+        with stage('decode'):
+            try:
+                return response.json()
+            except ValueError:
+                return None
+
+    def _timeout(self, operation, active_deadline):
+        """
+        Get timeout for a request - configured timeout of the operation
+        shortened to the remaining time of the active deadline
+        Args:
+            operation (str): operation type
+            active_deadline (Deadline/None): deadline of the call
+
+        Returns:
+            - float/tuple/None - timeout passed to the session
+
+        Raises:
+            DeadlineExceeded: deadline has passed
+
+        """
+        timeout = self.operation_timeouts.get(operation, self.timeout)
+        if active_deadline is None:
+            return timeout
+        active_deadline.check()
+        remaining = max(active_deadline.remaining(), MIN_TIMEOUT)
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(
+                remaining if value is None else min(value, remaining)
+                for value in timeout
+            )
+        return min(timeout, remaining)
+
+    def _send(self, method, api, path, **kwargs):
+        """
+        Send a request to an endpoint picked from the pool
+        Args:
+            method (str): session method name (get/put/post)
+            api (str): 'data' or 'metadata'
+            path (str): request path relative to the API url
+            **kwargs: arguments passed to the session method
+
+        Returns:
+            - response object
+
+        """
+        endpoint = self.endpoints.acquire()
+        url = endpoint.url(api) + path
+        LOGGER.debug("%s - %s", method.upper(), url)
+        # None - request was not sent (no free session)
+        healthy = None
+        try:
+            with self.sessions.checkout() as session:
+                # any error of the send (exhausted 5xx retries, timeout,
+                # deadline) counts against the endpoint
+                healthy = False
+                response = getattr(session, method)(url, **kwargs)
+            healthy = response.status_code < 500
+            return response
+        finally:
+            self.endpoints.release(endpoint, healthy)
+
+    def _attempt(self, operation, send):
+        """
+        Send one attempt of a request (hedged if configured)
+        Args:
+            operation (str): operation type
+            send (Callable): function sending the request
+
+        Returns:
+            - response object
+
+        Raises:
+            CircuitOpenError: circuit breaker is open
+
+        """
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request()
+        success = False
+        try:
+            if self.hedging is not None and \
+               self.hedging.applies_to(operation):
+                response = self.hedging.execute(
+                    operation, send,
+                    functools.partial(self._hedge, operation, send))
+            else:
+                response = send()
+            success = response.status_code < 500
+            return response
+        finally:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(success)
+
+    def _hedge(self, operation, send):
+        """
+        Send a hedge under the limiters (without waiting for a slot)
+        Args:
+            operation (str): operation type
+            send (Callable): function sending the request
+
+        Returns:
+            - response object
+
+        Raises:
+            LimitExceeded: limiters are full, the hedge is not sent
+
+        """
+        acquired = self._acquire_limiters(operation, 0)
+        try:
+            return send()
+        finally:
+            self._release_limiters(acquired)
+
+    def _request(self, operation, method, api, path, **kwargs):
+        """
+        Send a request through the limiters, retry policy, circuit breaker,
+        hedging and endpoint pool
+        Args:
+            operation (str): operation type used to pick limiters/timeouts
+            method (str): session method name (get/put/post)
+            api (str): 'data' or 'metadata'
+            path (str): request path relative to the API url
+            **kwargs: arguments passed to the session method
+
+        Returns:
+            - response object
+
+        Raises:
+            DeadlineExceeded: deadline of the call has passed
+            CircuitOpenError: circuit breaker is open
+
+        """
+        self._check_fork()
+        active_deadline = current_deadline()
+        if active_deadline is not None:
+            active_deadline.check()
+        if 'json' in kwargs and profiling_active():
+            # encode the body here to measure it as a separate stage
+            with stage('encode'):
+                kwargs['data'] = json.dumps(kwargs.pop('json')).encode(
+                    'utf-8')
+            kwargs['headers'] = {'Content-Type': 'application/json'}
+        with stage('queue'):
+            acquired = self._acquire_limiters(
+                operation, None if active_deadline is None
+                else active_deadline.remaining())
+        try:
+            with stage('http'):
+                return self._attempts(
+                    operation, method, api, path, active_deadline, kwargs)
+        finally:
+            self._release_limiters(acquired)
+
+    def _acquire_limiters(self, operation, timeout=None):
+        """
+        Take slots of the service and operation limiters
+        Args:
+            operation (str): operation type
+            timeout (float/None): max seconds to wait (0 - do not wait)
+
+        Returns:
+            - list - acquired limiters (see _release_limiters)
+
+        Raises:
+            LimitExceeded: no slot available
+            DeadlineExceeded: deadline has passed while waiting
+
+        """
+        acquired = []
+        try:
+            for limiter in (self.limiter,
+                            self.operation_limiters.get(operation)):
+                if limiter is None:
+                    continue
+                try:
+                    limiter.acquire(timeout=timeout)
+                except LimitExceeded:
+                    active_deadline = current_deadline()
+                    if active_deadline is not None:
+                        active_deadline.check()
+                    raise
+                acquired.append(limiter)
+        except Exception:
+            self._release_limiters(acquired)
+            raise
+        return acquired
+
+    @staticmethod
+    def _release_limiters(acquired):
+        """
+        Return slots taken by _acquire_limiters
+        Args:
+            acquired (list): acquired limiters
+        """
+        for limiter in reversed(acquired):
+            limiter.release()
+
+    def _attempts(self, operation, method, api, path, active_deadline,
+                  kwargs):
+        """
+        Send a request, retry it according to the retry policy
+        Args:
+            operation (str): operation type
+            method (str): session method name (get/put/post)
+            api (str): 'data' or 'metadata'
+            path (str): request path relative to the API url
+            active_deadline (Deadline/None): deadline of the call
+            kwargs (dict): arguments passed to the session method
+
+        Returns:
+            - response object
+
+        """
+        policy = self.retry_policy
+        if policy is not None and not policy.applies_to(operation):
+            policy = None
+        if policy is not None:
+            policy.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._timeout(operation, active_deadline)
+            if timeout is not None:
+                kwargs['timeout'] = timeout
+            send = functools.partial(
+                self._send, method, api, path, **kwargs)
+            try:
+                response = self._attempt(operation, send)
+            except (requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError) as exc:
+                if active_deadline is not None and \
+                   active_deadline.expired:
+                    raise DeadlineExceeded(
+                        'Deadline exceeded - {}'.format(exc))
+                delay = None if policy is None else policy.delay(
+                    attempt, deadline=active_deadline)
+                if delay is None:
+                    raise
+                LOGGER.warning("%s request failed (%s), retrying in "
+                               "%.2fs", operation, exc, delay)
+            else:
+                delay = None if policy is None else policy.delay(
+                    attempt, response, active_deadline)
+                if delay is None:
+                    return response
+                LOGGER.warning("%s request failed with status %s, "
+                               "retrying in %.2fs", operation,
+                               response.status_code, delay)
+                response.close()
+            time.sleep(delay)
+
+    def _data_request(self, operation, method, entity_name, version, data):
+        """
+        Send a request to the data API and decode the response
+        Args:
+            operation (str): operation type (also first part of the path)
+            method (str): session method name (put/post)
+            entity_name (str): entity name
+            version (str/None): entity version
+            data (dict): request body
+
+        Returns:
+            - tuple - response object, decoded response body
+
+        """
+        path = '/{operation}/{entity_name}'
+        if version is not None:
+            path = path + '/{version}'
+        path = path.format(
+            operation=operation, entity_name=entity_name, version=version)
+        started = monotonic()
+        response = self._request(operation, method, 'data', path, json=data)
+        response_data = self._decode(response)
+        if self.slow_query_log is not None:
+            self.slow_query_log.observe(
+                operation, entity_name, data, response, response_data,
+                monotonic() - started)
+        return response, response_data
+
     def get_schema(self, entity_name, version):
         """
         Get schema for specific entity
@@ -74,43 +534,77 @@ class LightBlueService(object):
             - dict - schema of given entity
 
         """
-        url = '{metadata_url}/{entity_name}/{version}'.format(
-            metadata_url=self.metadata_url,
+        if self.cache is not None:
+            cached = self.cache.get('get_schema', entity_name, version)
+            if cached is not None:
+                return cached
+        path = '/{entity_name}/{version}'.format(
             entity_name=entity_name,
             version=version
         )
-        LOGGER.debug("%s - %s", 'GET', url)
-        response = self.session.get(url)
+        response = self._request('get_schema', 'get', 'metadata', path)
         response.raise_for_status()
-        return response.json()
+        with stage('decode'):
+            schema = response.json()
+        if self.cache is not None:
+            self.cache.set('get_schema', entity_name, version, None, schema)
+        return schema
 
-    def insert_data(self, entity_name, version, data):
+    def insert_data(self, entity_name, version, data, return_errors=False):
         """
         Insert request
         Args:
             entity_name (str): entity name
             version (str/None): entity version
             data (dict/list): new lightblue documents
+            return_errors (bool): return ERROR responses (with dataErrors)
+                instead of None
 
         Returns:
             - dict - lightblue response
 
         """
-        url = '{data_url}/insert/{entity_name}'
-        if version is not None:
-            url = url + '/{version}'
-        url = url.format(
-            data_url=self.data_url, entity_name=entity_name, version=version
-        )
-        LOGGER.debug("%s - %s", 'PUT', url)
-        response = self.session.put(url, json=data)
+        response, response_data = self._data_request(
+            'insert', 'put', entity_name, version, data)
+        if self.cache is not None:
+            self.cache.invalidate(entity_name)
+        log = self.log_response(response, response_data)
+        status_code = response.status_code
+        if status_code != 200 or log.get('status') == 'ERROR':
+            # documents may be large - log only their count and the errors
+            documents = data.get('data') if isinstance(data, dict) else data
+            LOGGER.error(
+                'Insert data failed - %s document(s), errors: %s',
+                len(documents) if isinstance(documents, list) else 1,
+                json.dumps(log.get('dataErrors') or log.get('errors')))
+            if return_errors and isinstance(response_data, dict) and \
+               response_data.get('status') == 'ERROR':
+                return response_data
+            return None
+        return response_data
 
-        log = self.log_response(response)
+    def save_data(self, entity_name, version, data):
+        """
+        Save request (replace documents, insert missing ones with upsert)
+        Args:
+            entity_name (str): entity name
+            version (str/None): entity version
+            data (dict): lightblue documents and upsert flag
+
+        Returns:
+            - dict - lightblue response
+
+        """
+        response, response_data = self._data_request(
+            'save', 'post', entity_name, version, data)
+        if self.cache is not None:
+            self.cache.invalidate(entity_name)
+        log = self.log_response(response, response_data)
         status_code = response.status_code
-        if status_code != 200 or log['status'] == 'ERROR':
-            LOGGER.error('Insert data failed - %s', json.dumps(data))
+        if status_code != 200 or log.get('status') == 'ERROR':
+            LOGGER.error('Save data failed - %s', json.dumps(data))
             return None
-        return response.json()
+        return response_data
 
     def delete_data(self, entity_name, version, data):
         """
@@ -124,22 +618,16 @@ class LightBlueService(object):
             - dict - lightblue response
 
         """
-
-        url = '{data_url}/delete/{entity_name}'
-        if version is not None:
-            url = url + '/{version}'
-        url = url.format(
-            data_url=self.data_url, entity_name=entity_name, version=version
-        )
-        LOGGER.debug("%s - %s", 'POST', url)
-        response = self.session.post(url, json=data)
-
-        log = self.log_response(response)
+        response, response_data = self._data_request(
+            'delete', 'post', entity_name, version, data)
+        if self.cache is not None:
+            self.cache.invalidate(entity_name)
+        log = self.log_response(response, response_data)
         status_code = response.status_code
-        if status_code != 200 or log['status'] == 'ERROR':
+        if status_code != 200 or log.get('status') == 'ERROR':
             LOGGER.error('Delete data failed - %s', json.dumps(data))
             return None
-        return response.json()
+        return response_data
 
     def update_data(self, entity_name, version, data):
         """
@@ -153,21 +641,16 @@ class LightBlueService(object):
             - dict - lightblue response
 
         """
-        url = '{data_url}/update/{entity_name}'
-        if version is not None:
-            url = url + '/{version}'
-        url = url.format(
-            data_url=self.data_url, entity_name=entity_name, version=version
-        )
-        LOGGER.debug("%s - %s", 'POST', url)
-        response = self.session.post(url, json=data)
-
-        log = self.log_response(response)
+        response, response_data = self._data_request(
+            'update', 'post', entity_name, version, data)
+        if self.cache is not None:
+            self.cache.invalidate(entity_name)
+        log = self.log_response(response, response_data)
         status_code = response.status_code
-        if status_code != 200 or log['status'] == 'ERROR':
+        if status_code != 200 or log.get('status') == 'ERROR':
             LOGGER.error('Update data failed - %s', json.dumps(data))
             return None
-        return response.json()
+        return response_data
 
     def find_data(self, entity_name, version, data):
         """
@@ -181,19 +664,17 @@ class LightBlueService(object):
             - dict - result of search and projection query
 
         """
-
-        url = '{data_url}/find/{entity_name}'
-        if version is not None:
-            url = url + '/{version}'
-        url = url.format(
-            data_url=self.data_url, entity_name=entity_name, version=version
-        )
-        LOGGER.debug("%s - %s", 'POST', url)
-        response = self.session.post(url, json=data)
-
-        log = self.log_response(response)
+        if self.cache is not None:
+            cached = self.cache.get('find', entity_name, version, data)
+            if cached is not None:
+                return cached
+        response, response_data = self._data_request(
+            'find', 'post', entity_name, version, data)
+        log = self.log_response(response, response_data)
         status_code = response.status_code
-        if status_code != 200 or log['status'] == 'ERROR':
+        if status_code != 200 or log.get('status') == 'ERROR':
             LOGGER.error('Find data failed - %s', json.dumps(data))
             return None
-        return response.json()
+        if self.cache is not None and log.get('status') == 'COMPLETE':
+            self.cache.set('find', entity_name, version, data, response_data)
+        return response_data
@@ -0,0 +1,318 @@
+"""
+Session strategies of LightBlueService.
+
+ - 'shared' - one session used by all threads (default)
+ - 'per_thread' - a session per thread
+ - 'pool' - N sessions, each used by one thread at a time
+
+Providers collect checkout statistics - how often and how long threads
+waited for a session (pool) or shared it with other threads (shared).
+"""
+
+import abc
+import threading
+
+from contextlib import contextmanager
+
+from lightblue.common import monotonic
+
+SHARED = 'shared'
+PER_THREAD = 'per_thread'
+POOL = 'pool'
+
+
+class SessionPoolTimeout(Exception):
+    """No session of the pool became free in time."""
+
+    pass
+
+
+# base class with abstract methods (Python 2 and 3 compatible)
+_Abstract = abc.ABCMeta('_Abstract', (object, ), {})
+
+
+class SessionProvider(_Abstract):
+    """
+    Base class of session strategies.
+
+    Attributes:
+        factory (Callable): creates a new configured session
+    """
+
+    def __init__(self, factory):
+        """
+        Initialize a SessionProvider object.
+
+        Args:
+            factory (Callable): creates a new configured session
+        """
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._checkouts = 0
+        self._contended = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._in_use = 0
+        self._max_in_use = 0
+
+    def _create(self):
+        """
+        Create and register a new session.
+
+        Returns:
+            requests.Session: new session
+        """
+        session = self.factory()
+        with self._lock:
+            self._sessions.append(session)
+        return session
+
+    def _record(self, waited, contended):
+        """
+        Record a checkout (lock has to be held).
+
+        Args:
+            waited (float): seconds spent waiting for the session
+            contended (bool): session was not immediately available
+        """
+        self._checkouts += 1
+        self._contended += int(contended)
+        self._wait_time += waited
+        self._max_wait = max(self._max_wait, waited)
+        self._in_use += 1
+        self._max_in_use = max(self._max_in_use, self._in_use)
+
+    @contextmanager
+    def checkout(self):
+        """
+        Use a session for one request.
+
+        Yields:
+            requests.Session: session
+        """
+        session = self._acquire()
+        try:
+            yield session
+        finally:
+            self._release(session)
+
+    @abc.abstractmethod
+    def _acquire(self):
+        """
+        Take a session for one request and record the checkout.
+
+        Returns:
+            requests.Session: session
+        """
+
+    def _release(self, session):
+        """
+        Return a session taken by _acquire().
+
+        Args:
+            session (requests.Session): session
+        """
+        with self._lock:
+            self._in_use -= 1
+
+    @property
+    def sessions(self):
+        """
+        Created sessions.
+
+        Returns:
+            list: sessions
+        """
+        with self._lock:
+            return list(self._sessions)
+
+    @property
+    def stats(self):
+        """
+        Checkout statistics.
+
+        Returns:
+            dict: sessions, checkouts, contended (checkouts which waited
+                or shared the session), wait_time, max_wait, in_use,
+                max_in_use
+        """
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'checkouts': self._checkouts,
+                'contended': self._contended,
+                'wait_time': self._wait_time,
+                'max_wait': self._max_wait,
+                'in_use': self._in_use,
+                'max_in_use': self._max_in_use,
+            }
+
+    def close(self):
+        """Close all created sessions."""
+        for session in self.sessions:
+            session.close()
+
+
+class SharedSession(SessionProvider):
+    """One session shared by all threads."""
+
+    def __init__(self, factory, session=None):
+        """
+        Initialize a SharedSession object.
+
+        Args:
+            factory (Callable): creates a new configured session
+            session (object, optional): already created session
+        """
+        super(SharedSession, self).__init__(factory)
+        self.session = session
+        if session is not None:
+            self._sessions.append(session)
+
+    def _acquire(self):
+        if self.session is None:
+            with self._lock:
+                if self.session is None:
+                    self.session = self.factory()
+                    self._sessions.append(self.session)
+        with self._lock:
+            self._record(0.0, self._in_use > 0)
+        return self.session
+
+
+class PerThreadSessions(SessionProvider):
+    """
+    A session for each thread.
+
+    Sessions of exited threads are closed when a new session is created.
+    """
+
+    def __init__(self, factory):
+        """
+        Initialize a PerThreadSessions object.
+
+        Args:
+            factory (Callable): creates a new configured session
+        """
+        super(PerThreadSessions, self).__init__(factory)
+        self._local = threading.local()
+        self._owners = []
+        self._generation = 0
+
+    def _reap(self):
+        """Close and forget sessions of threads which exited."""
+        with self._lock:
+            dead = [session for thread, session in self._owners
+                    if not thread.is_alive()]
+            self._owners = [(thread, session)
+                            for thread, session in self._owners
+                            if thread.is_alive()]
+            for session in dead:
+                self._sessions.remove(session)
+        for session in dead:
+            session.close()
+
+    def _acquire(self):
+        session = getattr(self._local, 'session', None)
+        if session is None or \
+           getattr(self._local, 'generation', None) != self._generation:
+            self._reap()
+            session = self._local.session = self._create()
+            with self._lock:
+                self._local.generation = self._generation
+                self._owners.append((threading.current_thread(), session))
+        with self._lock:
+            self._record(0.0, False)
+        return session
+
+    def close(self):
+        """Close all created sessions, threads get new ones on next use."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+            self._owners = []
+            self._generation += 1
+        for session in sessions:
+            session.close()
+
+
+class SessionPool(SessionProvider):
+    """N sessions, each used by one thread at a time."""
+
+    def __init__(self, factory, size=10, timeout=None):
+        """
+        Initialize a SessionPool object.
+
+        Args:
+            factory (Callable): creates a new configured session
+            size (int): max count of sessions (created lazily)
+            timeout (float, optional): max wait for a free session
+        """
+        super(SessionPool, self).__init__(factory)
+        self.size = size
+        self.timeout = timeout
+        self._free = []
+        self._created = 0
+        self._condition = threading.Condition(self._lock)
+
+    def _acquire(self):
+        started = monotonic()
+        create = False
+        with self._condition:
+            contended = not self._free and self._created >= self.size
+            while not self._free and self._created >= self.size:
+                remaining = None if self.timeout is None else \
+                    self.timeout - (monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    raise SessionPoolTimeout(
+                        'No free session in {}s'.format(self.timeout))
+                self._condition.wait(remaining)
+            if self._free:
+                session = self._free.pop()
+            else:
+                self._created += 1
+                create = True
+            self._record(monotonic() - started, contended)
+        if create:
+            try:
+                session = self._create()
+            except Exception:
+                with self._condition:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._condition.notify()
+                raise
+        return session
+
+    def _release(self, session):
+        with self._condition:
+            self._in_use -= 1
+            self._free.append(session)
+            self._condition.notify()
+
+
+def session_provider(strategy, factory, size=10, timeout=None,
+                     session=None):
+    """
+    Create session provider of a strategy.
+
+    Args:
+        strategy (str): 'shared', 'per_thread' or 'pool'
+        factory (Callable): creates a new configured session
+        size (int): pool size
+        timeout (float, optional): max wait for a pool session
+        session (object, optional): session used by 'shared' strategy
+
+    Returns:
+        SessionProvider: provider
+
+    Raises:
+        ValueError: unknown strategy
+    """
+    if strategy == SHARED:
+        return SharedSession(factory, session)
+    if strategy == PER_THREAD:
+        return PerThreadSessions(factory)
+    if strategy == POOL:
+        return SessionPool(factory, size, timeout)
+    raise ValueError('Unknown session strategy {}'.format(strategy))
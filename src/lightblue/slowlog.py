@@ -0,0 +1,200 @@
+"""
+Slow-query log with normalized query shapes.
+
+Queries are recorded by their shape - the field/op structure of the query
+with all values stripped - so no sensitive values end up in the log and
+queries differing only in values are aggregated together.
+"""
+
+import logging
+import threading
+import time
+
+from collections import deque
+
+from lightblue.common import PicklableConfig, canonical_json
+
+LOGGER = logging.getLogger('lightblue')
+
+# query keys holding values compared with a field
+VALUE_KEYS = ('rvalue', 'values', 'regex')
+PLACEHOLDER = '?'
+
+
+def query_shape(query):
+    """
+    Strip values from a LightBlue query.
+
+    Args:
+        query (dict/list): LightBlue query
+
+    Returns:
+        dict/list: query with values replaced by '?'
+    """
+    if isinstance(query, dict):
+        return dict(
+            (key, PLACEHOLDER if key in VALUE_KEYS else query_shape(value))
+            for key, value in query.items()
+        )
+    if isinstance(query, list):
+        return [query_shape(item) for item in query]
+    return query
+
+
+def shape_key(shape):
+    """
+    Stable string key of a query shape.
+
+    Args:
+        shape (dict/list): query shape
+
+    Returns:
+        str: JSON with sorted keys
+    """
+    return canonical_json(shape)
+
+
+def response_size(response):
+    """
+    Size of a response body.
+
+    Args:
+        response (object): response object
+
+    Returns:
+        int: bytes, None if unknown
+    """
+    try:
+        return len(response.content)
+    except TypeError:
+        return None
+
+
+class SlowQueryLog(PicklableConfig):
+    """
+    Records find/update/delete requests over latency or size thresholds.
+
+    Attributes:
+        latency_threshold (float/None): seconds
+        size_threshold (int/None): response bytes
+        entries (deque): recent slow queries
+    """
+
+    def __init__(self,
+                 latency_threshold=1.0,
+                 size_threshold=None,
+                 max_entries=1000,
+                 operations=('find', 'update', 'delete')):
+        """
+        Initialize a SlowQueryLog object.
+
+        Args:
+            latency_threshold (float, optional): record requests slower
+                than this (seconds)
+            size_threshold (int, optional): record responses bigger
+                than this (bytes)
+            max_entries (int): count of recent entries kept
+            operations (tuple): recorded operation types
+        """
+        self.latency_threshold = latency_threshold
+        self.size_threshold = size_threshold
+        self.operations = tuple(operations)
+        self.entries = deque(maxlen=max_entries)
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Replace the lock inherited from the parent process."""
+        self._lock = threading.Lock()
+
+    def is_slow(self, duration, size):
+        """
+        Request is over a threshold.
+
+        Args:
+            duration (float): seconds
+            size (int/None): response bytes
+
+        Returns:
+            bool: True if request should be recorded
+        """
+        if self.latency_threshold is not None and \
+           duration >= self.latency_threshold:
+            return True
+        return self.size_threshold is not None and size is not None and \
+            size >= self.size_threshold
+
+    def observe(self, operation, entity_name, data, response,
+                response_data, duration):
+        """
+        Record request if it is over a threshold.
+
+        Args:
+            operation (str): operation type
+            entity_name (str): entity name
+            data (dict): request body
+            response (object): response object
+            response_data (dict/None): decoded response body
+            duration (float): seconds
+
+        Returns:
+            dict: recorded entry, None if request was not slow
+        """
+        if operation not in self.operations:
+            return None
+        size = response_size(response)
+        if not self.is_slow(duration, size):
+            return None
+        if not isinstance(data, dict):
+            data = {}
+        shape = query_shape(data.get('query'))
+        key = shape_key(shape)
+        entry = {
+            'timestamp': time.time(),
+            'operation': operation,
+            'entity': entity_name,
+            'shape': shape,
+            'projection': data.get('projection'),
+            'matchCount': (response_data or {}).get('matchCount'),
+            'bytes': size,
+            'duration': duration,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            stats = self._shapes.setdefault(
+                (operation, entity_name, key), {
+                    'operation': operation,
+                    'entity': entity_name,
+                    'shape': shape,
+                    'count': 0,
+                    'total_duration': 0.0,
+                    'max_duration': 0.0,
+                    'total_bytes': 0,
+                })
+            stats['count'] += 1
+            stats['total_duration'] += duration
+            stats['max_duration'] = max(stats['max_duration'], duration)
+            stats['total_bytes'] += size or 0
+        LOGGER.warning("Slow %s query on %s (%.3fs, %s bytes) - %s",
+                       operation, entity_name, duration, size, key)
+        return entry
+
+    def summary(self):
+        """
+        Aggregated slow queries per shape.
+
+        Returns:
+            list: dicts with operation, entity, shape, count,
+                total/max duration and total bytes,
+                sorted by total duration
+        """
+        with self._lock:
+            shapes = [dict(stats) for stats in self._shapes.values()]
+        return sorted(shapes, key=lambda stats: stats['total_duration'],
+                      reverse=True)
+
+    def clear(self):
+        """Drop recorded entries and aggregates."""
+        with self._lock:
+            self.entries.clear()
+            self._shapes = {}
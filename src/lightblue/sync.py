@@ -0,0 +1,285 @@
+"""
+Incremental sync of an entity with a watermark-based change feed.
+
+Documents are read in (timestamp, _id) order, starting after the stored
+watermark - the timestamp and _id of the last handled document. Pages are
+fetched by keyset (not by offset), so documents modified during a sync
+cannot shift pages and be skipped.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+LOGGER = logging.getLogger('lightblue')
+
+# atomic replace of an existing file (os.rename on Python 2.7)
+_replace = getattr(os, 'replace', os.rename)
+
+
+class SyncError(Exception):
+    """Find request of a sync failed."""
+
+    pass
+
+
+class MemoryWatermarkStore(object):
+    """
+    Keeps the watermark in memory.
+
+    Attributes:
+        watermark (dict/None): {'timestamp': ..., 'id': ...}
+    """
+
+    def __init__(self, watermark=None):
+        self.watermark = watermark
+
+    def load(self):
+        """
+        Load the watermark.
+
+        Returns:
+            dict: watermark, None if nothing was synced yet
+        """
+        return self.watermark
+
+    def save(self, watermark):
+        """
+        Save the watermark.
+
+        Args:
+            watermark (dict): {'timestamp': ..., 'id': ...}
+        """
+        self.watermark = watermark
+
+
+class FileWatermarkStore(object):
+    """
+    Keeps the watermark in a JSON file (replaced atomically).
+
+    Attributes:
+        path (str): file path
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        Load the watermark.
+
+        Returns:
+            dict: watermark, None if the file does not exist
+        """
+        try:
+            with open(self.path) as watermark_file:
+                return json.load(watermark_file)
+        except IOError:
+            return None
+
+    def save(self, watermark):
+        """
+        Save the watermark.
+
+        Args:
+            watermark (dict): {'timestamp': ..., 'id': ...}
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as watermark_file:
+                json.dump(watermark, watermark_file)
+            _replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+class IncrementalSync(object):
+    """
+    Polls documents changed since the watermark and passes them to handler.
+
+    Attributes:
+        entity (lightblue.entity.LightBlueEntity): synced entity
+        handler (Callable): called with each changed document
+        timestamp_field (str): modification timestamp field
+        store (object): watermark store (load()/save(watermark))
+        interval (float): current poll interval (seconds)
+    """
+
+    def __init__(self,
+                 entity,
+                 handler,
+                 timestamp_field='lastUpdateDate',
+                 store=None,
+                 page_size=100,
+                 projection=None,
+                 min_interval=1.0,
+                 max_interval=300.0,
+                 backoff=2.0):
+        """
+        Initialize an IncrementalSync object.
+
+        Args:
+            entity (lightblue.entity.LightBlueEntity): synced entity
+            handler (Callable): called with each changed document
+            timestamp_field (str): modification timestamp field
+            store (object, optional): watermark store
+                (MemoryWatermarkStore by default)
+            page_size (int): max documents per find request
+            projection (list, optional): custom projection
+                (timestamp field and _id are always included)
+            min_interval (float): poll interval after changes (seconds)
+            max_interval (float): max poll interval without changes
+            backoff (float): interval multiplier when nothing changed
+        """
+        self.entity = entity
+        self.handler = handler
+        self.timestamp_field = timestamp_field
+        self.store = store or MemoryWatermarkStore()
+        self.page_size = page_size
+        self.projection = projection
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _query(self, watermark):
+        """
+        Query for documents after the watermark.
+
+        Args:
+            watermark (dict/None): last handled timestamp and _id
+
+        Returns:
+            dict: LightBlue query
+        """
+        if watermark is None:
+            return {
+                'field': 'objectType',
+                'op': '=',
+                'rvalue': self.entity.entity_name,
+            }
+        return {'$or': [{
+            'field': self.timestamp_field,
+            'op': '>',
+            'rvalue': watermark['timestamp'],
+        }, {'$and': [{
+            'field': self.timestamp_field,
+            'op': '=',
+            'rvalue': watermark['timestamp'],
+        }, {
+            'field': '_id',
+            'op': '>',
+            'rvalue': watermark['id'],
+        }]}]}
+
+    def _projection(self):
+        """
+        Projection of fetched documents.
+
+        Returns:
+            dict/list: LightBlue projection
+        """
+        if self.projection is None:
+            return None
+        return list(self.projection) + [{
+            'field': field,
+            'include': True,
+        } for field in (self.timestamp_field, '_id')]
+
+    def poll(self):
+        """
+        Handle all documents changed since the watermark.
+
+        The watermark is saved after each handled page.
+
+        Returns:
+            int: count of handled documents
+
+        Raises:
+            SyncError: find request failed
+        """
+        watermark = self.store.load()
+        handled = 0
+        sort = [{self.timestamp_field: '$asc'}, {'_id': '$asc'}]
+        while True:
+            response = self.entity.find_item(
+                self._query(watermark),
+                projection=self._projection(),
+                max_results=self.page_size,
+                sort=sort)
+            if not self.entity.check_response(response):
+                raise SyncError('Sync of {} failed'.format(
+                    self.entity.entity_name))
+            documents = response.get('processed') or []
+            for document in documents:
+                self.handler(document)
+            handled += len(documents)
+            if documents:
+                watermark = {
+                    'timestamp': documents[-1].get(self.timestamp_field),
+                    'id': documents[-1].get('_id'),
+                }
+                self.store.save(watermark)
+            if len(documents) < self.page_size:
+                return handled
+
+    def _next_interval(self, handled):
+        """
+        Adapt poll interval - reset after changes, back off otherwise.
+
+        Args:
+            handled (int): count of documents handled by the last poll
+
+        Returns:
+            float: seconds until the next poll
+        """
+        if handled:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff,
+                                self.max_interval)
+        return self.interval
+
+    def run(self):
+        """Poll until stop() is called (failed polls are logged)."""
+        self.interval = self.min_interval
+        while not self._stop.is_set():
+            try:
+                handled = self.poll()
+            except Exception:
+                LOGGER.exception('Sync of %s failed',
+                                 self.entity.entity_name)
+                handled = 0
+            self._stop.wait(self._next_interval(handled))
+
+    def start(self):
+        """
+        Run polling on a daemon thread.
+
+        Returns:
+            IncrementalSync: self
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name='lightblue-sync')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop polling.
+
+        Args:
+            timeout (float, optional): max seconds to wait for the thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
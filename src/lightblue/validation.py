@@ -0,0 +1,367 @@
+"""
+Local validation of documents against Lightblue entity metadata.
+
+The `schema.fields` tree of the metadata is compiled once into a tree of
+checks, so validating a document costs only a walk over its fields.
+"""
+
+import re
+
+try:
+    STRING_TYPES = (basestring, )  # noqa: F821 - Python 2.7
+except NameError:
+    STRING_TYPES = (str, )
+
+try:
+    INTEGER_TYPES = (int, long)  # noqa: F821 - Python 2.7
+except NameError:
+    INTEGER_TYPES = (int, )
+
+VALIDATION_ERROR_CODE = 'lightblue-client:ValidationError'
+
+# fields filled in by Lightblue itself
+GENERATED_FIELDS = ('_id', 'objectType')
+
+
+class DocumentValidationError(ValueError):
+    """Documents do not match the entity schema."""
+
+    def __init__(self, errors):
+        """
+        Initialize a DocumentValidationError object.
+
+        Args:
+            errors (list): pairs (document, list of messages)
+        """
+        self.errors = errors
+        super(DocumentValidationError, self).__init__(
+            '{} invalid document(s): {}'.format(
+                len(errors), '; '.join(errors[0][1]) if errors else ''))
+
+
+def _is_string(value):
+    return isinstance(value, STRING_TYPES)
+
+
+def _is_integer(value):
+    return isinstance(value, INTEGER_TYPES) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return (_is_integer(value) or isinstance(value, float)) and \
+        not isinstance(value, bool)
+
+
+def _is_big_number(value):
+    if _is_number(value):
+        return True
+    if not _is_string(value):
+        return False
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+TYPE_CHECKS = {
+    'string': _is_string,
+    'date': _is_string,
+    'uid': _is_string,
+    'binary': _is_string,
+    'integer': _is_integer,
+    'double': _is_number,
+    'boolean': lambda value: isinstance(value, bool),
+    'biginteger': lambda value: _is_integer(value) or (
+        _is_string(value) and value.lstrip('-').isdigit()),
+    'bigdecimal': _is_big_number,
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+}
+
+
+class FieldValidator(object):
+    """
+    Compiled checks of one field (and its children).
+
+    Attributes:
+        type (str): Lightblue field type
+        required (bool): field is required
+        fields (dict): child validators of an object field
+        items (FieldValidator): validator of array items
+    """
+
+    def __init__(self, definition, enums):
+        """
+        Compile field definition.
+
+        Args:
+            definition (dict): field definition from metadata
+            enums (dict): enum name -> allowed values
+        """
+        self.type = definition.get('type')
+        constraints = definition.get('constraints') or {}
+        self.required = bool(constraints.get('required'))
+        self.type_check = TYPE_CHECKS.get(self.type)
+        self.checks = []
+        self._compile_constraints(constraints, enums)
+        self.fields = dict(
+            (name, FieldValidator(child, enums))
+            for name, child in (definition.get('fields') or {}).items()
+        )
+        items = definition.get('items')
+        self.items = FieldValidator(items, enums) if items else None
+
+    def _compile_constraints(self, constraints, enums):
+        """
+        Compile constraints to a list of (check, message) pairs.
+
+        Args:
+            constraints (dict): field constraints
+            enums (dict): enum name -> allowed values
+        """
+        checks = self.checks
+        if 'minLength' in constraints:
+            min_length = constraints['minLength']
+            checks.append((lambda v: len(v) >= min_length,
+                           'shorter than {}'.format(min_length)))
+        if 'maxLength' in constraints:
+            max_length = constraints['maxLength']
+            checks.append((lambda v: len(v) <= max_length,
+                           'longer than {}'.format(max_length)))
+        if 'minItems' in constraints:
+            min_items = constraints['minItems']
+            checks.append((lambda v: len(v) >= min_items,
+                           'less than {} items'.format(min_items)))
+        if 'maxItems' in constraints:
+            max_items = constraints['maxItems']
+            checks.append((lambda v: len(v) <= max_items,
+                           'more than {} items'.format(max_items)))
+        if 'minimum' in constraints:
+            minimum = float(constraints['minimum'])
+            checks.append((lambda v: float(v) >= minimum,
+                           'less than {}'.format(constraints['minimum'])))
+        if 'maximum' in constraints:
+            maximum = float(constraints['maximum'])
+            checks.append((lambda v: float(v) <= maximum,
+                           'more than {}'.format(constraints['maximum'])))
+        if 'matches' in constraints:
+            pattern = re.compile(constraints['matches'])
+            checks.append((lambda v: pattern.match(v) is not None,
+                           'does not match {}'.format(
+                               constraints['matches'])))
+        if 'enum' in constraints and constraints['enum'] in enums:
+            values = frozenset(enums[constraints['enum']])
+            checks.append((lambda v: v in values,
+                           'not in enum {}'.format(constraints['enum'])))
+
+    def validate(self, value, path, errors, partial=False):
+        """
+        Validate a value of the field.
+
+        Args:
+            value (object): field value
+            path (str): dotted path of the field (for messages)
+            errors (list): list to append error messages to
+            partial (bool): skip required checks of children
+        """
+        if value is None:
+            if self.required:
+                errors.append('{}: required field is null'.format(path))
+            return
+        if self.type_check is not None and not self.type_check(value):
+            errors.append('{}: expected {}, got {}'.format(
+                path, self.type, type(value).__name__))
+            return
+        for check, message in self.checks:
+            try:
+                valid = check(value)
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                errors.append('{}: {}'.format(path, message))
+        if self.type == 'object':
+            validate_object(self.fields, value, path, errors, partial)
+        elif self.type == 'array' and self.items is not None:
+            for index, item in enumerate(value):
+                self.items.validate(
+                    item, '{}.{}'.format(path, index), errors, partial)
+
+
+def validate_object(fields, value, path, errors, partial=False):
+    """
+    Validate object fields.
+
+    Args:
+        fields (dict): field name -> FieldValidator
+        value (dict): object
+        path (str): dotted path of the object ('' for the document)
+        errors (list): list to append error messages to
+        partial (bool): skip required checks
+    """
+    prefix = path + '.' if path else ''
+    for name, item in value.items():
+        validator = fields.get(name)
+        if validator is None:
+            if name not in GENERATED_FIELDS:
+                errors.append('{}{}: unknown field'.format(prefix, name))
+            continue
+        validator.validate(item, prefix + name, errors, partial)
+    if partial:
+        return
+    for name, validator in fields.items():
+        if validator.required and name not in value and \
+           name not in GENERATED_FIELDS and validator.type != 'uid':
+            errors.append('{}{}: required field is missing'.format(
+                prefix, name))
+
+
+class SchemaValidator(object):
+    """
+    Validator compiled from entity metadata.
+
+    Attributes:
+        version (str): schema version
+        fields (dict): field name -> FieldValidator
+    """
+
+    def __init__(self, metadata):
+        """
+        Compile entity metadata.
+
+        Args:
+            metadata (dict): response of get_schema()
+        """
+        schema = metadata.get('schema', metadata)
+        entity_info = metadata.get('entityInfo') or {}
+        enums = dict(
+            (enum['name'], [
+                value['name'] if isinstance(value, dict) else value
+                for value in enum.get('values', [])
+            ])
+            for enum in entity_info.get('enums') or []
+        )
+        self.version = (schema.get('version') or {}).get('value')
+        self.fields = dict(
+            (name, FieldValidator(definition, enums))
+            for name, definition in (schema.get('fields') or {}).items()
+        )
+
+    def validate(self, document):
+        """
+        Validate a whole document.
+
+        Args:
+            document (dict): document to insert
+
+        Returns:
+            list: error messages (empty if valid)
+        """
+        errors = []
+        if not isinstance(document, dict):
+            return ['document is not an object']
+        validate_object(self.fields, document, '', errors)
+        return errors
+
+    def _resolve(self, path):
+        """
+        Find validator of a dotted path (array indexes as numbers or *).
+
+        Args:
+            path (str): dotted path
+
+        Returns:
+            FieldValidator: validator, None if path is unknown
+        """
+        fields = self.fields
+        validator = None
+        for part in path.split('.'):
+            if validator is not None and validator.type == 'array':
+                if part != '*' and not part.isdigit():
+                    return None
+                validator = validator.items
+                if validator is None:
+                    return None
+                fields = validator.fields
+                continue
+            validator = fields.get(part)
+            if validator is None:
+                return None
+            fields = validator.fields
+        return validator
+
+    def validate_update(self, update):
+        """
+        Validate $set/$unset/$append parts of an update.
+
+        Args:
+            update (dict): LightBlue update
+
+        Returns:
+            list: error messages (empty if valid)
+        """
+        errors = []
+        for path, value in (update.get('$set') or {}).items():
+            validator = self._resolve(path)
+            if validator is None:
+                errors.append('{}: unknown field'.format(path))
+            else:
+                validator.validate(value, path, errors, partial=True)
+        for path in update.get('$unset') or []:
+            validator = self._resolve(path)
+            if validator is not None and validator.required:
+                errors.append('{}: required field cannot be unset'.format(
+                    path))
+        for path, values in (update.get('$append') or {}).items():
+            validator = self._resolve(path)
+            if validator is None or validator.type != 'array':
+                errors.append('{}: not an array field'.format(path))
+                continue
+            if validator.items is None:
+                continue
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                validator.items.validate(
+                    value, path + '.*', errors, partial=False)
+        return errors
+
+    def split(self, documents):
+        """
+        Split documents into valid and invalid ones.
+
+        Args:
+            documents (list): documents to insert
+
+        Returns:
+            tuple: list of valid documents,
+                list of pairs (document, error messages)
+        """
+        valid, invalid = [], []
+        for document in documents:
+            errors = self.validate(document)
+            if errors:
+                invalid.append((document, errors))
+            else:
+                valid.append(document)
+        return valid, invalid
+
+
+def data_errors(invalid):
+    """
+    Format validation errors as LightBlue dataErrors.
+
+    Args:
+        invalid (list): pairs (document, error messages)
+
+    Returns:
+        list: dataErrors entries
+    """
+    return [{
+        'data': document,
+        'errors': [{
+            'objectType': 'error',
+            'errorCode': VALIDATION_ERROR_CODE,
+            'msg': message,
+        } for message in messages],
+    } for document, messages in invalid]
@@ -0,0 +1,356 @@
+"""
+Write-behind buffer for LightBlueEntity.
+
+Inserts are collected and sent in batches, $set updates with the same
+query are merged. Batches are flushed on a background thread when a size,
+byte or time threshold is reached. Each buffered item gets a future
+resolved with its own result.
+"""
+
+import logging
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from lightblue.bulk import bulk_result
+from lightblue.common import canonical_json, monotonic
+
+LOGGER = logging.getLogger('lightblue')
+
+
+class BufferFull(Exception):
+    """Buffer is full and the writer does not block (or timed out)."""
+
+    pass
+
+
+class WriterClosed(Exception):
+    """Write to a closed writer."""
+
+    pass
+
+
+class WriteError(Exception):
+    """Item was rejected by LightBlue."""
+
+    def __init__(self, message, errors=None):
+        """
+        Initialize a WriteError object.
+
+        Args:
+            message (str): error message
+            errors (list, optional): LightBlue errors of the item
+        """
+        super(WriteError, self).__init__(message)
+        self.errors = errors or []
+
+
+class BufferedWriter(object):
+    """
+    Buffers inserts and $set updates of one entity.
+
+    Attributes:
+        entity (lightblue.entity.LightBlueEntity): target entity
+        max_items (int): flush when this many items are buffered
+        max_bytes (int): flush when buffered items have this many bytes
+        max_delay (float): flush items older than this (seconds)
+        max_pending (int): max buffered items (backpressure)
+    """
+
+    def __init__(self,
+                 entity,
+                 max_items=100,
+                 max_bytes=1024 * 1024,
+                 max_delay=1.0,
+                 max_pending=10000,
+                 block=True,
+                 timeout=None):
+        """
+        Initialize a BufferedWriter object and start its flush thread.
+
+        Args:
+            entity (lightblue.entity.LightBlueEntity): target entity
+            max_items (int): flush threshold - item count
+            max_bytes (int): flush threshold - JSON size of items
+            max_delay (float): flush threshold - age of the oldest item
+            max_pending (int): max buffered items
+            block (bool): wait for free space when the buffer is full,
+                raise BufferFull otherwise
+            timeout (float, optional): max wait for free space
+        """
+        self.entity = entity
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.block = block
+        self.timeout = timeout
+        self._inserts = []
+        self._updates = OrderedDict()
+        self._count = 0
+        self._bytes = 0
+        self._oldest = None
+        # items taken by the flush thread, but not finished yet
+        self._in_progress = 0
+        self._flush_requested = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='lightblue-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _reserve(self, size):
+        """
+        Wait for free space in the buffer (lock has to be held).
+
+        Args:
+            size (int): JSON size of the new item
+
+        Raises:
+            BufferFull: no space and non-blocking writer or timeout
+            WriterClosed: writer is closed
+        """
+        end = None if self.timeout is None else monotonic() + self.timeout
+        while self._count >= self.max_pending:
+            if not self.block:
+                raise BufferFull('Write buffer is full')
+            remaining = None if end is None else end - monotonic()
+            if remaining is not None and remaining <= 0:
+                raise BufferFull('Write buffer is full')
+            self._condition.wait(remaining)
+        if self._closed:
+            raise WriterClosed('Writer is closed')
+        self._count += 1
+        self._bytes += size
+        if self._oldest is None:
+            self._oldest = monotonic()
+        self._condition.notify_all()
+
+    def insert(self, document):
+        """
+        Buffer a document for insert.
+
+        Args:
+            document (dict): document
+
+        Returns:
+            Future: resolved with the inserted document (as returned by
+                LightBlue, if any) or WriteError
+        """
+        future = Future()
+        size = len(canonical_json(document))
+        with self._condition:
+            self._reserve(size)
+            self._inserts.append((document, future))
+        return future
+
+    def update(self, query, set_fields):
+        """
+        Buffer a $set update, merged with other updates of the same query.
+
+        Args:
+            query (dict): LightBlue query
+            set_fields (dict): fields to $set
+
+        Returns:
+            Future: resolved with the LightBlue response of the merged
+                update or WriteError
+        """
+        future = Future()
+        key = canonical_json(query)
+        size = len(canonical_json(set_fields))
+        with self._condition:
+            if key in self._updates:
+                if self._closed:
+                    raise WriterClosed('Writer is closed')
+                update = self._updates[key]
+                update['set'].update(set_fields)
+                update['futures'].append(future)
+                self._bytes += size
+                self._condition.notify_all()
+            else:
+                self._reserve(size + len(key))
+                self._updates[key] = {
+                    'query': query,
+                    'set': dict(set_fields),
+                    'futures': [future],
+                }
+        return future
+
+    def _due(self):
+        """
+        Buffer should be flushed (lock has to be held).
+
+        Returns:
+            bool: True if a threshold is reached
+        """
+        if not self._count:
+            return False
+        return self._flush_requested or self._closed or \
+            self._count >= self.max_items or \
+            self._bytes >= self.max_bytes or \
+            monotonic() - self._oldest >= self.max_delay
+
+    def _run(self):
+        """Flush thread - waits for a threshold and sends batches."""
+        while True:
+            with self._condition:
+                while not self._due():
+                    if self._closed and not self._count:
+                        return
+                    if self._count:
+                        self._condition.wait(max(
+                            self.max_delay - (monotonic() - self._oldest),
+                            0.001))
+                    else:
+                        self._flush_requested = False
+                        self._condition.notify_all()
+                        self._condition.wait()
+                inserts, self._inserts = self._inserts, []
+                updates, self._updates = self._updates, OrderedDict()
+                self._in_progress = self._count
+                self._count = self._bytes = 0
+                self._oldest = None
+                self._condition.notify_all()
+            try:
+                self._send_inserts(inserts)
+                self._send_updates(updates)
+            except Exception as exc:
+                LOGGER.exception('Flush of buffered writes failed')
+                self._fail(inserts, updates, exc)
+            finally:
+                with self._condition:
+                    self._in_progress = 0
+                    self._condition.notify_all()
+
+    @staticmethod
+    def _fail(inserts, updates, exc):
+        """
+        Fail futures of a flush which were not resolved yet.
+
+        Args:
+            inserts (list): pairs (document, future)
+            updates (OrderedDict): query key -> merged update
+            exc (Exception): error of the flush
+        """
+        futures = [future for _, future in inserts]
+        for update in updates.values():
+            futures.extend(update['futures'])
+        for future in futures:
+            if not future.done():
+                future.set_exception(exc)
+
+    def _send_inserts(self, inserts):
+        """
+        Insert buffered documents in batches of max_items.
+
+        Args:
+            inserts (list): pairs (document, future)
+        """
+        inserts = [(document, future) for document, future in inserts
+                   if future.set_running_or_notify_cancel()]
+        for start in range(0, len(inserts), self.max_items):
+            batch = inserts[start:start + self.max_items]
+            try:
+                response = self.entity.insert_data(
+                    [document for document, _ in batch], return_errors=True)
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            self._resolve_inserts(batch, response)
+
+    @staticmethod
+    def _resolve_inserts(batch, response):
+        """
+        Resolve futures of an insert batch from the response.
+
+        Processed documents are paired with the written documents by their
+        index among them, only if LightBlue returned one for each.
+
+        Args:
+            batch (list): pairs (document, future)
+            response (dict/None): LightBlue response
+        """
+        if response is None:
+            for _, future in batch:
+                future.set_exception(WriteError('Insert request failed'))
+            return
+        result = bulk_result([document for document, _ in batch], response)
+        written = [written.index for written in result.succeeded]
+        processed = response.get('processed') or []
+        if len(processed) != len(written):
+            processed = [None] * len(written)
+        processed = dict(zip(written, processed))
+        for document_result, (_, future) in zip(result, batch):
+            if document_result.ok:
+                future.set_result(processed[document_result.index])
+            else:
+                future.set_exception(WriteError(
+                    'Document was rejected', document_result.errors))
+
+    def _send_updates(self, updates):
+        """
+        Send merged updates.
+
+        Args:
+            updates (OrderedDict): query key -> merged update
+        """
+        for update in updates.values():
+            futures = [future for future in update['futures']
+                       if future.set_running_or_notify_cancel()]
+            if not futures:
+                continue
+            try:
+                response = self.entity.update_item(
+                    update['query'], {'$set': update['set']})
+            except Exception as exc:
+                for future in futures:
+                    future.set_exception(exc)
+                continue
+            for future in futures:
+                if response is None:
+                    future.set_exception(WriteError('Update request failed'))
+                else:
+                    future.set_result(response)
+
+    def flush(self, timeout=None):
+        """
+        Send all buffered items and wait until they are finished.
+
+        Args:
+            timeout (float, optional): max seconds to wait
+
+        Returns:
+            bool: True if the buffer was flushed
+        """
+        end = None if timeout is None else monotonic() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._count or self._in_progress:
+                remaining = None if end is None else end - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """
+        Flush buffered items and stop the flush thread.
+
+        Args:
+            timeout (float, optional): max seconds to wait
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
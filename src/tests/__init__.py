@@ -11,6 +11,7 @@ class FakeLightblueService(LightBlueService):
         self.data_api = Mock()
         self.metadata_api = Mock()
         self.insert_data = Mock()
+        self.save_data = Mock()
         self.delete_data = Mock()
         self.update_data = Mock()
         self.find_data = Mock()
@@ -0,0 +1,133 @@
+import warnings
+
+from unittest import TestCase
+
+from lightblue.advisor import IndexAdvisor, UnindexedQueryWarning, analyze
+from lightblue.entity import LightBlueEntity
+from lightblue.query import LightBlueQuery
+from . import FakeLightblueService
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+METADATA = {
+    'entityInfo': {
+        'name': 'person',
+        'indexes': [
+            {'name': 'by_name', 'unique': False,
+             'fields': [{'field': 'name', 'dir': '$asc'},
+                        {'field': 'age', 'dir': '$asc'}]},
+            {'name': 'by_tag', 'fields': [{'field': 'tags.*.name'}]},
+        ],
+    },
+    'schema': {'fields': {}},
+}
+
+
+class TestIndexAdvisor(TestCase):
+    """
+    Test cases for query index advisor
+    """
+    test_docstring_prefix = "Index advisor - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.service = FakeLightblueService()
+        self.service.get_schema.return_value = METADATA
+        self.interface = LightBlueEntity(self.service, 'person', '1.0.0')
+
+    def query(self, *args, **kwargs):
+        return LightBlueQuery(self.interface, *args, **kwargs)
+
+    def test_index_prefix(self):
+        """
+        Test index is usable only by its first field
+        """
+        report = analyze(self.query(name='Ann'), METADATA)
+        self.assertTrue(report.indexed)
+        self.assertEqual(report.index, 'by_name')
+        self.assertFalse(analyze(self.query(age=3), METADATA).indexed)
+        self.assertTrue(analyze(self.query(_id='x'), METADATA).indexed)
+
+    def test_not_indexable_op(self):
+        """
+        Test negations cannot use an index
+        """
+        report = analyze(self.query(('name', '!=', 'Ann')), METADATA)
+        self.assertFalse(report.indexed)
+
+    def test_raw_queries(self):
+        """
+        Test raw queries with $or and array paths are analyzed
+        """
+        query = self.query()
+        query.add_raw_query({'$or': [
+            {'field': 'name', 'op': '=', 'rvalue': 'Ann'},
+            {'field': 'tags.0.name', 'op': '$in', 'values': ['x']},
+        ]})
+        self.assertTrue(analyze(query, METADATA).indexed)
+        query.add_raw_query({'$or': [
+            {'field': 'name', 'op': '=', 'rvalue': 'Ann'},
+            {'field': 'age', 'op': '>', 'rvalue': 3},
+        ]})
+        self.assertTrue(analyze(query, METADATA).indexed)
+        query = self.query()
+        query.add_raw_query({'$or': [
+            {'field': 'name', 'op': '=', 'rvalue': 'Ann'},
+            {'field': 'age', 'op': '>', 'rvalue': 3},
+        ]})
+        self.assertFalse(analyze(query, METADATA).indexed)
+
+    def test_all_operator(self):
+        """
+        Test $all is analyzed as $and
+        """
+        query = self.query()
+        query.add_raw_query({'$all': [
+            {'field': 'age', 'op': '>', 'rvalue': 3},
+            {'field': 'name', 'op': '=', 'rvalue': 'Ann'},
+        ]})
+        report = analyze(query, METADATA)
+        self.assertTrue(report.indexed)
+        self.assertEqual(report.fields, ['age', 'name'])
+
+    def test_failed_check(self):
+        """
+        Test failed analysis is logged and the query is executed
+        """
+        self.interface = LightBlueEntity(self.service, 'person')
+        self.interface.index_advisor = IndexAdvisor()
+        self.service.find_data.return_value = {'status': 'COMPLETE'}
+        with patch('lightblue.advisor.LOGGER') as logger:
+            response = self.query(name='Ann').find()
+        self.assertEqual(response, {'status': 'COMPLETE'})
+        self.assertTrue(logger.warning.called)
+        self.assertEqual(self.interface.index_advisor.stats, {})
+
+    def test_count_mode(self):
+        """
+        Test advisor counts queries executed through the entity
+        """
+        self.interface.index_advisor = IndexAdvisor()
+        self.query(name='Ann').find()
+        self.query(age=3).find()
+        self.query(age=4).find()
+        self.assertEqual(self.interface.index_advisor.stats,
+                         {'person': {'indexed': 1, 'unindexed': 2}})
+        self.service.get_schema.assert_called_once_with('person', '1.0.0')
+
+    def test_warn_mode(self):
+        """
+        Test advisor warns about unindexed queries
+        """
+        self.interface.index_advisor = IndexAdvisor(mode='warn')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.query(age=3).find()
+        self.assertEqual(caught[0].category, UnindexedQueryWarning)
@@ -0,0 +1,100 @@
+from unittest import TestCase
+
+from lightblue.bulk import REQUEST_FAILED_CODE, UNKNOWN_RESULT_CODE, \
+    bulk_result, group_updates, match_errors
+
+
+class TestBulkResult(TestCase):
+    """
+    Test cases for per-document results of bulk writes
+    """
+    test_docstring_prefix = "Bulk results - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_match_errors(self):
+        """
+        Test dataErrors are matched by document, then by _id
+        """
+        documents = [{'a': 1}, {'_id': 'x', 'a': 2}, {'a': 1}]
+        matched, unmatched = match_errors(documents, [
+            {'data': {'a': 1}, 'errors': ['first']},
+            {'data': {'a': 1}, 'errors': ['second']},
+            {'data': {'_id': 'x'}, 'errors': ['by id']},
+            {'data': {'a': 3}, 'errors': ['unknown']},
+        ])
+        self.assertEqual(matched, {0: ['first'], 2: ['second'],
+                                   1: ['by id']})
+        self.assertEqual(unmatched, [{'data': {'a': 3},
+                                      'errors': ['unknown']}])
+
+    def test_partial(self):
+        """
+        Test transient and permanent failures of a partial response
+        """
+        documents = [{'a': 1}, {'a': 2}, {'a': 3}]
+        result = bulk_result(documents, {'status': 'PARTIAL', 'dataErrors': [
+            {'data': {'a': 2},
+             'errors': [{'errorCode': 'mongo-crud:DatabaseError'}]},
+            {'data': {'a': 3},
+             'errors': [{'errorCode': 'mongo-crud:Duplicate'}]},
+        ]})
+        self.assertEqual(result.status, 'PARTIAL')
+        self.assertEqual([r.index for r in result.succeeded], [0])
+        self.assertEqual([r.index for r in result.transient], [1])
+        self.assertEqual([r.index for r in result.permanent], [2])
+        self.assertEqual([error['data'] for error in result.data_errors()],
+                         [{'a': 2}, {'a': 3}])
+
+    def test_unmatched_error(self):
+        """
+        Test documents without an error fail when some error is unmatched
+        """
+        documents = [{'a': 1}, {'a': 2}, {'a': 3}]
+        result = bulk_result(documents, {'status': 'PARTIAL', 'dataErrors': [
+            {'data': {'a': 1}, 'errors': [{'errorCode': 'crud:Invalid'}]},
+            {'data': {'a': 2, 'created': 'now'},
+             'errors': [{'errorCode': 'crud:Invalid'}]},
+        ]})
+        self.assertEqual(result.status, 'ERROR')
+        self.assertEqual(result.succeeded, [])
+        self.assertEqual(result.results[0].errors[0]['errorCode'],
+                         'crud:Invalid')
+        self.assertEqual(
+            [r.errors[0]['errorCode'] for r in result.results[1:]],
+            [UNKNOWN_RESULT_CODE] * 2)
+        self.assertEqual(len(result.permanent), 3)
+        self.assertEqual(len(result.unmatched), 1)
+
+    def test_request_failed(self):
+        """
+        Test failed request fails all documents (transient only on opt-in)
+        """
+        result = bulk_result([{'a': 1}, {'a': 2}], None)
+        self.assertEqual(result.status, 'ERROR')
+        self.assertEqual(len(result.permanent), 2)
+        self.assertEqual(result.failed[0].errors[0]['errorCode'],
+                         REQUEST_FAILED_CODE)
+        result = bulk_result([{'a': 1}], None, (REQUEST_FAILED_CODE, ))
+        self.assertEqual(len(result.transient), 1)
+        result = bulk_result([{'a': 1}], {
+            'status': 'ERROR', 'errors': [{'errorCode': 'crud:Invalid'}]})
+        self.assertEqual(len(result.permanent), 1)
+        result = bulk_result([{'a': 1}], {'status': 'COMPLETE'})
+        self.assertEqual(result.status, 'COMPLETE')
+
+    def test_group_updates(self):
+        """
+        Test keys are grouped by identical update
+        """
+        done = {'$set': {'status': 'done'}}
+        failed = {'$set': {'status': 'failed'}}
+        self.assertEqual(group_updates([
+            ('a', done), ('b', failed), ('c', {'$set': {'status': 'done'}}),
+            ('a', done),
+        ]), [(done, ['a', 'c']), (failed, ['b'])])
+        with self.assertRaises(ValueError):
+            group_updates([('a', done), ('a', failed)])
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lightblue.cache import DiskCache
+from lightblue.service import LightBlueService
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+
+class TestDiskCache(TestCase):
+    """
+    Test cases for DiskCache class
+    """
+    test_docstring_prefix = "Disk cache - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'cache.db')
+
+    def test_get_set(self):
+        """
+        Test entries are shared by cache instances of the same file
+        """
+        cache = DiskCache(self.path)
+        self.assertIsNone(cache.get('find', 'entity', '1', {'q': 1}))
+        cache.set('find', 'entity', '1', {'q': 1}, {'processed': [1]})
+        other = DiskCache(self.path)
+        self.assertEqual(other.get('find', 'entity', '1', {'q': 1}),
+                         {'processed': [1]})
+        self.assertIsNone(other.get('find', 'entity', '1', {'q': 2}))
+        self.assertEqual(other.stats, {'hits': 1, 'misses': 1, 'writes': 0})
+
+    @patch('lightblue.cache.time.time')
+    def test_ttl(self, mock_time):
+        """
+        Test expired entries are not returned
+        """
+        mock_time.return_value = 1000
+        cache = DiskCache(self.path, ttl=10, operation_ttls={'other': 0})
+        cache.set('find', 'entity', '1', None, {'a': 1})
+        cache.set('get_schema', 'entity', '1', None, {'b': 1})
+        cache.set('other', 'entity', '1', None, {'c': 1})
+        mock_time.return_value = 1011
+        self.assertIsNone(cache.get('find', 'entity', '1'))
+        self.assertEqual(cache.get('get_schema', 'entity', '1'), {'b': 1})
+        self.assertIsNone(cache.get('other', 'entity', '1'))
+
+    def test_limits(self):
+        """
+        Test oldest entries are evicted over the limits
+        """
+        cache = DiskCache(self.path, max_entries=2)
+        for index in range(3):
+            cache.set('find', 'entity', '1', index, {'index': index})
+        self.assertIsNone(cache.get('find', 'entity', '1', 0))
+        self.assertIsNotNone(cache.get('find', 'entity', '1', 2))
+        cache = DiskCache(self.path, max_bytes=15)
+        cache.set('find', 'entity', '1', 3, {'index': 3})
+        self.assertIsNone(cache.get('find', 'entity', '1', 1))
+        self.assertIsNone(cache.get('find', 'entity', '1', 2))
+        self.assertIsNotNone(cache.get('find', 'entity', '1', 3))
+
+    def test_invalidate(self):
+        """
+        Test invalidation of an entity
+        """
+        cache = DiskCache(self.path)
+        cache.set('find', 'entity', '1', None, {'a': 1})
+        cache.set('find', 'other', '1', None, {'a': 1})
+        cache.invalidate('entity')
+        self.assertIsNone(cache.get('find', 'entity', '1'))
+        self.assertIsNotNone(cache.get('find', 'other', '1'))
+
+    @patch('requests.Session.put')
+    @patch('requests.Session.post')
+    def test_service(self, mock_post, mock_put):
+        """
+        Test service answers find from the cache until a write
+        """
+        service = LightBlueService(
+            'http://lb/data', 'http://lb/metadata',
+            cache=DiskCache(self.path))
+        response = Mock(status_code=200)
+        response.json.return_value = {'status': 'COMPLETE', 'processed': []}
+        mock_post.return_value = mock_put.return_value = response
+        for _ in range(2):
+            self.assertEqual(
+                service.find_data('entity', '1', {'query': 1}),
+                {'status': 'COMPLETE', 'processed': []})
+        self.assertEqual(mock_post.call_count, 1)
+        service.insert_data('entity', '1', {'data': []})
+        service.find_data('entity', '1', {'query': 1})
+        self.assertEqual(mock_post.call_count, 2)
@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+from lightblue.common import DeadlineExceeded, DeadlineRetry, \
+    current_deadline, deadline
+
+
+class TestDeadline(TestCase):
+    """
+    Test cases for deadline helpers
+    """
+    test_docstring_prefix = "Deadline - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_no_deadline(self):
+        """
+        Test no deadline is active by default
+        """
+        self.assertIsNone(current_deadline())
+        with deadline(None) as active:
+            self.assertIsNone(active)
+
+    def test_nested_deadline(self):
+        """
+        Test nested deadline can only shorten the outer one
+        """
+        with deadline(1) as outer:
+            with deadline(100) as inner:
+                self.assertIs(inner, outer)
+            with deadline(0.5) as inner:
+                self.assertIsNot(inner, outer)
+                self.assertLessEqual(inner.remaining(), 0.5)
+            self.assertIs(current_deadline(), outer)
+        self.assertIsNone(current_deadline())
+
+    def test_check_expired(self):
+        """
+        Test expired deadline raises
+        """
+        with deadline(0) as active:
+            self.assertTrue(active.expired)
+            with self.assertRaises(DeadlineExceeded):
+                active.check()
+
+    def test_retry_stops_on_deadline(self):
+        """
+        Test retries stop once the deadline has passed
+        """
+        retry = DeadlineRetry(total=5, backoff_factor=10)
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                retry.increment(method='GET', url='/')
+
+    def test_retry_backoff_capped(self):
+        """
+        Test retry backoff never sleeps past the deadline
+        """
+        retry = DeadlineRetry(total=5, backoff_factor=10)
+        retry = retry.increment(method='GET', url='/')
+        retry = retry.increment(method='GET', url='/')
+        self.assertGreater(retry.get_backoff_time(), 1)
+        with deadline(1):
+            self.assertLessEqual(retry.get_backoff_time(), 1)
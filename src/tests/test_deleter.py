@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from lightblue.deleter import MassDelete, MassDeleteError
+from lightblue.entity import LightBlueEntity
+from lightblue.sync import FileWatermarkStore
+from . import FakeLightblueService
+
+
+class TestMassDelete(TestCase):
+    """
+    Test cases for chunked mass delete
+    """
+    test_docstring_prefix = "Mass delete - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.ids = set('{:02d}'.format(index) for index in range(25))
+        self.lock = threading.Lock()
+        self.fail_delete = None
+        self.service = FakeLightblueService()
+        self.service.find_data.side_effect = self._find
+        self.service.delete_data.side_effect = self._delete
+        self.entity = LightBlueEntity(self.service, 'entity', '1.0.0')
+
+    @staticmethod
+    def _ids_clause(query):
+        clauses = query['$and'] if '$and' in query else [query]
+        return [clause for clause in clauses
+                if clause.get('field') == '_id']
+
+    def _find(self, entity_name, version, data):
+        with self.lock:
+            ids = sorted(self.ids)
+        for clause in self._ids_clause(data['query']):
+            ids = [value for value in ids if value > clause['rvalue']]
+        return {'status': 'COMPLETE', 'matchCount': len(ids),
+                'processed': [{'_id': value}
+                              for value in ids[:data['maxResults']]]}
+
+    def _delete(self, entity_name, version, data):
+        values = self._ids_clause(data['query'])[0]['values']
+        if self.fail_delete in values:
+            return None
+        with self.lock:
+            self.ids.difference_update(values)
+        return {'status': 'COMPLETE', 'modifiedCount': len(values)}
+
+    def test_delete_all(self):
+        """
+        Test all documents are deleted in chunks with progress
+        """
+        progress = []
+        response = self.entity.delete_all(
+            chunk_size=10, workers=2, progress=progress.append)
+        self.assertEqual(response['modifiedCount'], 25)
+        self.assertEqual(self.ids, set())
+        self.assertEqual(self.service.delete_data.call_count, 3)
+        self.assertEqual(
+            self.service.delete_data.call_args[0][2]['query']['$and'][0],
+            {'field': 'objectType', 'op': '=', 'rvalue': 'entity'})
+        # chunks may complete in any order
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(progress[-1]['deleted'], 25)
+        self.assertEqual(progress[-1]['total'], 25)
+        self.assertEqual(progress[-1]['last'], '24')
+
+    def test_resume(self):
+        """
+        Test interrupted delete resumes after the checkpoint
+        """
+        query = {'field': 'name', 'op': '=', 'rvalue': 'x'}
+        path = os.path.join(self.directory, 'checkpoint')
+        self.fail_delete = '12'
+        with self.assertRaises(MassDeleteError):
+            self.entity.delete_item(query, chunk_size=5, workers=1,
+                                    checkpoint=path)
+        state = FileWatermarkStore(path).load()
+        self.assertEqual(state['last'], '09')
+        self.assertEqual(state['deleted'], 10)
+        self.assertFalse(state['done'])
+        with self.assertRaises(MassDeleteError):
+            MassDelete(self.entity, {'field': 'other'},
+                       checkpoint=FileWatermarkStore(path))
+        self.fail_delete = None
+        response = self.entity.delete_item(query, chunk_size=5,
+                                           checkpoint=path)
+        self.assertEqual(response['modifiedCount'], 25)
+        self.assertEqual(self.ids, set())
+        self.assertTrue(FileWatermarkStore(path).load()['done'])
+
+    def test_single_request(self):
+        """
+        Test delete without chunk_size sends a single request
+        """
+        self.service.delete_data.side_effect = None
+        self.entity.delete_item({'field': 'name'})
+        self.assertFalse(self.service.find_data.called)
+        self.assertEqual(
+            self.service.delete_data.call_args[0][2]['query'],
+            {'field': 'name'})
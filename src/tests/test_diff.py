@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from lightblue.diff import diff
+from lightblue.entity import LightBlueEntity
+from lightblue.selection import LightBlueGenericSelection
+from . import FakeLightblueService
+
+
+class TestDiff(TestCase):
+    """
+    Test cases for diff-based updates
+    """
+    test_docstring_prefix = "Document diff - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_equal(self):
+        """
+        Test equal documents produce no update
+        """
+        document = {'a': 1, 'b': {'c': [1, 2]}}
+        self.assertEqual(diff(document, dict(document)), {})
+
+    def test_nested_fields(self):
+        """
+        Test only changed nested fields are set or unset
+        """
+        original = {'a': 1, 'b': {'c': 1, 'd': 2, 'e': 3}}
+        modified = {'a': 1, 'b': {'c': 5, 'e': 3, 'f': {'g': 1}}}
+        self.assertEqual(diff(original, modified), {
+            '$set': {'b.c': 5, 'b.f': {'g': 1}},
+            '$unset': ['b.d'],
+        })
+
+    def test_arrays(self):
+        """
+        Test array items are compared by index
+        """
+        original = {
+            'changed': [{'x': 1}, {'x': 2}],
+            'grown': [1, 2],
+            'shrunk': [1, 2, 3, 4],
+            'replaced': [1, 2, 3],
+        }
+        modified = {
+            'changed': [{'x': 1}, {'x': 3}],
+            'grown': [1, 2, 3, 4],
+            'shrunk': [1, 2],
+            'replaced': [3, 2],
+        }
+        self.assertEqual(diff(original, modified), {
+            '$set': {'changed.1.x': 3, 'replaced': [3, 2]},
+            '$unset': ['shrunk.3', 'shrunk.2'],
+            '$append': {'grown': [3, 4]},
+        })
+
+    def test_type_change(self):
+        """
+        Test values of a different type are replaced
+        """
+        self.assertEqual(diff({'a': [1], 'b': True}, {'a': {}, 'b': 1}),
+                         {'$set': {'a': {}, 'b': 1}})
+        with self.assertRaises(TypeError):
+            diff([], {})
+
+    def test_update_changes(self):
+        """
+        Test selection sends only the diff
+        """
+        service = FakeLightblueService()
+        interface = LightBlueEntity(service, 'entity', '1.0.0')
+        selection = LightBlueGenericSelection(
+            interface=interface, name='foo')
+        service.update_data.return_value = {'status': 'COMPLETE'}
+        self.assertIsNone(selection.update_changes({'a': 1}, {'a': 1}))
+        self.assertEqual(
+            selection.update_changes({'a': 1, 'b': 1}, {'a': 2}),
+            {'status': 'COMPLETE'})
+        data = service.update_data.call_args[0][2]
+        self.assertEqual(data['update'],
+                         {'$set': {'a': 2}, '$unset': ['b']})
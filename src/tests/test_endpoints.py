@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from lightblue.endpoints import LEAST_OUTSTANDING, EndpointPool
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+
+class TestEndpointPool(TestCase):
+    """
+    Test cases for EndpointPool class
+    """
+    test_docstring_prefix = "Endpoint pool - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.pool = EndpointPool.from_urls(
+            ['http://lb1/data', 'http://lb2/data', 'http://lb3/data'],
+            ['http://lb1/meta', 'http://lb2/meta', 'http://lb3/meta'],
+            max_failures=2,
+        )
+        self.lb1, self.lb2, self.lb3 = self.pool.endpoints
+
+    def test_round_robin(self):
+        """
+        Test endpoints are picked in turns
+        """
+        picked = []
+        for _ in range(4):
+            endpoint = self.pool.acquire()
+            picked.append(endpoint)
+            self.pool.release(endpoint, True)
+        self.assertEqual(picked, [self.lb1, self.lb2, self.lb3, self.lb1])
+
+    def test_least_outstanding(self):
+        """
+        Test endpoint with least requests in flight is picked
+        """
+        self.pool.strategy = LEAST_OUTSTANDING
+        self.lb1.outstanding = 2
+        self.lb2.outstanding = 1
+        self.assertIs(self.pool.acquire(), self.lb3)
+        self.assertIs(self.pool.acquire(), self.lb2)
+
+    def test_passive_ejection(self):
+        """
+        Test endpoint is ejected after consecutive failures
+        """
+        self.pool.mark_failed(self.lb1)
+        self.assertIsNone(self.lb1.ejected_until)
+        self.pool.mark_failed(self.lb1)
+        self.assertIsNotNone(self.lb1.ejected_until)
+        picked = set(self.pool.acquire() for _ in range(4))
+        self.assertEqual(picked, set([self.lb2, self.lb3]))
+
+    def test_all_ejected(self):
+        """
+        Test all endpoints are used when all of them are ejected
+        """
+        for endpoint in self.pool.endpoints:
+            self.pool.mark_failed(endpoint)
+            self.pool.mark_failed(endpoint)
+        self.assertIs(self.pool.acquire(), self.lb1)
+
+    def test_probe(self):
+        """
+        Test health probe ejects failing and restores healthy endpoints
+        """
+        self.pool.max_failures = 1
+        self.pool.mark_failed(self.lb1)
+        session = Mock()
+        session.get.side_effect = [
+            Mock(status_code=200),
+            Mock(status_code=500),
+            IOError('connection refused'),
+        ]
+        self.pool.probe(session)
+        self.assertIsNone(self.lb1.ejected_until)
+        self.assertIsNotNone(self.lb2.ejected_until)
+        self.assertIsNotNone(self.lb3.ejected_until)
+        session.get.assert_any_call('http://lb1/meta', timeout=5)
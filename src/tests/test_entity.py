@@ -1,6 +1,9 @@
 from unittest import TestCase
 
+from lightblue.common import DeadlineExceeded, current_deadline
 from lightblue.entity import LightBlueEntity
+from lightblue.selection import LightBlueGenericSelection
+from lightblue.validation import DocumentValidationError
 from . import FakeLightblueService
 
 try:
@@ -101,6 +104,35 @@ class TestLightBlueEntity(TestCase):
             self.lb_entity.entity_name, self.lb_entity.version, expected_data
         )
 
+    def test_save(self):
+        """
+        Test save documents
+        """
+        expected_data = {
+            'objectType': self.lb_entity.entity_name,
+            'data': ['fake_data'],
+            'upsert': False,
+            'version': self.lb_entity.version,
+            'projection': {
+                'field': '*',
+                'include': True,
+                'recursive': True
+            }
+        }
+        self.lb_entity.save(['fake_data'])
+        self.fake_lightblue_service.save_data.assert_called_once_with(
+            self.lb_entity.entity_name, self.lb_entity.version, expected_data
+        )
+
+    def test_upsert(self):
+        """
+        Test upsert documents
+        """
+        self.lb_entity.upsert(['fake_data'])
+        data = self.fake_lightblue_service.save_data.call_args[0][2]
+        self.assertTrue(data['upsert'])
+        self.assertEqual(data['data'], ['fake_data'])
+
     def test_delete_all(self):
         """
         Test delete all documents
@@ -280,3 +312,173 @@ class TestLightBlueEntity(TestCase):
         )
         self.assertEqual(result, None)
         self.assertEqual(find_func.call_count, 2)
+
+    def test_find_paginated_deadline(self):
+        """
+        Test paginated find shares the deadline with all page fetches
+        """
+        def find_func(*args, **kwargs):
+            self.assertIsNotNone(current_deadline())
+            raise DeadlineExceeded()
+
+        with self.assertRaises(DeadlineExceeded):
+            self.lb_entity.find_paginated(100, find_func, deadline=5)
+        self.assertIsNone(current_deadline())
+
+    def test_insert_data_validate(self):
+        """
+        Test invalid documents are rejected before sending
+        """
+        self.fake_lightblue_service.get_schema.return_value = {
+            'schema': {'fields': {'name': {'type': 'string'}}}
+        }
+        with self.assertRaises(DocumentValidationError) as context:
+            self.lb_entity.insert_data([{'name': 1}], validate=True)
+        self.assertEqual(context.exception.errors,
+                         [({'name': 1}, ['name: expected string, got int'])])
+        self.assertFalse(self.fake_lightblue_service.insert_data.called)
+        # validator is compiled once per version
+        self.lb_entity.insert_data([{'name': 'x'}], validate=True)
+        self.fake_lightblue_service.get_schema.assert_called_once_with(
+            'fake-name', 'fake_version')
+
+    def test_insert_data_validate_split(self):
+        """
+        Test only valid documents are sent, invalid are in dataErrors
+        """
+        self.fake_lightblue_service.get_schema.return_value = {
+            'schema': {'fields': {'name': {'type': 'string'}}}
+        }
+        self.fake_lightblue_service.insert_data.return_value = {
+            'status': 'COMPLETE', 'modifiedCount': 1}
+        response = self.lb_entity.insert_data(
+            [{'name': 1}, {'name': 'x'}], validate='split')
+        sent = self.fake_lightblue_service.insert_data.call_args[0][2]
+        self.assertEqual(sent['data'], [{'name': 'x'}])
+        self.assertEqual(response['status'], 'PARTIAL')
+        self.assertEqual(response['dataErrors'][0]['data'], {'name': 1})
+
+    @patch('lightblue.entity.time.sleep')
+    def test_bulk_insert_retries(self, mock_sleep):
+        """
+        Test only transiently failed documents are resubmitted
+        """
+        transient = [{'errorCode': 'mongo-crud:DatabaseError'}]
+        permanent = [{'errorCode': 'mongo-crud:Duplicate'}]
+        self.fake_lightblue_service.insert_data.side_effect = [
+            {'status': 'PARTIAL', 'dataErrors': [
+                {'data': {'a': 2}, 'errors': transient},
+                {'data': {'a': 3}, 'errors': permanent},
+                {'data': {'a': 4}, 'errors': transient},
+            ]},
+            {'status': 'ERROR', 'dataErrors': [
+                {'data': {'a': 4}, 'errors': transient}]},
+            {'status': 'COMPLETE'},
+        ]
+        documents = [{'a': index} for index in range(1, 5)]
+        result = self.lb_entity.bulk_insert(documents, retries=3, backoff=1)
+        sent = [call_args[0][2]['data'] for call_args in
+                self.fake_lightblue_service.insert_data.call_args_list]
+        self.assertEqual(sent, [documents, [{'a': 2}, {'a': 4}], [{'a': 4}]])
+        self.assertTrue(
+            self.fake_lightblue_service.insert_data.call_args[1][
+                'return_errors'])
+        self.assertEqual(mock_sleep.call_args_list, [call(1), call(2)])
+        self.assertEqual(result.status, 'PARTIAL')
+        self.assertEqual([r.index for r in result.failed], [2])
+        self.assertEqual([r.attempts for r in result], [1, 2, 1, 3])
+        self.assertEqual(len(result.responses), 3)
+
+    def test_bulk_insert_no_retries(self):
+        """
+        Test per-document results without resubmission and validation
+        """
+        self.fake_lightblue_service.get_schema.return_value = {
+            'schema': {'fields': {'name': {'type': 'string'}}}
+        }
+        self.fake_lightblue_service.insert_data.return_value = None
+        result = self.lb_entity.bulk_insert(
+            [{'name': 1}, {'name': 'x'}], validate=True)
+        self.assertEqual(
+            self.fake_lightblue_service.insert_data.call_count, 1)
+        self.assertEqual([r.index for r in result.permanent], [0, 1])
+        self.assertEqual(result.results[0].attempts, 0)
+
+    @patch('lightblue.entity.time.sleep')
+    def test_bulk_insert_failed_request(self, mock_sleep):
+        """
+        Test failed request is resubmitted only on opt-in
+        """
+        self.fake_lightblue_service.insert_data.return_value = None
+        result = self.lb_entity.bulk_insert([{'a': 1}], retries=2)
+        self.assertEqual(
+            self.fake_lightblue_service.insert_data.call_count, 1)
+        self.assertEqual(len(result.permanent), 1)
+        self.fake_lightblue_service.insert_data.side_effect = [
+            None, {'status': 'COMPLETE'}]
+        result = self.lb_entity.bulk_insert(
+            [{'a': 1}], retries=2, resubmit_failed_requests=True)
+        self.assertEqual(result.status, 'COMPLETE')
+        self.assertEqual(result.results[0].attempts, 2)
+
+    def test_update_many(self):
+        """
+        Test keys with identical updates are sent in chunked $in queries
+        """
+        done = {'$set': {'status': 'done'}}
+        failed = {'$set': {'status': 'failed'}}
+
+        def update_data(entity_name, version, data):
+            values = data['query']['values']
+            if data['update'] == failed:
+                return None
+            return {'status': 'COMPLETE', 'matchCount': len(values),
+                    'modifiedCount': len(values)}
+
+        self.fake_lightblue_service.update_data.side_effect = update_data
+        pairs = [(key, done) for key in 'abcde'] + [('f', failed)]
+        summary = self.lb_entity.update_many(pairs, chunk_size=2, workers=2)
+        sent = sorted(
+            (call_args[0][2]['query']['values'],
+             call_args[0][2]['update']['$set']['status'])
+            for call_args in
+            self.fake_lightblue_service.update_data.call_args_list)
+        self.assertEqual(sent, [(['a', 'b'], 'done'), (['c', 'd'], 'done'),
+                                (['e'], 'done'), (['f'], 'failed')])
+        self.assertEqual(
+            self.fake_lightblue_service.update_data.call_args[0][2][
+                'query']['field'], '_id')
+        self.assertEqual(summary['status'], 'PARTIAL')
+        self.assertEqual(summary['requests'], 4)
+        self.assertEqual(summary['modifiedCount'], 5)
+        self.assertEqual(summary['failed'], [(failed, ['f'])])
+
+    def test_update_many_selection(self):
+        """
+        Test selection combines its query with the key chunks
+        """
+        self.fake_lightblue_service.update_data.return_value = {
+            'status': 'COMPLETE', 'matchCount': 1, 'modifiedCount': 1}
+        selection = LightBlueGenericSelection(
+            ('type', '=', 'x'), interface=self.lb_entity)
+        summary = selection.update_many(
+            [('k1', {'$set': {'a': 1}})], key_field='key')
+        self.assertEqual(summary['status'], 'COMPLETE')
+        self.assertEqual(
+            self.fake_lightblue_service.update_data.call_args[0][2]['query'],
+            {'$and': [
+                {'$and': [{'field': 'type', 'op': '=', 'rvalue': 'x'}]},
+                {'field': 'key', 'op': '$in', 'values': ['k1']},
+            ]})
+
+    def test_update_item_validate(self):
+        """
+        Test invalid update is rejected before sending
+        """
+        self.fake_lightblue_service.get_schema.return_value = {
+            'schema': {'fields': {'name': {'type': 'string'}}}
+        }
+        with self.assertRaises(DocumentValidationError):
+            self.lb_entity.update_item('query', {'$set': {'nme': 'x'}},
+                                       validate=True)
+        self.assertFalse(self.fake_lightblue_service.update_data.called)
@@ -0,0 +1,143 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.export import ExportError, export_entity, hash_partitions, \
+    main, range_partitions
+from . import FakeLightblueService
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+def find(documents):
+    """Fake find_data answering _id keyset pages from documents."""
+    def find_data(entity_name, version, data):
+        query = data['query']
+        last = None
+        if '$and' in query and query['$and'][-1].get('field') == '_id':
+            last = query['$and'][-1]['rvalue']
+        processed = [
+            document for document in documents
+            if last is None or document['_id'] > last
+        ][:data['maxResults']]
+        return {'status': 'COMPLETE', 'processed': processed}
+    return find_data
+
+
+class TestExport(TestCase):
+    """
+    Test cases for partitioned export
+    """
+    test_docstring_prefix = "Export - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.service = FakeLightblueService()
+        self.entity = LightBlueEntity(self.service, 'entity', '1.0.0')
+
+    def _read(self, name):
+        with gzip.open(os.path.join(self.directory, name), 'rb') as shard:
+            return [json.loads(line.decode('utf-8')) for line in shard]
+
+    def test_partitions(self):
+        """
+        Test hash and range partitions are disjoint
+        """
+        partitions = hash_partitions(3)
+        self.assertEqual([query['regex'] for query in partitions[:3]],
+                         ['[0369cf]$', '[147ad]$', '[258be]$'])
+        # catch-all partition of _ids ending with other characters
+        self.assertEqual(partitions[3], {'$not': {
+            'field': '_id', 'regex': '[0123456789abcdef]$'}})
+        self.assertEqual(len(hash_partitions(100)), 17)
+        self.assertEqual(len(hash_partitions(100, catch_all=False)), 16)
+        self.assertEqual(hash_partitions(1, alphabet='a-]')[0]['regex'],
+                         r'[a\-\]]$')
+        self.assertEqual(range_partitions('date', ['b']), [
+            {'field': 'date', 'op': '<', 'rvalue': 'b'},
+            {'field': 'date', 'op': '>=', 'rvalue': 'b'},
+        ])
+        self.assertEqual(range_partitions('date', ['a', 'b'])[1], {'$and': [
+            {'field': 'date', 'op': '>=', 'rvalue': 'a'},
+            {'field': 'date', 'op': '<', 'rvalue': 'b'},
+        ]})
+
+    def test_export(self):
+        """
+        Test partitions are exported to shards with a manifest
+        """
+        documents = [{'_id': str(index)} for index in range(5)]
+        self.service.find_data.side_effect = find(documents)
+        manifest = export_entity(
+            self.entity, self.directory, hash_partitions(2), page_size=2,
+            workers=2)
+        # the fake service ignores the partition query
+        self.assertEqual(manifest['count'], 15)
+        self.assertEqual(len(manifest['partitions']), 3)
+        self.assertEqual(self._read('part-00000.ndjson.gz'), documents)
+        self.assertEqual(self._read('part-00001.ndjson.gz'), documents)
+        with open(os.path.join(self.directory, 'manifest.json')) as data:
+            self.assertEqual(json.load(data), manifest)
+        data = self.service.find_data.call_args_list[0][0][2]
+        self.assertEqual(data['sort'], {'_id': '$asc'})
+        # completed partitions are not exported again
+        self.service.find_data.reset_mock()
+        export_entity(self.entity, self.directory, hash_partitions(2))
+        self.assertFalse(self.service.find_data.called)
+
+    def test_resume(self):
+        """
+        Test interrupted export resumes after the last checkpoint
+        """
+        documents = [{'_id': str(index)} for index in range(5)]
+        pages = find(documents)
+        responses = [pages, None]
+
+        def interrupted(entity_name, version, data):
+            handler = responses.pop(0) if responses else pages
+            return handler and handler(entity_name, version, data)
+
+        self.service.find_data.side_effect = interrupted
+        partitions = hash_partitions(1, catch_all=False)
+        with self.assertRaises(ExportError):
+            export_entity(self.entity, self.directory, partitions,
+                          page_size=2)
+        export_entity(self.entity, self.directory, partitions, page_size=2)
+        self.assertEqual(self._read('part-00000.ndjson.gz'), documents)
+
+    @patch('lightblue.export.export_entity')
+    def test_main(self, mock_export):
+        """
+        Test command line entry point
+        """
+        mock_export.return_value = {'count': 0}
+        self.assertEqual(main([
+            '--data-url', 'http://lb/data', '--metadata-url',
+            'http://lb/metadata', '--entity', 'entity', '--range-field',
+            'date', '--boundaries', 'a,b', self.directory]), 0)
+        args, kwargs = mock_export.call_args
+        self.assertEqual(args[0].entity_name, 'entity')
+        self.assertEqual(len(args[2]), 3)
+        main(['--data-url', 'http://lb/data', '--metadata-url',
+              'http://lb/metadata', '--entity', 'entity', '--partitions',
+              '2', '--alphabet', '01', self.directory])
+        self.assertEqual(
+            [query.get('regex') for query in mock_export.call_args[0][2]],
+            ['[0]$', '[1]$', None])
+        mock_export.side_effect = ExportError('failed')
+        self.assertEqual(main([
+            '--data-url', 'http://lb/data', '--metadata-url',
+            'http://lb/metadata', '--entity', 'entity', self.directory]), 1)
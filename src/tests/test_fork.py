@@ -0,0 +1,108 @@
+import pickle
+from unittest import TestCase
+
+import requests
+
+from lightblue.hedging import HedgingPolicy
+from lightblue.limiter import RequestLimiter
+from lightblue.retry import CircuitBreaker, RetryBudget, RetryPolicy
+from lightblue.service import LightBlueService
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class TestForkSafety(TestCase):
+    """
+    Test cases for fork-safe and picklable service
+    """
+    test_docstring_prefix = "Fork safety - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_pickle(self):
+        """
+        Test service is pickled with configuration only
+        """
+        service = LightBlueService(
+            ['http://lb1/data', 'http://lb2/data'],
+            ['http://lb1/metadata', 'http://lb2/metadata'],
+            ssl_verify=False,
+            timeout=5,
+            limiter=RequestLimiter(max_in_flight=2),
+            retry_policy=RetryPolicy(budget=RetryBudget(ratio=0.5)),
+            circuit_breaker=CircuitBreaker(failure_threshold=2),
+            hedging=HedgingPolicy(percentile=90),
+            session_strategy='per_thread')
+        service.circuit_breaker.record(False)
+        copy = pickle.loads(pickle.dumps(service))
+        self.assertIsNot(copy.session, service.session)
+        self.assertFalse(copy.session.verify)
+        self.assertEqual(copy.timeout, 5)
+        self.assertEqual(copy.session_strategy, 'per_thread')
+        self.assertEqual(len(copy.endpoints.endpoints), 2)
+        self.assertEqual(copy.limiter.max_in_flight, 2)
+        self.assertEqual(copy.retry_policy.budget.ratio, 0.5)
+        self.assertEqual(copy.hedging.percentile, 90)
+        # runtime state starts fresh
+        self.assertEqual(copy.circuit_breaker._failures, 0)
+
+    @patch('requests.Session.post')
+    def test_fork(self, mock_post):
+        """
+        Test sessions are rebuilt when the process id changes
+        """
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        hedging = HedgingPolicy()
+        service = LightBlueService('http://lb/data', 'http://lb/metadata',
+                                   hedging=hedging)
+        session, sessions = service.session, service.sessions
+        service.find_data('entity', None, {})
+        self.assertIs(service.session, session)
+        hedging.shutdown()
+        hedging._executor = 'inherited'
+        with patch('lightblue.service.os.getpid', return_value=-1):
+            service.find_data('entity', None, {})
+            self.assertIsNot(service.session, session)
+            self.assertIsNot(service.sessions, sessions)
+            self.assertIs(service.sessions.session, service.session)
+            self.assertNotEqual(hedging._executor, 'inherited')
+        hedging.shutdown()
+
+    @patch('requests.Session.post')
+    def test_fork_resets_locks(self, mock_post):
+        """
+        Test custom session passed positionally is kept and locks are
+        replaced after fork
+        """
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        custom = requests.Session()
+        limiter = RequestLimiter(max_in_flight=2, rate=100)
+        service = LightBlueService(
+            'http://lb/data', 'http://lb/metadata', True, True, custom,
+            limiter=limiter,
+            operation_limiters={'find': RequestLimiter(max_in_flight=1)},
+            retry_policy=RetryPolicy(),
+            circuit_breaker=CircuitBreaker())
+        locks = [limiter._condition, limiter.bucket._lock,
+                 service.operation_limiters['find']._condition,
+                 service.endpoints._lock, service.circuit_breaker._lock,
+                 service.retry_policy.budget._lock]
+        limiter._in_flight = 1
+        with patch('lightblue.service.os.getpid', return_value=-1):
+            service.find_data('entity', None, {})
+        self.assertIs(service.session, custom)
+        self.assertEqual(limiter.in_flight, 0)
+        for old, new in zip(locks, [
+                limiter._condition, limiter.bucket._lock,
+                service.operation_limiters['find']._condition,
+                service.endpoints._lock, service.circuit_breaker._lock,
+                service.retry_policy.budget._lock]):
+            self.assertIsNot(old, new)
@@ -0,0 +1,123 @@
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.frozen import FrozenSelection
+from lightblue.selection import LightBlueGenericSelection
+from . import FakeLightblueService
+
+
+class AliasSelection(LightBlueGenericSelection):
+
+    @property
+    def kwargs_aliases(self):
+        return {'ident': 'identifier.value'}
+
+    def filter_ident(self, ident):
+        self._add_to_query(ident=ident)
+        return self
+
+
+class TestFrozenSelection(TestCase):
+    """
+    Test cases for FrozenSelection class
+    """
+    test_docstring_prefix = "Frozen selection - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.service = FakeLightblueService()
+        self.interface = LightBlueEntity(self.service, 'entity', '1.0.0')
+        self.service.find_data.return_value = {
+            'status': 'COMPLETE', 'matchCount': 1, 'processed': [{'a': 1}]}
+        self.service.update_data.return_value = {'status': 'COMPLETE'}
+
+    def test_derived_copies(self):
+        """
+        Test chaining returns new objects and keeps the base unchanged
+        """
+        base = FrozenSelection(self.interface, ('size', '>', 1))
+        derived = base.where(name='foo').with_lb_id().within(5)
+        self.assertEqual(base._queries, (('size', '>', 1), ))
+        self.assertEqual(base._projections, ())
+        self.assertIsNone(base._deadline)
+        self.assertEqual(derived._queries,
+                         (('size', '>', 1), ('name', '=', 'foo')))
+        self.assertEqual(derived._projections, ('_id', ))
+        self.assertEqual(derived._deadline, 5)
+        self.assertTrue(derived.normalized().thaw().normalize_queries)
+        self.assertFalse(derived.thaw().normalize_queries)
+        # unchanged parts are shared
+        self.assertIs(derived.interface, base.interface)
+        self.assertIs(base.where()._queries, base._queries)
+        with self.assertRaises(AttributeError):
+            base._queries = ()
+        with self.assertRaises(AttributeError):
+            base.other = 1
+
+    def test_execution(self):
+        """
+        Test calls are executed by fresh selections
+        """
+        base = FrozenSelection(self.interface, name='foo')
+        self.assertEqual(base.first, {'a': 1})
+        self.assertTrue(base.exist)
+        self.assertEqual(base.update_with({'b': 1}), {'status': 'COMPLETE'})
+        # no LockedQuery - base can be updated again
+        self.assertEqual(base.update_with({'b': 2}), {'status': 'COMPLETE'})
+        data = self.service.update_data.call_args[0][2]
+        self.assertEqual(data['update'], {'$set': {'b': 2}})
+        self.assertEqual(data['query']['$and'],
+                         [{'field': 'name', 'op': '=', 'rvalue': 'foo'}])
+
+    def test_selection_class(self):
+        """
+        Test aliases of the selection class and freezing a selection
+        """
+        base = FrozenSelection(
+            self.interface, ident='x', selection_class=AliasSelection)
+        self.assertEqual(base._queries, (('identifier.value', '=', 'x'), ))
+        self.assertIsInstance(base.thaw(), AliasSelection)
+        raw = {'field': 'a', 'op': '=', 'rvalue': 1}
+        selection = LightBlueGenericSelection(
+            interface=self.interface, name='foo')
+        selection.add_raw_query(raw)
+        frozen = FrozenSelection.from_selection(selection)
+        raw['rvalue'] = 2
+        self.assertEqual(frozen._raw_queries[0]['rvalue'], 1)
+        self.assertEqual(frozen._queries, (('name', '=', 'foo'), ))
+
+    def test_selection_methods(self):
+        """
+        Test methods of the selection class are shared, chaining methods
+        return frozen copies
+        """
+        base = FrozenSelection(
+            self.interface, selection_class=AliasSelection)
+        derived = base.filter_ident('x')
+        self.assertIsInstance(derived, FrozenSelection)
+        self.assertEqual(base._queries, ())
+        self.assertEqual(derived._queries, (('identifier.value', '=', 'x'), ))
+        self.assertEqual(derived.all, [{'a': 1}])
+        with self.assertRaises(AttributeError):
+            base.missing
+
+    def test_raw_queries_shared(self):
+        """
+        Test raw queries are copied once, shared by derived selections
+        and copied for thawed selections
+        """
+        raw = {'field': 'a', 'op': '=', 'rvalue': 1}
+        base = FrozenSelection(self.interface).add_raw_query(raw)
+        derived = base.where(name='foo').with_lb_id().within(5)
+        self.assertIsNot(base._raw_queries[0], raw)
+        self.assertIs(derived._raw_queries, base._raw_queries)
+        extended = derived.add_raw_query({'field': 'b', 'op': '=',
+                                          'rvalue': 2})
+        self.assertIs(extended._raw_queries[0], base._raw_queries[0])
+        thawed = base.thaw()
+        thawed._raw_queries[0]['rvalue'] = 2
+        self.assertEqual(base._raw_queries[0]['rvalue'], 1)
@@ -0,0 +1,147 @@
+import threading
+import time
+
+from unittest import TestCase
+
+from lightblue.hedging import HedgingPolicy
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+
+class TestHedgingPolicy(TestCase):
+    """
+    Test cases for HedgingPolicy class
+    """
+    test_docstring_prefix = "Hedging - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.policy = HedgingPolicy(initial_delay=0.01, max_extra_load=1)
+
+    def tearDown(self):
+        self.policy.shutdown()
+
+    def slow_then_fast(self):
+        """
+        Create send function - first call is slow, next calls are fast
+        """
+        calls = []
+        release = threading.Event()
+        responses = [Mock(name='slow', status_code=200),
+                     Mock(name='fast', status_code=200)]
+
+        def send():
+            index = len(calls)
+            calls.append(index)
+            if index == 0:
+                release.wait(1)
+            return responses[index]
+        return send, calls, release, responses
+
+    def test_applies_to(self):
+        """
+        Test only idempotent operations are hedged by default
+        """
+        self.assertTrue(self.policy.applies_to('find'))
+        self.assertTrue(self.policy.applies_to('get_schema'))
+        self.assertFalse(self.policy.applies_to('insert'))
+
+    def test_fast_request_not_hedged(self):
+        """
+        Test request answered before the delay is not hedged
+        """
+        send = Mock(return_value='response')
+        self.policy.initial_delay = 1
+        self.assertEqual(self.policy.execute('find', send), 'response')
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.policy.stats['hedged'], 0)
+
+    def test_slow_request_hedged(self):
+        """
+        Test slow request is hedged, first response wins, loser is closed
+        """
+        send, calls, release, responses = self.slow_then_fast()
+        self.assertIs(self.policy.execute('find', send), responses[1])
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(len(calls), 2)
+        responses[0].close.assert_called_once_with()
+        self.assertEqual(self.policy.stats['hedge_wins'], 1)
+
+    def hedge_first(self, statuses):
+        """
+        Create send function - the hedge answers before the primary
+        """
+        responses = [Mock(name='primary', status_code=statuses[0]),
+                     Mock(name='hedge', status_code=statuses[1])]
+        calls = []
+        release = threading.Event()
+
+        def send():
+            index = len(calls)
+            calls.append(index)
+            if index == 0:
+                release.wait(5)
+            else:
+                # primary answers once the hedge response is received
+                threading.Timer(0.02, release.set).start()
+            return responses[index]
+        return send, responses
+
+    def test_server_error_loses(self):
+        """
+        Test fast 5xx response loses while the other request is pending
+        """
+        send, responses = self.hedge_first((200, 503))
+        self.assertIs(self.policy.execute('find', send), responses[0])
+        responses[1].close.assert_called_once_with()
+        self.assertEqual(self.policy.stats['hedge_wins'], 0)
+        # both failed - the first server error is returned
+        send, responses = self.hedge_first((500, 500))
+        self.assertIs(self.policy.execute('find', send), responses[1])
+
+    def test_hedge_send(self):
+        """
+        Test hedge is sent by hedge_send, its error does not fail the call
+        """
+        send, calls, release, responses = self.slow_then_fast()
+
+        def hedge_send():
+            release.set()
+            raise RuntimeError('limit')
+
+        hedge_send = Mock(side_effect=hedge_send)
+        self.assertIs(self.policy.execute('find', send, hedge_send),
+                      responses[0])
+        self.assertEqual(len(calls), 1)
+        hedge_send.assert_called_once_with()
+
+    def test_extra_load_cap(self):
+        """
+        Test hedging stops once the extra load cap is spent
+        """
+        self.policy.max_extra_load = 0
+        self.policy._tokens = 0
+        send, calls, release, responses = self.slow_then_fast()
+        release.set()
+        self.assertIs(self.policy.execute('find', send), responses[0])
+        self.assertEqual(len(calls), 1)
+
+    def test_percentile_delay(self):
+        """
+        Test delay is taken from the latency percentile
+        """
+        policy = HedgingPolicy(percentile=90, min_samples=10, min_delay=0)
+        self.assertEqual(policy.delay('find'), policy.initial_delay)
+        for latency in range(1, 11):
+            policy.record('find', latency / 10.0)
+        self.assertEqual(policy.delay('find'), 0.9)
+        policy.max_delay = 0.5
+        self.assertEqual(policy.delay('find'), 0.5)
@@ -0,0 +1,183 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.importer import BulkImportError, batches, import_file, main, \
+    read_csv
+from . import FakeLightblueService
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class TestImporter(TestCase):
+    """
+    Test cases for streaming bulk import
+    """
+    test_docstring_prefix = "Bulk import - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.service = FakeLightblueService()
+        self.entity = LightBlueEntity(self.service, 'entity', '1.0.0')
+        self.inserted = []
+
+        def insert_data(entity_name, version, data, return_errors=False):
+            self.inserted.extend(data['data'])
+            errors = [{'data': document, 'errors': [{'msg': 'invalid'}]}
+                      for document in data['data'] if document.get('bad')]
+            if len(errors) == len(data['data']):
+                return {'status': 'ERROR', 'dataErrors': errors} \
+                    if return_errors else None
+            return {'status': 'PARTIAL' if errors else 'COMPLETE',
+                    'dataErrors': errors}
+
+        self.service.insert_data.side_effect = insert_data
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_ndjson(self, name, documents):
+        with gzip.open(self._path(name), 'wb') as data:
+            for document in documents:
+                data.write((json.dumps(document) + '\n').encode('utf-8'))
+        return self._path(name)
+
+    def test_batches(self):
+        """
+        Test documents are batched by count and bytes
+        """
+        documents = [{'a': index} for index in range(5)]
+        self.assertEqual(
+            [(first, end, len(batch)) for first, end, batch
+             in batches(documents, max_items=2)],
+            [(0, 2, 2), (2, 4, 2), (4, 5, 1)])
+        self.assertEqual(
+            [(first, end) for first, end, _
+             in batches(documents, max_bytes=20, start=1)],
+            [(1, 3), (3, 5)])
+        self.assertEqual(
+            [(first, end) for first, end, _
+             in batches(documents, max_items=2, skip={1: 3})],
+            [(0, 1), (3, 5)])
+
+    def test_csv(self):
+        """
+        Test CSV rows with dotted columns are nested
+        """
+        stream = io.StringIO(u'name,meta.tag,meta.note\nfoo,x,\n')
+        self.assertEqual(list(read_csv(stream)),
+                         [{'name': 'foo', 'meta': {'tag': 'x'}}])
+
+    def test_import(self):
+        """
+        Test gzipped NDJSON import with rejects and checkpoint
+        """
+        documents = [{'a': index} for index in range(5)] + [{'bad': True}]
+        path = self._write_ndjson('input.ndjson.gz', documents)
+        state = import_file(
+            self.entity, path, rejects_path=self._path('rejects'),
+            checkpoint_path=self._path('checkpoint'), max_items=2,
+            workers=2)
+        self.assertEqual(state, {'offset': 6, 'inserted': 5, 'rejected': 1})
+        self.assertEqual(sorted(self.inserted, key=json.dumps),
+                         sorted(documents, key=json.dumps))
+        with open(self._path('rejects')) as rejects:
+            self.assertEqual([json.loads(line) for line in rejects], [{
+                'offset': 5,
+                'document': {'bad': True},
+                'errors': [{'msg': 'invalid'}],
+            }])
+
+    def test_resume(self):
+        """
+        Test failed import resumes from the acknowledged offset
+        """
+        documents = [{'a': index} for index in range(6)]
+        path = self._write_ndjson('input.ndjson.gz', documents)
+        insert_data = self.service.insert_data.side_effect
+        self.service.insert_data.side_effect = [
+            insert_data('entity', None, {'data': documents[:2]}), None]
+        with self.assertRaises(BulkImportError):
+            import_file(self.entity, path, max_items=2, workers=1,
+                        checkpoint_path=self._path('checkpoint'))
+        self.service.insert_data.side_effect = insert_data
+        del self.inserted[:]
+        state = import_file(self.entity, path, max_items=2,
+                            checkpoint_path=self._path('checkpoint'))
+        self.assertEqual(state['offset'], 6)
+        self.assertEqual(state['inserted'], 6)
+        self.assertEqual(self.inserted, documents[2:])
+
+    def test_resume_out_of_order(self):
+        """
+        Test batches acknowledged after a failed one are not inserted again
+        """
+        documents = [{'a': index} for index in range(6)]
+        path = self._write_ndjson('input.ndjson.gz', documents)
+        insert_data = self.service.insert_data.side_effect
+
+        def fail_first(entity_name, version, data, return_errors=False):
+            if data['data'] == documents[:2]:
+                return None
+            return insert_data(entity_name, version, data, return_errors)
+
+        self.service.insert_data.side_effect = fail_first
+        with self.assertRaises(BulkImportError):
+            import_file(self.entity, path, max_items=2, workers=3,
+                        checkpoint_path=self._path('checkpoint'))
+        with open(self._path('checkpoint')) as checkpoint:
+            self.assertEqual(json.load(checkpoint)['completed'],
+                             [[2, 4], [4, 6]])
+        self.service.insert_data.side_effect = insert_data
+        del self.inserted[:]
+        state = import_file(self.entity, path, max_items=2,
+                            checkpoint_path=self._path('checkpoint'))
+        self.assertEqual(state, {'offset': 6, 'inserted': 6, 'rejected': 0})
+        self.assertEqual(self.inserted, documents[:2])
+
+    def test_all_rejected(self):
+        """
+        Test batch with all documents rejected is written to rejects
+        """
+        documents = [{'bad': index} for index in range(1, 4)]
+        path = self._write_ndjson('input.ndjson.gz', documents)
+        state = import_file(
+            self.entity, path, rejects_path=self._path('rejects'),
+            checkpoint_path=self._path('checkpoint'), max_items=2)
+        self.assertEqual(state, {'offset': 3, 'inserted': 0, 'rejected': 3})
+        self.assertTrue(
+            self.service.insert_data.call_args[1]['return_errors'])
+        with open(self._path('rejects')) as rejects:
+            # batches are inserted concurrently
+            self.assertEqual(
+                sorted(json.loads(line)['offset'] for line in rejects),
+                [0, 1, 2])
+
+    @patch('lightblue.importer.import_file')
+    def test_main(self, mock_import):
+        """
+        Test command line entry point
+        """
+        mock_import.return_value = {'inserted': 1, 'rejected': 0}
+        arguments = ['--data-url', 'http://lb/data', '--metadata-url',
+                     'http://lb/metadata', '--entity', 'entity', 'in.csv']
+        self.assertEqual(main(arguments), 0)
+        kwargs = mock_import.call_args[1]
+        self.assertEqual(kwargs['rejects_path'], 'in.csv.rejects')
+        self.assertEqual(kwargs['checkpoint_path'], 'in.csv.checkpoint')
+        mock_import.side_effect = BulkImportError('failed')
+        self.assertEqual(main(arguments), 1)
@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+from lightblue.limiter import LimitExceeded, RequestLimiter, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    """
+    Test cases for TokenBucket class
+    """
+    test_docstring_prefix = "Token bucket - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_burst(self):
+        """
+        Test bucket allows burst and rejects next request
+        """
+        bucket = TokenBucket(rate=1, burst=2)
+        self.assertTrue(bucket.acquire(blocking=False))
+        self.assertTrue(bucket.acquire(blocking=False))
+        self.assertFalse(bucket.acquire(blocking=False))
+
+    def test_blocking_refill(self):
+        """
+        Test blocking acquire waits for refill
+        """
+        bucket = TokenBucket(rate=100, burst=1)
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire(timeout=1))
+
+    def test_invalid_rate(self):
+        """
+        Test rate has to be positive
+        """
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestRequestLimiter(TestCase):
+    """
+    Test cases for RequestLimiter class
+    """
+    test_docstring_prefix = "Request limiter - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_max_in_flight_fail_fast(self):
+        """
+        Test non-blocking limiter rejects requests over max in flight
+        """
+        limiter = RequestLimiter(max_in_flight=1, blocking=False)
+        limiter.acquire()
+        with self.assertRaises(LimitExceeded):
+            limiter.acquire()
+        limiter.release()
+        limiter.acquire()
+        self.assertEqual(limiter.in_flight, 1)
+        self.assertEqual(limiter.stats['acquired'], 2)
+        self.assertEqual(limiter.stats['rejected'], 1)
+
+    def test_blocking_timeout(self):
+        """
+        Test blocking limiter gives up after timeout
+        """
+        limiter = RequestLimiter(max_in_flight=1, timeout=0.01)
+        limiter.acquire()
+        with self.assertRaises(LimitExceeded):
+            limiter.acquire()
+
+    def test_rate_fail_fast(self):
+        """
+        Test non-blocking limiter rejects requests over rate
+        """
+        limiter = RequestLimiter(rate=1, burst=1, blocking=False)
+        limiter.acquire()
+        with self.assertRaises(LimitExceeded):
+            limiter.acquire()
+
+    def test_slot_rejection_keeps_token(self):
+        """
+        Test request rejected by max in-flight does not spend a token and
+        rate rejection returns the slot
+        """
+        limiter = RequestLimiter(max_in_flight=1, rate=1, burst=2,
+                                 blocking=False)
+        limiter.acquire()
+        with self.assertRaises(LimitExceeded):
+            limiter.acquire()
+        limiter.release()
+        limiter.acquire()
+        limiter.release()
+        with self.assertRaises(LimitExceeded):
+            limiter.acquire()
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_wait_time_reported(self):
+        """
+        Test queue wait time is reported
+        """
+        limiter = RequestLimiter(rate=50, burst=1)
+        self.assertEqual(limiter.acquire(), limiter.stats['wait_max'])
+        waited = limiter.acquire()
+        self.assertGreater(waited, 0)
+        self.assertAlmostEqual(limiter.stats['wait_max'], waited)
@@ -0,0 +1,138 @@
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.normalize import NEVER, normalize
+from lightblue.selection import LightBlueGenericSelection
+from . import FakeLightblueService
+
+
+def eq(field, value):
+    return {'field': field, 'op': '=', 'rvalue': value}
+
+
+class TestNormalize(TestCase):
+    """
+    Test cases for query normalization
+    """
+    test_docstring_prefix = "Query normalization - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_flatten(self):
+        """
+        Test nested $and is flattened, duplicates removed, single unwrapped
+        """
+        self.assertEqual(
+            normalize({'$and': [eq('a', 1), {'$and': [eq('a', 1)]}]}),
+            eq('a', 1))
+        self.assertEqual(
+            normalize({'$and': [eq('a', 1), {'$and': [eq('b', 2)]}]}),
+            {'$and': [eq('a', 1), eq('b', 2)]})
+
+    def test_or_to_in(self):
+        """
+        Test $or of equalities is merged into $in
+        """
+        self.assertEqual(normalize({'$or': [
+            eq('a', 1),
+            eq('b', 1),
+            {'$or': [eq('a', 2), {'field': 'a', 'op': '$in',
+                                  'values': [2, 3]}]},
+        ]}), {'$or': [
+            {'field': 'a', 'op': '$in', 'values': [1, 2, 3]},
+            eq('b', 1),
+        ]})
+        self.assertEqual(
+            normalize({'field': 'a', 'op': '$in', 'values': [1, 1]}),
+            eq('a', 1))
+
+    def test_in_intersection(self):
+        """
+        Test $in clauses of a field are intersected in $and
+        """
+        self.assertEqual(normalize({'$and': [
+            {'field': 'a', 'op': '$in', 'values': [1, 2, 3]},
+            {'field': 'a', 'op': '$in', 'values': [3, 2, 4]},
+        ]}), {'field': 'a', 'op': '$in', 'values': [2, 3]})
+
+    def test_contradictions(self):
+        """
+        Test queries which can never match
+        """
+        never = [
+            {'$and': [eq('a', 1), eq('a', 2)]},
+            {'$and': [eq('a', 1), {'field': 'a', 'op': '$in',
+                                   'values': [2, 3]}]},
+            {'$and': [eq('a', 5), {'field': 'a', 'op': '>', 'rvalue': 5}]},
+            {'$and': [{'field': 'a', 'op': '>=', 'rvalue': 5},
+                      {'field': 'a', 'op': '<', 'rvalue': 5}]},
+            {'$and': [eq('a', 1), {'field': 'a', 'op': '!=', 'rvalue': 1}]},
+            {'field': 'a', 'op': '$in', 'values': []},
+            {'$or': [{'$and': [eq('a', 1), eq('a', 2)]}]},
+            {'$and': [eq('b', 1), {'$or': [
+                {'field': 'a', 'op': '$in', 'values': []}]}]},
+        ]
+        for query in never:
+            self.assertIs(normalize(query), NEVER, query)
+        possible = [
+            {'$and': [{'field': 'a', 'op': '>=', 'rvalue': 5},
+                      {'field': 'a', 'op': '<=', 'rvalue': 5}]},
+            {'$and': [eq('a', 'x'), {'field': 'a', 'op': '>', 'rvalue': 1}]},
+            {'$and': [eq('a', 1), eq('b', 2)]},
+        ]
+        for query in possible:
+            self.assertIsNot(normalize(query), NEVER, query)
+        self.assertEqual(
+            normalize({'$or': [{'$and': [eq('a', 1), eq('a', 2)]},
+                               eq('b', 1)]}),
+            eq('b', 1))
+
+    def test_array_elements(self):
+        """
+        Test clauses on array elements are never contradictions
+        """
+        tags = {'$and': [eq('tags.*', 'a'), eq('tags.*', 'b')]}
+        self.assertEqual(normalize(tags), tags)
+        nums = {'$and': [{'field': 'nums.*', 'op': '>', 'rvalue': 5},
+                         {'field': 'nums.*', 'op': '<', 'rvalue': 3}]}
+        self.assertEqual(normalize(nums), nums)
+        ins = {'$and': [
+            {'field': 'tags.*', 'op': '$in', 'values': ['a', 'c']},
+            {'field': 'tags.*', 'op': '$in', 'values': ['b', 'd']},
+        ]}
+        self.assertEqual(normalize(ins), ins)
+
+    def test_mixed_types(self):
+        """
+        Test values of different types are not compared
+        """
+        mixed = {'$and': [eq('a', 1), eq('a', '1')]}
+        self.assertEqual(normalize(mixed), mixed)
+        mixed_in = {'$and': [
+            {'field': 'a', 'op': '$in', 'values': [1, 2]},
+            {'field': 'a', 'op': '$in', 'values': ['2', '3']},
+        ]}
+        self.assertEqual(normalize(mixed_in), mixed_in)
+
+    def test_selection(self):
+        """
+        Test normalized selection skips requests which can never match
+        """
+        service = FakeLightblueService()
+        interface = LightBlueEntity(service, 'entity', '1.0.0')
+        selection = LightBlueGenericSelection(
+            ('a', '=', 1), ('a', '=', 2), interface=interface).normalized()
+        self.assertFalse(selection.exist)
+        self.assertEqual(selection.all, [])
+        self.assertEqual(selection.update_with({'b': 1})['modifiedCount'], 0)
+        self.assertFalse(service.find_data.called)
+        self.assertFalse(service.update_data.called)
+        service.find_data.return_value = {'status': 'COMPLETE'}
+        LightBlueGenericSelection(
+            ('a', '=', 1), ('a', '=', 1), interface=interface
+        ).normalized().find()
+        self.assertEqual(service.find_data.call_args[0][2]['query'],
+                         eq('a', 1))
@@ -0,0 +1,87 @@
+import json
+
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.profiling import Profiler, profile, stage
+from lightblue.selection import LightBlueGenericSelection
+from lightblue.service import LightBlueService
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class TestProfiling(TestCase):
+    """
+    Test cases for per-stage profiling
+    """
+    test_docstring_prefix = "Profiling - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        service = LightBlueService('http://lb/data', 'http://lb/metadata')
+        self.interface = LightBlueEntity(service, 'entity', '1.0.0')
+
+    def test_stage_inactive(self):
+        """
+        Test stages are ignored without active profiler
+        """
+        profiler = Profiler()
+        with stage('query'):
+            pass
+        self.assertEqual(profiler.calls, [])
+
+    @patch('requests.Session.post')
+    def test_selection_stages(self, mock_post):
+        """
+        Test all stages of a selection call are recorded
+        """
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {
+            'status': 'COMPLETE',
+            'matchCount': 1,
+            'processed': [{'foo': 'bar'}],
+        }
+        selection = LightBlueGenericSelection(
+            foo='bar', interface=self.interface)
+        with profile() as profiler:
+            result = selection.find(selector='/processed/0/foo',
+                                    postprocess=lambda x: x.upper())
+            selection.refresh().all
+        self.assertEqual(result, 'BAR')
+        self.assertEqual(len(profiler.calls), 2)
+        self.assertIs(selection.last_profile, profiler.calls[1])
+        self.assertEqual(
+            list(profiler.calls[0].stages),
+            ['query', 'encode', 'queue', 'http', 'decode',
+             'check_response', 'select', 'postprocess'])
+        aggregated = profiler.aggregate()
+        self.assertEqual(aggregated['http']['count'], 2)
+        self.assertEqual(aggregated['postprocess']['count'], 1)
+        self.assertIn('check_response', profiler.report())
+        # body is encoded by the service while profiling
+        body = json.loads(mock_post.call_args[1]['data'].decode('utf-8'))
+        self.assertEqual(body['objectType'], 'entity')
+
+    @patch('requests.Session.post')
+    def test_profiler_reused(self, mock_post):
+        """
+        Test calls from several blocks are aggregated by one profiler
+        """
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        profiler = Profiler()
+        selection = LightBlueGenericSelection(interface=self.interface)
+        for _ in range(3):
+            with profile(profiler):
+                selection.refresh().find()
+        selection.refresh().find()
+        self.assertEqual(len(profiler.calls), 3)
+        self.assertEqual(mock_post.call_args[1]['json']['objectType'],
+                         'entity')
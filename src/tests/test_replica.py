@@ -0,0 +1,134 @@
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.selection import LightBlueGenericSelection
+from . import FakeLightblueService
+
+
+DOCUMENTS = [
+    {'_id': '1', 'name': 'a', 'size': 1, 'meta': {'tag': 'x'}},
+    {'_id': '2', 'name': 'b', 'size': 5, 'meta': {'tag': 'y'}},
+    {'_id': '3', 'name': 'c', 'size': 10, 'meta': {'tag': 'x'}},
+]
+
+
+class TestLocalReplica(TestCase):
+    """
+    Test cases for LocalReplica class
+    """
+    test_docstring_prefix = "Local replica - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.service = FakeLightblueService()
+        self.entity = LightBlueEntity(self.service, 'entity', '1.0.0')
+        self.service.find_data.side_effect = [
+            {'status': 'COMPLETE', 'processed': DOCUMENTS},
+            {'status': 'COMPLETE', 'processed': []},
+        ]
+        self.replica = self.entity.local_replica(['name', 'size', 'meta.tag'])
+        self.addCleanup(self.replica.close)
+        self.assertTrue(self.replica.refresh())
+        self.service.find_data.reset_mock()
+        self.service.find_data.side_effect = None
+
+    def _ids(self, response):
+        return [document['_id'] for document in response['processed']]
+
+    def test_local_queries(self):
+        """
+        Test equality, range and $in queries are answered locally
+        """
+        selection = LightBlueGenericSelection(
+            ('size', '>=', 5), interface=self.replica)
+        self.assertEqual([item['_id'] for item in selection.all], ['2', '3'])
+        response = self.replica.find_item({'$or': [
+            {'field': 'meta.tag', 'op': '=', 'rvalue': 'y'},
+            {'field': 'name', 'op': '$in', 'values': ['a']},
+        ]}, sort={'size': '$desc'})
+        self.assertEqual(self._ids(response), ['2', '1'])
+        response = self.replica.find_item(
+            {'field': 'size', 'op': '<', 'rvalue': 100},
+            projection=[{'field': 'meta.tag', 'include': True}],
+            from_=1, max_results=1)
+        self.assertEqual(response['processed'], [{'meta': {'tag': 'y'}}])
+        self.assertEqual(self.replica.find_all()['matchCount'], 3)
+        self.assertFalse(self.service.find_data.called)
+        self.assertEqual(self.replica.stats, {'local': 4, 'remote': 0})
+
+    def test_fallback(self):
+        """
+        Test unsupported queries are sent to the server
+        """
+        self.service.find_data.return_value = {'status': 'COMPLETE'}
+        query = {'field': '_id', 'op': '=', 'rvalue': '1'}
+        self.assertEqual(self.replica.find_item(query),
+                         {'status': 'COMPLETE'})
+        self.assertEqual(
+            self.service.find_data.call_args[0][2]['query'], query)
+        self.assertEqual(self.replica.stats['remote'], 1)
+        # other methods are delegated to the entity
+        self.assertEqual(self.replica.entity_name, 'entity')
+
+    def _replica(self, documents, indexes):
+        self.service.find_data.side_effect = [
+            {'status': 'COMPLETE', 'processed': documents},
+            {'status': 'COMPLETE', 'processed': []},
+        ]
+        replica = self.entity.local_replica(indexes)
+        self.addCleanup(replica.close)
+        self.assertTrue(replica.refresh())
+        self.service.find_data.reset_mock()
+        self.service.find_data.side_effect = None
+        return replica
+
+    def test_missing_fields(self):
+        """
+        Test negations match documents without the field
+        """
+        replica = self._replica([
+            {'_id': '1', 'name': 'a'},
+            {'_id': '2'},
+            {'_id': '3', 'name': 'c'},
+        ], ['name'])
+        for query in [
+            {'field': 'name', 'op': '!=', 'rvalue': 'a'},
+            {'field': 'name', 'op': '$nin', 'values': ['a']},
+            {'$not': {'field': 'name', 'op': '=', 'rvalue': 'a'}},
+        ]:
+            self.assertEqual(self._ids(replica.find_item(query)),
+                             ['2', '3'], query)
+        self.assertFalse(self.service.find_data.called)
+
+    def test_match_count(self):
+        """
+        Test matchCount of a page is the count of all matches
+        """
+        response = self.replica.find_item(
+            {'field': 'size', 'op': '>', 'rvalue': 0}, max_results=1)
+        self.assertEqual(len(response['processed']), 1)
+        self.assertEqual(response['matchCount'], 3)
+
+    def test_arrays_and_coercion(self):
+        """
+        Test array fields go to the server, rvalues are coerced
+        """
+        replica = self._replica([
+            {'_id': '1', 'tags': ['a', 'b'], 'size': 1, 'code': 'x1'},
+            {'_id': '2', 'tags': 'c', 'size': 5, 'code': '7'},
+        ], ['tags', 'size', 'code'])
+        self.service.find_data.return_value = {'status': 'COMPLETE'}
+        replica.find_item({'field': 'tags', 'op': '=', 'rvalue': 'a'})
+        self.assertEqual(replica.stats, {'local': 0, 'remote': 1})
+        response = replica.find_item(
+            {'field': 'size', 'op': '$in', 'values': ['5']})
+        self.assertEqual(self._ids(response), ['2'])
+        response = replica.find_item(
+            {'field': 'code', 'op': '=', 'rvalue': 7})
+        self.assertEqual(self._ids(response), ['2'])
+        replica.find_item({'field': 'size', 'op': '=', 'rvalue': 'x'})
+        self.assertEqual(replica.stats, {'local': 2, 'remote': 2})
@@ -0,0 +1,136 @@
+from unittest import TestCase
+
+from lightblue.common import deadline
+from lightblue.retry import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, \
+    CircuitOpenError, RetryBudget, RetryPolicy
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+
+class TestRetryPolicy(TestCase):
+    """
+    Test cases for RetryPolicy class
+    """
+    test_docstring_prefix = "Retry policy - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3, backoff_base=1)
+
+    @staticmethod
+    def response(status_code, headers=None):
+        return Mock(status_code=status_code, headers=headers or {})
+
+    def test_operations(self):
+        """
+        Test only idempotent operations are retried by default
+        """
+        self.assertTrue(self.policy.applies_to('find'))
+        self.assertFalse(self.policy.applies_to('insert'))
+        self.assertTrue(RetryPolicy(retry_writes=True).applies_to('insert'))
+
+    @patch('random.uniform')
+    def test_full_jitter(self, mock_uniform):
+        """
+        Test backoff is random between 0 and exponential cap
+        """
+        self.policy.backoff(3)
+        mock_uniform.assert_called_once_with(0, 4)
+
+    def test_delay_status(self):
+        """
+        Test only configured statuses are retried
+        """
+        self.assertIsNotNone(self.policy.delay(1, self.response(503)))
+        self.assertIsNone(self.policy.delay(1, self.response(404)))
+
+    def test_delay_max_attempts(self):
+        """
+        Test retries stop after max attempts
+        """
+        self.assertIsNone(self.policy.delay(3, self.response(503)))
+
+    def test_retry_after(self):
+        """
+        Test Retry-After header is respected
+        """
+        response = self.response(503, {'Retry-After': '2'})
+        self.assertEqual(self.policy.delay(1, response), 2)
+        response = self.response(503, {'Retry-After': '120'})
+        self.assertIsNone(self.policy.delay(1, response))
+        response = self.response(
+            503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(self.policy.retry_after(response), 0)
+
+    def test_delay_deadline(self):
+        """
+        Test request is not retried if the delay exceeds the deadline
+        """
+        response = self.response(503, {'Retry-After': '2'})
+        with deadline(1) as active:
+            self.assertIsNone(self.policy.delay(1, response, active))
+
+    def test_budget(self):
+        """
+        Test retries stop once the budget is spent
+        """
+        self.policy.budget = RetryBudget(ratio=0.5, max_tokens=1)
+        self.assertIsNotNone(self.policy.delay(1))
+        self.assertIsNone(self.policy.delay(1))
+        self.policy.budget.deposit()
+        self.policy.budget.deposit()
+        self.assertIsNotNone(self.policy.delay(1))
+
+
+class TestCircuitBreaker(TestCase):
+    """
+    Test cases for CircuitBreaker class
+    """
+    test_docstring_prefix = "Circuit breaker - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2,
+                                      recovery_timeout=0)
+
+    def test_opens_after_failures(self):
+        """
+        Test circuit opens after consecutive failures
+        """
+        self.breaker.recovery_timeout = 60
+        self.breaker.record(False)
+        self.breaker.record(True)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+
+    def test_half_open(self):
+        """
+        Test trial request closes or opens the circuit again
+        """
+        self.breaker.record(False)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.before_request()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+        self.breaker.record(False)
+        self.breaker.before_request()
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.before_request()
+        self.breaker.before_request()
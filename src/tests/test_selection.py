@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.selection import LightBlueGenericSelection
+from . import FakeLightblueService
+
+
+class TestSelectionMemoization(TestCase):
+    """
+    Test cases for memoized find response of LightBlueGenericSelection
+    """
+    test_docstring_prefix = "Selection memoization - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.service = FakeLightblueService()
+        self.service.find_data.return_value = {
+            'status': 'COMPLETE',
+            'matchCount': 2,
+            'processed': [{'a': 1}, {'a': 2}],
+        }
+        self.service.update_data.return_value = {
+            'status': 'COMPLETE', 'matchCount': 2, 'modifiedCount': 2}
+        self.interface = LightBlueEntity(self.service, 'entity', '1.0.0')
+        self.selection = LightBlueGenericSelection(
+            a=1, interface=self.interface)
+
+    def test_shared_response(self):
+        """
+        Test first, all, exist and find() share one find request
+        """
+        self.assertTrue(self.selection.exist)
+        self.assertEqual(self.selection.first, {'a': 1})
+        self.assertEqual(self.selection.all, [{'a': 1}, {'a': 2}])
+        self.assertEqual(
+            self.selection.find(selector='/processed/*/a'), [1, 2])
+        self.assertEqual(self.service.find_data.call_count, 1)
+        self.selection.refresh()
+        self.assertTrue(self.selection.exist)
+        self.assertEqual(self.service.find_data.call_count, 2)
+
+    def test_invalidation(self):
+        """
+        Test query changes and mutations invalidate the response
+        """
+        self.selection.exist
+        self.selection.with_lb_id().exist
+        self.assertEqual(self.service.find_data.call_count, 2)
+        self.selection.update_with({'b': 1})
+        self.selection.exist
+        self.assertEqual(self.service.find_data.call_count, 3)
+        self.selection.add_raw_query({'field': 'b', 'op': '=', 'rvalue': 1})
+        self.selection.first
+        self.assertEqual(self.service.find_data.call_count, 4)
+
+    def test_mutation_isolated(self):
+        """
+        Test mutating a returned result does not change the memoized one
+        """
+        items = self.selection.all
+        items.pop(0)
+        self.selection.find(postprocess=lambda r: r['processed'].pop())
+        self.assertEqual(self.selection.first, {'a': 1})
+        self.assertEqual(self.selection.all, [{'a': 1}, {'a': 2}])
+        self.assertEqual(self.service.find_data.call_count, 1)
+
+    def test_refresh_projection(self):
+        """
+        Test clearing projection and update forgets the response
+        """
+        self.selection.exist
+        self.selection._refresh()
+        self.selection.exist
+        self.assertEqual(self.service.find_data.call_count, 2)
+
+    def test_failed_not_memoized(self):
+        """
+        Test failed find is repeated on the next access
+        """
+        self.service.find_data.return_value = None
+        self.assertFalse(self.selection.exist)
+        self.assertIsNone(self.selection.first)
+        self.assertEqual(self.service.find_data.call_count, 2)
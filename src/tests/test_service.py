@@ -1,6 +1,15 @@
+import time
 from unittest import TestCase
 import requests
 
+from requests.packages.urllib3.exceptions import ConnectTimeoutError, \
+    MaxRetryError, ReadTimeoutError
+from requests.packages.urllib3.response import HTTPResponse
+
+from lightblue.common import DeadlineExceeded, deadline
+from lightblue.hedging import HedgingPolicy
+from lightblue.limiter import LimitExceeded, RequestLimiter
+from lightblue.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
 from lightblue.service import LightBlueService
 
 try:
@@ -89,6 +98,7 @@ class TestLightBlueService(TestCase):
         """
         schema = {'key': 'value'}
         mock_get.return_value.json.return_value = schema
+        mock_get.return_value.status_code = 200
         result = self.service.get_schema('entity', 'version')
         self.assertEqual(result, schema)
 
@@ -114,6 +124,38 @@ class TestLightBlueService(TestCase):
         self.assertEqual(call_args[1], {'json': data})
         self.assertEqual(result, resp_data)
 
+    @patch('requests.Session.post')
+    def test_save_data(self, mock_post):
+        """
+        Test of saving data
+        """
+        data = {'data': ['object'], 'upsert': True}
+        resp_data = {
+            'status': 'COMPLETE',
+            'matchCount': 1,
+            'modifiedCount': 1,
+        }
+        mock_post.return_value.json.return_value = resp_data
+        mock_post.return_value.status_code = 200
+        result = self.service.save_data('entity', 'version', data)
+        call_args = mock_post.call_args
+        self.assertEqual(
+            call_args[0][0], '{}/save/entity/version'.format(self.data_url)
+        )
+        self.assertEqual(call_args[1], {'json': data})
+        self.assertEqual(result, resp_data)
+
+    @patch('requests.Session.post')
+    def test_save_data_fail_status(self, mock_post):
+        """
+        Test of saving data - error response
+        """
+        mock_post.return_value.json.return_value = {'status': 'ERROR'}
+        mock_post.return_value.status_code = 200
+        self.assertIsNone(self.service.save_data('entity', None, {}))
+        self.assertEqual(mock_post.call_args[0][0],
+                         '{}/save/entity'.format(self.data_url))
+
     @patch('requests.Session.put')
     def test_insert_data_failed_statusCode(self, mock_put):
         """
@@ -157,6 +199,29 @@ class TestLightBlueService(TestCase):
         self.assertEqual(call_args[1], {'json': data})
         self.assertIsNone(result)
 
+    @patch('requests.Session.put')
+    def test_insert_data_return_errors(self, mock_put):
+        """
+        Test of inserting data - error response with dataErrors returned
+        """
+        resp_data = {
+            'status': 'ERROR',
+            'dataErrors': [{'data': {'a': 1}, 'errors': []}],
+        }
+        mock_put.return_value.json.return_value = resp_data
+        mock_put.return_value.status_code = 200
+        data = {'data': [{'a': 1}]}
+        with patch('lightblue.service.LOGGER') as mock_logger:
+            result = self.service.insert_data(
+                'entity', 'version', data, return_errors=True)
+        self.assertEqual(result, resp_data)
+        # only count of the documents is logged, not the documents
+        self.assertEqual(mock_logger.error.call_args[0][1], 1)
+        mock_put.return_value.json.return_value = {'status': 'FAILED'}
+        mock_put.return_value.status_code = 500
+        self.assertIsNone(self.service.insert_data(
+            'entity', 'version', data, return_errors=True))
+
     @patch('requests.Session.post')
     def test_delete_data(self, mock_post):
         """
@@ -351,3 +416,278 @@ class TestLightBlueService(TestCase):
         )
         self.assertEqual(call_args[1], {'json': data})
         self.assertIsNone(result)
+
+    @patch('requests.Session.post')
+    def test_find_data_limiters(self, mock_post):
+        """
+        Test of finding data - service and operation limiters are used
+        """
+        limiter = Mock()
+        find_limiter = Mock()
+        insert_limiter = Mock()
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            limiter=limiter,
+            operation_limiters={
+                'find': find_limiter,
+                'insert': insert_limiter,
+            }
+        )
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        mock_post.return_value.status_code = 200
+        service.find_data('entity', 'version', 'object')
+        limiter.acquire.assert_called_once_with(timeout=None)
+        limiter.release.assert_called_once_with()
+        find_limiter.acquire.assert_called_once_with(timeout=None)
+        find_limiter.release.assert_called_once_with()
+        self.assertFalse(insert_limiter.acquire.called)
+
+    @patch('requests.Session.post')
+    def test_find_data_limit_exceeded(self, mock_post):
+        """
+        Test of finding data - request rejected by limiter
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            operation_limiters={
+                'find': RequestLimiter(max_in_flight=0, blocking=False),
+            }
+        )
+        with self.assertRaises(LimitExceeded):
+            service.find_data('entity', 'version', 'object')
+        self.assertFalse(mock_post.called)
+
+    @patch('requests.Session.post')
+    def test_find_data_operation_timeout(self, mock_post):
+        """
+        Test of finding data - operation timeout is passed to the session
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            timeout=10,
+            operation_timeouts={'find': (3.05, 27)},
+        )
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        mock_post.return_value.status_code = 200
+        service.find_data('entity', 'version', 'object')
+        self.assertEqual(mock_post.call_args[1]['timeout'], (3.05, 27))
+
+    @patch('requests.Session.post')
+    def test_find_data_deadline_timeout(self, mock_post):
+        """
+        Test of finding data - timeout is shortened by the deadline
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url, timeout=60)
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        mock_post.return_value.status_code = 200
+        with deadline(5):
+            service.find_data('entity', 'version', 'object')
+        self.assertLessEqual(mock_post.call_args[1]['timeout'], 5)
+
+    @patch('requests.Session.post')
+    def test_find_data_deadline_exceeded(self, mock_post):
+        """
+        Test of finding data - fail fast once the deadline has passed
+        """
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                self.service.find_data('entity', 'version', 'object')
+        self.assertFalse(mock_post.called)
+
+    def test_timeout_expired_deadline(self):
+        """
+        Test of request timeout - expired deadline raises instead of
+        returning zero timeout
+        """
+        active = Mock()
+        active.check.side_effect = DeadlineExceeded('Deadline exceeded')
+        with self.assertRaises(DeadlineExceeded):
+            self.service._timeout('find', active)
+        active = Mock()
+        active.remaining.return_value = 0.0
+        self.assertGreater(self.service._timeout('find', active), 0)
+
+    @patch('requests.Session.post')
+    def test_find_data_hedged(self, mock_post):
+        """
+        Test of finding data - hedging policy sends the request
+        """
+        hedging = Mock()
+        hedging.applies_to.return_value = True
+        hedging.execute.side_effect = \
+            lambda operation, send, hedge_send: send()
+        service = LightBlueService(
+            self.data_url, self.metadata_url, hedging=hedging)
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        mock_post.return_value.status_code = 200
+        service.find_data('entity', 'version', 'object')
+        self.assertEqual(hedging.execute.call_args[0][0], 'find')
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('requests.Session.post')
+    def test_find_data_endpoints(self, mock_post):
+        """
+        Test of finding data - requests are spread over endpoints
+        """
+        service = LightBlueService(
+            ['http://lb1/rest/data/', 'http://lb2/rest/data'],
+            ['http://lb1/rest/metadata', 'http://lb2/rest/metadata'],
+        )
+        self.assertEqual(service.data_url, 'http://lb1/rest/data')
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        mock_post.return_value.status_code = 200
+        service.find_data('entity', None, 'object')
+        service.find_data('entity', None, 'object')
+        self.assertEqual(
+            [args[0][0] for args in mock_post.call_args_list],
+            ['http://lb1/rest/data/find/entity',
+             'http://lb2/rest/data/find/entity'])
+
+    @patch('requests.Session.post')
+    def test_find_data_endpoint_ejected(self, mock_post):
+        """
+        Test of finding data - endpoint returning 5xx is ejected
+        """
+        service = LightBlueService(
+            ['http://lb1/rest/data', 'http://lb2/rest/data'],
+            ['http://lb1/rest/metadata', 'http://lb2/rest/metadata'],
+        )
+        service.endpoints.max_failures = 1
+        mock_post.return_value.json.return_value = {'status': 'ERROR'}
+        mock_post.return_value.status_code = 503
+        service.find_data('entity', None, 'object')
+        mock_post.return_value.status_code = 200
+        for _ in range(3):
+            service.find_data('entity', None, 'object')
+        self.assertEqual(
+            [args[0][0] for args in mock_post.call_args_list[1:]],
+            ['http://lb2/rest/data/find/entity'] * 3)
+
+    def test_endpoints_mismatch(self):
+        """
+        Test data and metadata urls have to be paired
+        """
+        with self.assertRaises(ValueError):
+            LightBlueService(['http://lb1/data', 'http://lb2/data'],
+                             'http://lb1/metadata')
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_find_data_retry_policy(self, mock_post, mock_sleep):
+        """
+        Test of finding data - 503 response is retried by the policy
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            retry_policy=RetryPolicy(max_attempts=3),
+        )
+        failed = Mock(status_code=503, headers={'Retry-After': '1'})
+        succeeded = Mock(status_code=200)
+        succeeded.json.return_value = {'status': 'COMPLETE'}
+        mock_post.side_effect = [failed, succeeded]
+        result = service.find_data('entity', 'version', 'object')
+        self.assertEqual(result, {'status': 'COMPLETE'})
+        mock_sleep.assert_called_once_with(1)
+        failed.close.assert_called_once_with()
+
+    @patch('time.sleep')
+    @patch('requests.Session.put')
+    def test_insert_data_not_retried(self, mock_put, mock_sleep):
+        """
+        Test of inserting data - writes are not retried by default
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            retry_policy=RetryPolicy(max_attempts=3),
+        )
+        mock_put.return_value.status_code = 503
+        mock_put.return_value.json.return_value = {'status': 'ERROR'}
+        self.assertIsNone(service.insert_data('entity', 'version', 'x'))
+        self.assertEqual(mock_put.call_count, 1)
+        self.assertFalse(mock_sleep.called)
+
+    def test_insert_read_timeout_not_retried(self):
+        """
+        Test of inserting data - adapter does not retry read timeouts
+        when the retry policy owns retries
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            retry_policy=RetryPolicy(max_attempts=3),
+        )
+        retry = service.session.get_adapter('https://lb').max_retries
+        self.assertFalse(retry.status_forcelist)
+        with self.assertRaises(MaxRetryError):
+            retry.increment(
+                method='PUT', url='/insert/entity',
+                error=ReadTimeoutError(None, '/insert/entity', 'timeout'))
+        # connection errors (request not sent) are still retried
+        retry.increment(method='PUT', url='/insert/entity',
+                        error=ConnectTimeoutError('timeout'))
+
+    @patch('time.sleep')
+    @patch('urllib3.connectionpool.HTTPConnectionPool._make_request')
+    def test_exhausted_retries_eject_endpoint(self, mock_request, _):
+        """
+        Test of inserting data - 5xx retried by the session until retries
+        run out count as endpoint failures
+        """
+        mock_request.side_effect = lambda *args, **kwargs: HTTPResponse(
+            body=b'', status=500, preload_content=False)
+        service = LightBlueService(
+            ['http://lb1/data', 'http://lb2/data'],
+            ['http://lb1/metadata', 'http://lb2/metadata'])
+        for _ in range(6):
+            with self.assertRaises(requests.exceptions.RetryError):
+                service.insert_data('entity', 'version', 'x')
+        for endpoint in service.endpoints.endpoints:
+            self.assertEqual(endpoint.failures, 3)
+            self.assertIsNotNone(endpoint.ejected_until)
+
+    @patch('requests.Session.post')
+    def test_find_data_hedge_limited(self, mock_post):
+        """
+        Test of finding data - hedges count against max in-flight
+        """
+        limiter = RequestLimiter(max_in_flight=1)
+        hedging = HedgingPolicy(initial_delay=0.01, max_extra_load=1)
+        self.addCleanup(hedging.shutdown)
+        service = LightBlueService(
+            self.data_url, self.metadata_url, limiter=limiter,
+            hedging=hedging)
+        in_flight = []
+
+        def post(*args, **kwargs):
+            in_flight.append(limiter.in_flight)
+            # answer once the hedge was rejected by the limiter
+            for _ in range(500):
+                if limiter.stats['rejected']:
+                    break
+                time.sleep(0.01)
+            return mock_post.return_value
+
+        mock_post.side_effect = post
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        service.find_data('entity', 'version', 'object')
+        self.assertEqual(hedging.stats['hedged'], 1)
+        self.assertEqual(in_flight, [1])
+        self.assertEqual(limiter.stats['rejected'], 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    @patch('requests.Session.post')
+    def test_find_data_circuit_open(self, mock_post):
+        """
+        Test of finding data - open circuit fails fast
+        """
+        service = LightBlueService(
+            self.data_url, self.metadata_url,
+            circuit_breaker=CircuitBreaker(failure_threshold=1),
+        )
+        mock_post.return_value.json.return_value = {'status': 'ERROR'}
+        mock_post.return_value.status_code = 500
+        service.find_data('entity', 'version', 'object')
+        with self.assertRaises(CircuitOpenError):
+            service.find_data('entity', 'version', 'object')
+        self.assertEqual(mock_post.call_count, 1)
@@ -0,0 +1,133 @@
+import threading
+from unittest import TestCase
+
+from lightblue.service import LightBlueService
+from lightblue.sessions import SessionPool, SessionPoolTimeout, \
+    session_provider
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+
+class TestSessions(TestCase):
+    """
+    Test cases for session strategies
+    """
+    test_docstring_prefix = "Session strategies - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def test_shared(self):
+        """
+        Test shared session and contention of concurrent checkouts
+        """
+        provider = session_provider('shared', Mock, session='session')
+        with provider.checkout() as first:
+            with provider.checkout() as second:
+                self.assertEqual(first, 'session')
+                self.assertEqual(second, 'session')
+        stats = provider.stats
+        self.assertEqual(stats['sessions'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['contended'], 1)
+        self.assertEqual(stats['max_in_use'], 2)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_per_thread(self):
+        """
+        Test each thread gets its own session
+        """
+        provider = session_provider('per_thread', Mock)
+        sessions = []
+        used = threading.Semaphore(0)
+        finish = threading.Event()
+
+        def use():
+            for _ in range(2):
+                with provider.checkout() as session:
+                    sessions.append(session)
+            used.release()
+            finish.wait()
+
+        threads = [threading.Thread(target=use) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            used.acquire()
+        self.assertEqual(provider.stats['sessions'], 3)
+        finish.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(sessions), 6)
+        self.assertEqual(len(set(map(id, sessions))), 3)
+
+    def test_per_thread_cleanup(self):
+        """
+        Test sessions of exited threads are closed and close() resets
+        sessions of live threads
+        """
+        provider = session_provider('per_thread', Mock)
+        sessions = []
+
+        def use():
+            with provider.checkout() as session:
+                sessions.append(session)
+
+        thread = threading.Thread(target=use)
+        thread.start()
+        thread.join()
+        with provider.checkout() as session:
+            self.assertTrue(sessions[0].close.called)
+            self.assertEqual(provider.sessions, [session])
+        provider.close()
+        self.assertTrue(session.close.called)
+        self.assertEqual(provider.sessions, [])
+        with provider.checkout() as new_session:
+            self.assertIsNot(new_session, session)
+
+    def test_pool(self):
+        """
+        Test pool reuses sessions and times out when exhausted
+        """
+        pool = SessionPool(object, size=1, timeout=0.01)
+        with pool.checkout() as first:
+            with self.assertRaises(SessionPoolTimeout):
+                with pool.checkout():
+                    pass
+        with pool.checkout() as second:
+            self.assertIs(first, second)
+        stats = pool.stats
+        self.assertEqual(stats['sessions'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertGreater(stats['wait_time'], 0)
+
+    def test_unknown(self):
+        """
+        Test unknown strategy is rejected
+        """
+        with self.assertRaises(ValueError):
+            session_provider('other', object)
+        with self.assertRaises(ValueError):
+            LightBlueService('http://lb/data', 'http://lb/metadata',
+                             custom_session=Mock(), session_strategy='pool')
+
+    @patch('requests.Session.post')
+    def test_service(self, mock_post):
+        """
+        Test service sends requests through configured sessions
+        """
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE'}
+        service = LightBlueService(
+            'http://lb/data', 'http://lb/metadata', ssl_verify=False,
+            session_strategy='pool', session_pool_size=2)
+        service.find_data('entity', None, {})
+        session = service.sessions.sessions[0]
+        self.assertIsNot(session, service.session)
+        self.assertFalse(session.verify)
+        self.assertEqual(service.sessions.stats['checkouts'], 1)
@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+from lightblue.service import LightBlueService
+from lightblue.slowlog import SlowQueryLog, query_shape
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+
+class TestSlowQueryLog(TestCase):
+    """
+    Test cases for SlowQueryLog class
+    """
+    test_docstring_prefix = "Slow query log - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.log = SlowQueryLog(latency_threshold=1, size_threshold=100)
+        self.response = Mock(content=b'x' * 10)
+
+    @staticmethod
+    def request(value):
+        return {
+            'objectType': 'entity',
+            'query': {'$and': [
+                {'field': 'name', 'op': '=', 'rvalue': value},
+                {'field': 'tags', 'op': '$in', 'values': [value]},
+            ]},
+            'projection': [{'field': 'name', 'include': True}],
+        }
+
+    def test_query_shape(self):
+        """
+        Test values are stripped from the query
+        """
+        self.assertEqual(query_shape(self.request('secret')['query']), {
+            '$and': [
+                {'field': 'name', 'op': '=', 'rvalue': '?'},
+                {'field': 'tags', 'op': '$in', 'values': '?'},
+            ]
+        })
+
+    def test_fast_query_ignored(self):
+        """
+        Test queries under thresholds are not recorded
+        """
+        self.assertIsNone(self.log.observe(
+            'find', 'entity', self.request('a'), self.response, {}, 0.5))
+        self.assertIsNone(self.log.observe(
+            'insert', 'entity', self.request('a'), self.response, {}, 5))
+        self.assertEqual(len(self.log.entries), 0)
+
+    def test_slow_query_aggregated(self):
+        """
+        Test slow queries are recorded and aggregated by shape
+        """
+        self.log.observe('find', 'entity', self.request('a'), self.response,
+                         {'matchCount': 3}, 2)
+        big = Mock(content=b'x' * 200)
+        entry = self.log.observe('find', 'entity', self.request('b'), big,
+                                 {'matchCount': 7}, 0.1)
+        self.assertEqual(entry['matchCount'], 7)
+        self.assertEqual(entry['bytes'], 200)
+        self.assertNotIn('secret', str(entry))
+        summary = self.log.summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['count'], 2)
+        self.assertEqual(summary[0]['total_bytes'], 210)
+        self.assertEqual(summary[0]['max_duration'], 2)
+
+    @patch('requests.Session.post')
+    def test_service_records(self, mock_post):
+        """
+        Test service records slow finds
+        """
+        self.log.latency_threshold = 0
+        service = LightBlueService('http://lb/data', 'http://lb/metadata',
+                                   slow_query_log=self.log)
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.content = b'{}'
+        mock_post.return_value.json.return_value = {'status': 'COMPLETE',
+                                                    'matchCount': 0}
+        service.find_data('entity', None, self.request('a'))
+        self.assertEqual(self.log.entries[0]['entity'], 'entity')
+        self.assertEqual(self.log.entries[0]['operation'], 'find')
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.sync import FileWatermarkStore, SyncError
+from . import FakeLightblueService
+
+
+class TestIncrementalSync(TestCase):
+    """
+    Test cases for IncrementalSync class
+    """
+    test_docstring_prefix = "Incremental sync - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.service = FakeLightblueService()
+        self.entity = LightBlueEntity(self.service, 'entity', '1.0.0')
+        self.handled = []
+
+    @staticmethod
+    def _response(*documents):
+        return {
+            'status': 'COMPLETE',
+            'matchCount': len(documents),
+            'processed': list(documents),
+        }
+
+    def test_poll_pages(self):
+        """
+        Test changes are fetched by keyset pages and watermark is saved
+        """
+        self.service.find_data.side_effect = [
+            self._response({'_id': 'a', 'ts': '1'}, {'_id': 'b', 'ts': '1'}),
+            self._response({'_id': 'c', 'ts': '2'}),
+        ]
+        sync = self.entity.incremental_sync(
+            self.handled.append, timestamp_field='ts', page_size=2)
+        self.assertEqual(sync.poll(), 3)
+        self.assertEqual([doc['_id'] for doc in self.handled],
+                         ['a', 'b', 'c'])
+        self.assertEqual(sync.store.load(), {'timestamp': '2', 'id': 'c'})
+        first, second = [call[0][2] for call
+                         in self.service.find_data.call_args_list]
+        self.assertEqual(first['query']['field'], 'objectType')
+        self.assertEqual(first['sort'], [{'ts': '$asc'}, {'_id': '$asc'}])
+        self.assertEqual(first['maxResults'], 2)
+        self.assertEqual(second['query'], {'$or': [
+            {'field': 'ts', 'op': '>', 'rvalue': '1'},
+            {'$and': [
+                {'field': 'ts', 'op': '=', 'rvalue': '1'},
+                {'field': '_id', 'op': '>', 'rvalue': 'b'},
+            ]},
+        ]})
+
+    def test_poll_failed(self):
+        """
+        Test failed find raises SyncError and keeps the watermark
+        """
+        self.service.find_data.return_value = None
+        sync = self.entity.incremental_sync(self.handled.append)
+        with self.assertRaises(SyncError):
+            sync.poll()
+        self.assertIsNone(sync.store.load())
+
+    def test_adaptive_interval(self):
+        """
+        Test poll interval backs off without changes
+        """
+        sync = self.entity.incremental_sync(
+            self.handled.append, min_interval=1, max_interval=5)
+        self.assertEqual(sync._next_interval(0), 2)
+        self.assertEqual(sync._next_interval(0), 4)
+        self.assertEqual(sync._next_interval(0), 5)
+        self.assertEqual(sync._next_interval(3), 1)
+
+    def test_file_store(self):
+        """
+        Test watermark is persisted to a file
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = FileWatermarkStore(os.path.join(directory, 'watermark'))
+        self.assertIsNone(store.load())
+        store.save({'timestamp': '1', 'id': 'a'})
+        self.assertEqual(store.load(), {'timestamp': '1', 'id': 'a'})
+        self.assertEqual(os.listdir(directory), ['watermark'])
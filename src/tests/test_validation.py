@@ -0,0 +1,121 @@
+from unittest import TestCase
+
+from lightblue.validation import SchemaValidator
+
+METADATA = {
+    'entityInfo': {
+        'name': 'person',
+        'enums': [{'name': 'states', 'values': ['active', 'retired']}],
+    },
+    'schema': {
+        'name': 'person',
+        'version': {'value': '1.0.0'},
+        'fields': {
+            '_id': {'type': 'string'},
+            'objectType': {
+                'type': 'string',
+                'constraints': {'required': True},
+            },
+            'uid': {'type': 'uid', 'constraints': {'required': True}},
+            'name': {
+                'type': 'string',
+                'constraints': {'required': True, 'maxLength': 5},
+            },
+            'age': {'type': 'integer', 'constraints': {'minimum': 0}},
+            'state': {'type': 'string', 'constraints': {'enum': 'states'}},
+            'address': {
+                'type': 'object',
+                'fields': {
+                    'city': {
+                        'type': 'string',
+                        'constraints': {'required': True},
+                    },
+                },
+            },
+            'tags': {
+                'type': 'array',
+                'constraints': {'maxItems': 2},
+                'items': {'type': 'string'},
+            },
+        },
+    },
+}
+
+
+class TestSchemaValidator(TestCase):
+    """
+    Test cases for SchemaValidator class
+    """
+    test_docstring_prefix = "Schema validator - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.validator = SchemaValidator(METADATA)
+
+    def test_valid_document(self):
+        """
+        Test valid document has no errors
+        """
+        document = {
+            'name': 'Ann',
+            'age': 30,
+            'state': 'active',
+            'address': {'city': 'Brno'},
+            'tags': ['a', 'b'],
+        }
+        self.assertEqual(self.validator.validate(document), [])
+        self.assertEqual(self.validator.version, '1.0.0')
+
+    def test_invalid_document(self):
+        """
+        Test types, constraints and required fields are checked
+        """
+        document = {
+            'age': True,
+            'state': 'unknown',
+            'address': {},
+            'tags': ['a', 1, 'c'],
+            'extra': 1,
+        }
+        self.assertEqual(sorted(self.validator.validate(document)), [
+            'address.city: required field is missing',
+            'age: expected integer, got bool',
+            'extra: unknown field',
+            'name: required field is missing',
+            'state: not in enum states',
+            'tags.1: expected string, got int',
+            'tags: more than 2 items',
+        ])
+
+    def test_split(self):
+        """
+        Test documents are split into valid and invalid ones
+        """
+        valid, invalid = self.validator.split([
+            {'name': 'Ann'}, {'name': 'Too long'}])
+        self.assertEqual(valid, [{'name': 'Ann'}])
+        self.assertEqual(invalid, [
+            ({'name': 'Too long'}, ['name: longer than 5'])])
+
+    def test_validate_update(self):
+        """
+        Test $set/$unset/$append paths are checked
+        """
+        self.assertEqual(self.validator.validate_update({
+            '$set': {'address.city': 'Brno', 'tags.0': 'x', 'age': 1},
+            '$append': {'tags': ['y']},
+        }), [])
+        self.assertEqual(sorted(self.validator.validate_update({
+            '$set': {'address.zip': 1, 'age': -1},
+            '$unset': ['name'],
+            '$append': {'name': 'x'},
+        })), [
+            'address.zip: unknown field',
+            'age: less than 0',
+            'name: not an array field',
+            'name: required field cannot be unset',
+        ])
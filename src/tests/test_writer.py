@@ -0,0 +1,146 @@
+from unittest import TestCase
+
+from lightblue.entity import LightBlueEntity
+from lightblue.writer import BufferFull, WriteError, WriterClosed
+from . import FakeLightblueService
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+
+class TestBufferedWriter(TestCase):
+    """
+    Test cases for BufferedWriter class
+    """
+    test_docstring_prefix = "Buffered writer - "
+
+    def shortDescription(self):  # noqa
+        """Override nosetest docstrings."""
+        doc = self.test_docstring_prefix + self._testMethodDoc
+        return doc or None
+
+    def setUp(self):
+        self.service = FakeLightblueService()
+        self.entity = LightBlueEntity(self.service, 'entity', '1.0.0')
+
+    def test_batched_inserts(self):
+        """
+        Test inserts are sent in batches with per-item results
+        """
+        def insert_data(entity, version, data, return_errors=False):
+            return {
+                'status': 'PARTIAL',
+                'processed': [doc for doc in data['data'] if doc['id'] != 2],
+                'dataErrors': [{'data': doc,
+                                'errors': [{'errorCode': 'duplicate'}]}
+                               for doc in data['data'] if doc['id'] == 2],
+            }
+
+        self.service.insert_data.side_effect = insert_data
+        with self.entity.buffered_writer(max_items=2, max_delay=10) as writer:
+            futures = [writer.insert({'id': index}) for index in range(3)]
+        self.assertEqual(self.service.insert_data.call_count, 2)
+        self.assertEqual(futures[0].result(), {'id': 0})
+        self.assertEqual(futures[1].result(), {'id': 1})
+        with self.assertRaises(WriteError) as context:
+            futures[2].result()
+        self.assertEqual(context.exception.errors,
+                         [{'errorCode': 'duplicate'}])
+
+    def test_time_threshold(self):
+        """
+        Test buffer is flushed after max delay
+        """
+        self.service.insert_data.return_value = {'status': 'COMPLETE'}
+        writer = self.entity.buffered_writer(max_delay=0.01)
+        future = writer.insert({'id': 1})
+        self.assertIsNone(future.result(timeout=5))
+        writer.close()
+
+    def test_merged_updates(self):
+        """
+        Test $set updates of the same query are merged
+        """
+        self.service.update_data.return_value = {'status': 'COMPLETE'}
+        writer = self.entity.buffered_writer(max_delay=10)
+        first = writer.update({'field': 'id', 'op': '=', 'rvalue': 1},
+                              {'a': 1, 'b': 1})
+        second = writer.update({'field': 'id', 'op': '=', 'rvalue': 1},
+                               {'b': 2})
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(first.result(), {'status': 'COMPLETE'})
+        self.assertEqual(second.result(), {'status': 'COMPLETE'})
+        self.service.update_data.assert_called_once()
+        sent = self.service.update_data.call_args[0][2]
+        self.assertEqual(sent['update'], {'$set': {'a': 1, 'b': 2}})
+        writer.close()
+        with self.assertRaises(WriterClosed):
+            writer.insert({'id': 1})
+
+    def test_failed_request(self):
+        """
+        Test futures fail when the request fails
+        """
+        self.service.insert_data.return_value = None
+        with self.entity.buffered_writer() as writer:
+            future = writer.insert({'id': 1})
+        with self.assertRaises(WriteError):
+            future.result()
+
+    def test_rejected_batch(self):
+        """
+        Test fully rejected batch and unmatched errors fail documents with
+        their own errors, never shifted results
+        """
+        self.service.insert_data.side_effect = [{
+            'status': 'ERROR',
+            'dataErrors': [{'data': {'id': 1}, 'errors': ['invalid 1']},
+                           {'data': {'id': 2}, 'errors': ['invalid 2']}],
+        }, {
+            'status': 'PARTIAL',
+            'processed': [{'id': 4, '_id': 'x'}],
+            'dataErrors': [{'data': {'id': 3, 'extra': 1},
+                            'errors': ['invalid 3']}],
+        }]
+        with self.entity.buffered_writer(max_items=2, max_delay=10) as writer:
+            futures = [writer.insert({'id': index}) for index in range(1, 5)]
+        self.assertTrue(
+            self.service.insert_data.call_args[1]['return_errors'])
+        for future, errors in zip(futures, ['invalid 1', 'invalid 2']):
+            with self.assertRaises(WriteError) as context:
+                future.result()
+            self.assertEqual(context.exception.errors, [errors])
+        for future in futures[2:]:
+            with self.assertRaises(WriteError):
+                future.result()
+
+    def test_flush_error(self):
+        """
+        Test futures fail when the flush thread hits an unexpected error
+        """
+        writer = self.entity.buffered_writer(max_delay=10)
+        writer._send_inserts = Mock(side_effect=[RuntimeError('bug'), None])
+        future = writer.insert({'id': 1})
+        with patch('lightblue.writer.LOGGER'):
+            self.assertTrue(writer.flush(timeout=5))
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=5)
+        self.service.update_data.return_value = {'status': 'COMPLETE'}
+        update = writer.update({'field': 'id', 'op': '=', 'rvalue': 1},
+                               {'a': 1})
+        writer.close()
+        self.assertEqual(update.result(timeout=5), {'status': 'COMPLETE'})
+
+    def test_backpressure(self):
+        """
+        Test non-blocking writer rejects items when the buffer is full
+        """
+        writer = self.entity.buffered_writer(
+            max_pending=1, max_delay=10, block=False)
+        self.service.insert_data.return_value = {'status': 'COMPLETE'}
+        writer.insert({'id': 1})
+        with self.assertRaises(BufferFull):
+            writer.insert({'id': 2})
+        writer.close()